@@ -0,0 +1,380 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import types
+
+import monitor
+from simulator_backend import SimulatorState
+from throughput import ThroughputMonitor
+from vitals import SystemVitals, format_vitals
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "bench_baseline.json")
+DEFAULT_THRESHOLD = 1.5
+MIN_ITERATIONS = 5
+MAX_ITERATIONS = 2000
+TARGET_SECONDS = 0.25
+SOAK_WARMUP_FRAMES = 1000
+SOAK_SAMPLE_EVERY = 1000
+SOAK_RSS_GROWTH_KIB = 1024
+
+
+class FakeSpiDev:
+    def __init__(self, bus=0, device=0):
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.bytes_sent = 0
+        self.transfers = 0
+
+    def writebytes(self, data):
+        self.bytes_sent += len(data)
+        self.transfers += 1
+
+    writebytes2 = writebytes
+
+    def close(self):
+        return
+
+
+class FakeSMBus:
+    # Answers GT1151 register reads: one touch point at (60, 120).
+    REGISTERS = {
+        0x8140: [0x39, 0x31, 0x35, 0x31],
+        0x814E: [0x81],
+        0x814F: [0x00, 0x3C, 0x00, 0x78, 0x00, 0x18, 0x00, 0x00],
+    }
+
+    def __init__(self, bus=1):
+        self.bytes_moved = 0
+        self._pending = []
+
+    def write_byte_data(self, address, reg_high, reg_low):
+        self.bytes_moved += 2
+        self._pending = list(self.REGISTERS.get((reg_high << 8) | reg_low, []))
+
+    def write_word_data(self, address, reg_high, word):
+        self.bytes_moved += 3
+
+    def read_byte(self, address):
+        self.bytes_moved += 1
+        return self._pending.pop(0) if self._pending else 0
+
+    def close(self):
+        return
+
+
+class FakePin:
+    def __init__(self, pin, pull_up=None):
+        self.pin = pin
+        self.value = 0
+        self.when_deactivated = None
+
+    def on(self):
+        self.value = 1
+
+    def off(self):
+        self.value = 0
+
+    def close(self):
+        return
+
+
+def install_fake_hardware():
+    # Always fake the bus modules, even on a Pi: benchmarks must not touch
+    # the panel.
+    spidev = types.ModuleType("spidev")
+    spidev.SpiDev = FakeSpiDev
+    smbus = types.ModuleType("smbus")
+    smbus.SMBus = FakeSMBus
+    gpiozero = types.ModuleType("gpiozero")
+    gpiozero.LED = FakePin
+    gpiozero.Button = FakePin
+    sys.modules.update({"spidev": spidev, "smbus": smbus, "gpiozero": gpiozero})
+
+    from TP_lib import epdconfig
+
+    delays = {"ms": 0.0}
+
+    def delay_ms(delaytime):
+        delays["ms"] += delaytime
+
+    epdconfig.delay_ms = delay_ms
+    return epdconfig, delays
+
+
+class Bench:
+    def __init__(self, name, run, bus=None, delays=None):
+        self.name = name
+        self.run = run
+        self.bus = bus
+        self.delays = delays
+
+    def measure(self):
+        self.run()
+        iterations = 0
+        samples = []
+        started = time.perf_counter()
+        while iterations < MIN_ITERATIONS or (
+            iterations < MAX_ITERATIONS and time.perf_counter() - started < TARGET_SECONDS
+        ):
+            t0 = time.perf_counter_ns()
+            self.run()
+            samples.append(time.perf_counter_ns() - t0)
+            iterations += 1
+
+        bus_before = self.bus() if self.bus else 0
+        delay_before = self.delays["ms"] if self.delays else 0.0
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = self.run()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocs = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+        del result
+
+        samples.sort()
+        return {
+            "iterations": iterations,
+            "median_us": samples[len(samples) // 2] / 1000,
+            "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] / 1000,
+            "allocs": allocs,
+            "peak_kib": peak / 1024,
+            "bus_bytes": (self.bus() - bus_before) if self.bus else None,
+            "delay_ms": (self.delays["ms"] - delay_before) if self.delays else None,
+        }
+
+
+def build_benches():
+    epdconfig, delays = install_fake_hardware()
+    from TP_lib import epd2in13_V4, gt1151
+
+    sample_vitals = {
+        "cpu_percent": 12.0,
+        "load": (0.42, 0.31, 0.2),
+        "mem_total_kib": 948000,
+        "mem_available_kib": 512000,
+        "temperature_c": 51.5,
+        "uptime_seconds": 93784,
+    }
+    monitor.configure_providers(
+        ipv4=lambda: [(f"eth{i}", f"192.168.{i}.20") for i in range(8)],
+        wifi=lambda: [("wlan0", "bench-network")],
+        vitals=lambda: format_vitals(sample_vitals),
+    )
+    fonts = (monitor.load_font(14), monitor.load_font(12), monitor.load_font(10))
+
+    epd = epd2in13_V4.EPD()
+    epd.init(epd.FULL_UPDATE)
+    landscape = monitor.build_frame(monitor.IP_PAGE_INDEX, *fonts)
+    portrait = landscape.rotate(90, expand=True)
+    buffer = epd.getbuffer(landscape)
+    next_buffer = epd.getbuffer(monitor.build_frame(monitor.CLOCK_PAGE_INDEX, *fonts))
+
+    def spi_bytes():
+        return epdconfig.spi.bytes_sent
+
+    def i2c_bytes():
+        return epdconfig.bus.bytes_moved
+
+    benches = []
+    for page, title in enumerate(monitor.PAGES):
+        name = "build_frame." + title.lower().replace(" ", "_").replace("-", "")
+        benches.append(Bench(name, lambda page=page: monitor.build_frame(page, *fonts)))
+
+    pool = monitor.FramePool(monitor.DISPLAY_WIDTH, monitor.DISPLAY_HEIGHT, epd.width, epd.height)
+    canvas, pool_buffer = pool.acquire(None)
+    window = monitor.panel_dirty_window(buffer, next_buffer, epd.width, epd.height)
+    benches += [
+        Bench("getbuffer.landscape", lambda: epd.getbuffer(landscape)),
+        Bench("getbuffer.portrait", lambda: epd.getbuffer(portrait)),
+        Bench("frame_pool.build_and_pack", lambda: monitor.pack_frame(
+            monitor.build_frame(monitor.IP_PAGE_INDEX, *fonts, canvas=canvas), pool_buffer
+        )),
+        Bench("panel_dirty_window", lambda: monitor.panel_dirty_window(buffer, next_buffer, epd.width, epd.height)),
+        Bench("epd.displayPartBaseImage", lambda: epd.displayPartBaseImage(buffer), spi_bytes, delays),
+        Bench("epd.Clear", lambda: epd.Clear(0xFF), spi_bytes, delays),
+        Bench("epd.displayPartial_Wait", lambda: epd.displayPartial_Wait(buffer), spi_bytes, delays),
+        Bench("epd.displayPartial_Window", lambda: epd.displayPartial_Window(next_buffer, *window), spi_bytes, delays),
+    ]
+
+    gt = gt1151.GT1151()
+    gt_dev = gt1151.GT_Development()
+    gt_old = gt1151.GT_Development()
+
+    def scan():
+        gt_dev.Touch = 1
+        gt.GT_Scan(gt_dev, gt_old)
+
+    benches.append(Bench("gt.GT_Scan", scan, i2c_bytes, delays))
+
+    state = SimulatorState(monitor.DISPLAY_WIDTH, monitor.DISPLAY_HEIGHT, monitor.UP_BUTTON, monitor.DOWN_BUTTON)
+    benches.append(Bench("simulator.encode_png", lambda: state._encode_png(landscape)))
+
+    benches.append(Bench("providers.ipv4", monitor.get_non_loopback_ipv4))
+    benches.append(Bench("providers.wifi", monitor.get_connected_wifi_networks))
+    try:
+        reader = SystemVitals()
+        benches.append(Bench("providers.vitals", reader.sample))
+    except OSError:
+        pass
+    throughput = ThroughputMonitor(monitor.interface_selected)
+    clock = {"now": 0.0}
+
+    def sample_throughput():
+        clock["now"] += 5.0
+        throughput.sample(clock["now"])
+
+    benches.append(Bench("providers.throughput", sample_throughput))
+    return benches
+
+
+def rss_kib():
+    with open("/proc/self/statm", "r", encoding="ascii") as handle:
+        return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def soak(frames):
+    # Drives the redraw path (pooled build, pack, dirty window, partial
+    # window transfer) through the real driver and checks RSS stays flat.
+    install_fake_hardware()
+    from TP_lib import epd2in13_V4
+
+    monitor.configure_providers(
+        ipv4=lambda: [("eth0", "192.168.1.20")],
+        wifi=lambda: [("wlan0", "bench-network")],
+        vitals=lambda: [],
+    )
+    fonts = (monitor.load_font(14), monitor.load_font(12), monitor.load_font(10))
+    epd = epd2in13_V4.EPD()
+    epd.init(epd.FULL_UPDATE)
+    pool = monitor.FramePool(monitor.DISPLAY_WIDTH, monitor.DISPLAY_HEIGHT, epd.width, epd.height)
+    last_buffer = None
+    baseline_kib = None
+    samples = []
+    now = datetime.datetime.now()
+    started = time.perf_counter()
+    for frame in range(frames):
+        canvas, buffer = pool.acquire(last_buffer)
+        page = monitor.CLOCK_PAGE_INDEX if frame % 4 else frame // 4 % len(monitor.PAGES)
+        monitor.build_frame(page, *fonts, canvas=canvas, now=now + datetime.timedelta(seconds=frame))
+        monitor.pack_frame(canvas[0], buffer)
+        window = monitor.panel_dirty_window(last_buffer, buffer, epd.width, epd.height)
+        if window is not None:
+            epd.displayPartial_Window(buffer, *window)
+            last_buffer = buffer
+        if frame + 1 == SOAK_WARMUP_FRAMES:
+            baseline_kib = rss_kib()
+        elif baseline_kib is not None and (frame + 1) % SOAK_SAMPLE_EVERY == 0:
+            samples.append(rss_kib())
+            print(f"frame {frame + 1:7d}  rss {samples[-1]:7d} KiB  ({samples[-1] - baseline_kib:+d})", flush=True)
+
+    elapsed = time.perf_counter() - started
+    if baseline_kib is None or not samples:
+        print(f"--soak needs more than {SOAK_WARMUP_FRAMES + SOAK_SAMPLE_EVERY} frames")
+        return 2
+    growth = max(samples) - baseline_kib
+    print(f"{frames} frames in {elapsed:.1f}s ({elapsed / frames * 1000:.2f} ms/frame); RSS growth {growth:+d} KiB")
+    if growth > SOAK_RSS_GROWTH_KIB:
+        print(f"RSS grew more than {SOAK_RSS_GROWTH_KIB} KiB after warmup")
+        return 1
+    return 0
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            return json.load(handle).get("ops", {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    data = {
+        "machine": f"{platform.machine()} {platform.python_implementation()} {platform.python_version()}",
+        "ops": {
+            name: {"median_us": round(result["median_us"], 1), "allocs": result["allocs"], "bus_bytes": result["bus_bytes"]}
+            for name, result in results.items()
+        },
+    }
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def regressions(name, result, baseline, threshold):
+    found = []
+    if result["median_us"] > baseline["median_us"] * threshold:
+        found.append(f"time {result['median_us']:.1f}us > {threshold:.2f}x {baseline['median_us']:.1f}us")
+    if baseline.get("bus_bytes") is not None and (result["bus_bytes"] or 0) > baseline["bus_bytes"]:
+        # Bus traffic is deterministic: any growth is a regression.
+        found.append(f"bus bytes {result['bus_bytes']} > {baseline['bus_bytes']}")
+    return found
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the render and display hot paths")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: bench_baseline.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"flag ops slower than this multiple of the baseline median (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--soak",
+        type=int,
+        metavar="FRAMES",
+        help="instead of timing, render and send this many frames and fail if RSS grows",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.soak is not None:
+        return soak(args.soak)
+    baseline = load_baseline(args.baseline)
+    results = {}
+    failures = []
+
+    print(f"{'operation':32} {'median us':>10} {'p95 us':>10} {'allocs':>7} {'peak KiB':>9} {'bus B':>7} {'delay ms':>9}")
+    for bench in build_benches():
+        if args.filter not in bench.name:
+            continue
+        result = bench.measure()
+        results[bench.name] = result
+        bus = "-" if result["bus_bytes"] is None else str(result["bus_bytes"])
+        delay = "-" if result["delay_ms"] is None else f"{result['delay_ms']:.0f}"
+        line = (
+            f"{bench.name:32} {result['median_us']:10.1f} {result['p95_us']:10.1f} {result['allocs']:7d} "
+            f"{result['peak_kib']:9.1f} {bus:>7} {delay:>9}"
+        )
+        if bench.name in baseline:
+            found = regressions(bench.name, result, baseline[bench.name], args.threshold)
+            if found:
+                line += "  REGRESSION: " + "; ".join(found)
+                failures.append(bench.name)
+        print(line, flush=True)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if failures:
+        print(f"{len(failures)} regression(s): {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import ctypes
+import errno
+import json
+import logging
+import os
+import select
+import struct
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT = struct.Struct("iIII")
+# Editors save in several steps (truncate, write, rename); wait for quiet.
+RELOAD_SETTLE_SECONDS = 0.2
+
+
+def read_config_file(path):
+    with open(path, "rb") as handle:
+        data = handle.read()
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML config needs Python 3.11 or newer; use JSON instead")
+        try:
+            config = tomllib.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, tomllib.TOMLDecodeError) as exc:
+            raise ValueError(str(exc))
+    else:
+        try:
+            config = json.loads(data)
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise ValueError(str(exc))
+    if not isinstance(config, dict):
+        raise ValueError("expected a table/object of settings")
+    return config
+
+
+class Inotify:
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch({path}): {os.strerror(err)}")
+        return wd
+
+    def read_names(self):
+        names = set()
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except BlockingIOError:
+                return names
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+                offset += length
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class ConfigWatcher:
+    # Reads and validates on its own thread so the render loop only ever sees
+    # a finished, valid settings dict.
+    def __init__(self, path, load, apply):
+        self.path = os.path.abspath(path)
+        self._load = load
+        self._apply = apply
+        self._inotify = Inotify()
+        # Watch the directory: atomic saves replace the file's inode.
+        self._inotify.add_watch(
+            os.path.dirname(self.path),
+            IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE,
+        )
+        self._stop_read, self._stop_write = os.pipe()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        LOGGER.info("Watching %s for config changes", self.path)
+
+    def _changed(self, timeout=None):
+        ready, _, _ = select.select([self._inotify, self._stop_read], [], [], timeout)
+        if self._stop_read in ready:
+            raise EOFError
+        return bool(ready) and os.path.basename(self.path) in self._inotify.read_names()
+
+    def _run(self):
+        try:
+            while True:
+                if not self._changed():
+                    continue
+                while self._changed(RELOAD_SETTLE_SECONDS):
+                    pass
+                self.reload()
+        except EOFError:
+            return
+
+    def reload(self):
+        try:
+            values = self._load(self.path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring %s (%s); keeping the current config", self.path, exc)
+            return
+        self._apply(values)
+
+    def stop(self):
+        os.write(self._stop_write, b"\0")
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._inotify.close()
+        os.close(self._stop_read)
+        os.close(self._stop_write)
@@ -0,0 +1,257 @@
+import base64
+import binascii
+import collections
+import io
+import itertools
+import json
+import logging
+import os
+import socket
+
+from PIL import Image, UnidentifiedImageError
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_MESSAGES = 32
+MAX_TITLE_CHARS = 40
+MAX_TEXT_CHARS = 512
+MAX_IMAGE_BYTES = 16384
+MAX_IMAGE_SIZE = (196, 84)
+MAX_REQUEST_BYTES = 65536
+MAX_CONNECTIONS = 16
+
+
+class Message:
+    __slots__ = ("id", "title", "text", "image", "priority", "posted_at", "expires_at")
+
+    def __init__(self, message_id, title, text, image, priority, posted_at, expires_at):
+        self.id = message_id
+        self.title = title
+        self.text = text
+        self.image = image
+        self.priority = priority
+        self.posted_at = posted_at
+        self.expires_at = expires_at
+
+
+def _decode_image(data):
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, TypeError):
+        raise ValueError("image must be base64")
+    if len(raw) > MAX_IMAGE_BYTES:
+        raise ValueError(f"image larger than {MAX_IMAGE_BYTES} bytes")
+    try:
+        with Image.open(io.BytesIO(raw)) as image:
+            if image.width > MAX_IMAGE_SIZE[0] or image.height > MAX_IMAGE_SIZE[1]:
+                raise ValueError(f"image larger than {MAX_IMAGE_SIZE[0]}x{MAX_IMAGE_SIZE[1]}")
+            return image.convert("1")
+    except (UnidentifiedImageError, OSError) as exc:
+        raise ValueError(f"unreadable image: {exc}")
+
+
+def parse_message(request, now):
+    message_id = request.get("id") or "default"
+    title = request.get("title", "")
+    text = request.get("text", "")
+    if not all(isinstance(value, str) for value in (message_id, title, text)):
+        raise ValueError("id, title and text must be strings")
+    ttl = request.get("ttl")
+    if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0):
+        raise ValueError("ttl must be a positive number of seconds")
+    image = _decode_image(request["image"]) if request.get("image") else None
+    if not (title or text or image):
+        raise ValueError("a message needs a title, text or image")
+    return Message(
+        message_id[:MAX_TITLE_CHARS],
+        title[:MAX_TITLE_CHARS],
+        text[:MAX_TEXT_CHARS],
+        image,
+        bool(request.get("priority", False)),
+        now,
+        None if ttl is None else now + ttl,
+    )
+
+
+class MessageBoard:
+    def __init__(self):
+        # id -> Message, oldest first.
+        self._messages = collections.OrderedDict()
+        self.version = 0
+
+    def post(self, message):
+        self._messages.pop(message.id, None)
+        self._messages[message.id] = message
+        while len(self._messages) > MAX_MESSAGES:
+            self._messages.popitem(last=False)
+        self.version += 1
+
+    def clear(self, message_id=None):
+        if message_id is None:
+            removed = bool(self._messages)
+            self._messages.clear()
+        else:
+            removed = self._messages.pop(message_id, None) is not None
+        if removed:
+            self.version += 1
+        return removed
+
+    def expire(self, now):
+        expired = [key for key, message in self._messages.items() if message.expires_at is not None and message.expires_at <= now]
+        for key in expired:
+            del self._messages[key]
+        if expired:
+            self.version += 1
+        return bool(expired)
+
+    def next_expiry(self):
+        return min((message.expires_at for message in self._messages.values() if message.expires_at is not None), default=None)
+
+    def messages(self):
+        # Newest first, as shown on the messages page.
+        return list(reversed(self._messages.values()))
+
+    def overlay(self):
+        return next((message for message in reversed(self._messages.values()) if message.priority), None)
+
+    def handle(self, request, now):
+        op = request.get("op", "post")
+        if op == "post":
+            message = parse_message(request, now)
+            self.post(message)
+            return {"id": message.id}
+        if op == "clear":
+            message_id = request.get("id")
+            if message_id is not None and not isinstance(message_id, str):
+                raise ValueError("id must be a string")
+            return {"removed": self.clear(message_id)}
+        if op == "list":
+            return {
+                "messages": [
+                    {
+                        "id": message.id,
+                        "title": message.title,
+                        "priority": message.priority,
+                        "expires_in": None if message.expires_at is None else round(message.expires_at - now, 1),
+                    }
+                    for message in self.messages()
+                ]
+            }
+        raise ValueError(f"unknown op {op!r}; expected post, clear or list")
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+
+class ControlServer:
+    # Newline-delimited JSON over a Unix socket and/or localhost TCP, served
+    # from the app's event loop: no threads, so requests never race a redraw.
+    def __init__(self, loop, handle_request, unix_path=None, tcp_address=None):
+        self._loop = loop
+        self._handle_request = handle_request
+        self._unix_path = unix_path
+        self._listeners = []
+        self._connections = {}
+        self._ids = itertools.count(1)
+        if unix_path:
+            try:
+                os.unlink(unix_path)
+            except FileNotFoundError:
+                pass
+            self._listen(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC), unix_path)
+        if tcp_address:
+            family = socket.AF_INET6 if ":" in tcp_address[0] else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listen(sock, tcp_address)
+
+    def _listen(self, sock, address):
+        try:
+            sock.bind(address)
+            sock.listen(4)
+        except OSError:
+            sock.close()
+            self.close()
+            raise
+        sock.setblocking(False)
+        self._listeners.append(sock)
+        self._loop.add_reader(sock, lambda: self._accept(sock))
+        LOGGER.info("Control API listening on %s", address)
+
+    def _accept(self, listener):
+        try:
+            sock, _ = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        if len(self._connections) >= MAX_CONNECTIONS:
+            sock.close()
+            return
+        sock.setblocking(False)
+        key = next(self._ids)
+        self._connections[key] = _Connection(sock)
+        self._loop.add_reader(sock, lambda: self._read(key))
+
+    def _read(self, key):
+        connection = self._connections[key]
+        try:
+            data = connection.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(key)
+            return
+        connection.buffer += data
+        while True:
+            end = connection.buffer.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(connection.buffer[:end])
+            del connection.buffer[:end + 1]
+            if line.strip():
+                self._reply(connection, self._dispatch(line))
+        if len(connection.buffer) > MAX_REQUEST_BYTES:
+            self._reply(connection, {"ok": False, "error": f"request larger than {MAX_REQUEST_BYTES} bytes"})
+            self._drop(key)
+
+    def _dispatch(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+            result = self._handle_request(request)
+        except RecursionError:
+            return {"ok": False, "error": "request nested too deeply"}
+        except (ValueError, TypeError) as exc:
+            # A malformed request must never reach the event loop.
+            return {"ok": False, "error": str(exc)}
+        return dict({"ok": True}, **(result or {}))
+
+    def _reply(self, connection, response):
+        try:
+            # Replies are tiny; a client that stops reading just loses them.
+            connection.sock.send(json.dumps(response).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+
+    def _drop(self, key):
+        connection = self._connections.pop(key)
+        self._loop.remove_reader(connection.sock)
+        connection.sock.close()
+
+    def close(self):
+        for key in list(self._connections):
+            self._drop(key)
+        for sock in self._listeners:
+            self._loop.remove_reader(sock)
+            sock.close()
+        self._listeners = []
+        if self._unix_path:
+            try:
+                os.unlink(self._unix_path)
+            except OSError:
+                pass
@@ -0,0 +1,116 @@
+import logging
+import mmap
+import os
+import re
+import struct
+
+LOGGER = logging.getLogger(__name__)
+
+HISTORY_MAGIC = b"IIHS"
+HISTORY_VERSION = 1
+HEADER = struct.Struct("<4sIIII")
+HEADER_SIZE = 32
+RECORD = struct.Struct("<dd")
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def default_state_dir():
+    state_dir = os.environ.get("STATE_DIRECTORY", "").split(":")[0]
+    if state_dir:
+        return state_dir
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(base, "infoink")
+
+
+class HistorySeries:
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        size = HEADER_SIZE + capacity * RECORD.size
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            if os.fstat(fd).st_size > size:
+                os.ftruncate(fd, size)
+            # Reserve the blocks up front: a sparse file would fail its first
+            # write through the map with SIGBUS once the disk is full.
+            os.posix_fallocate(fd, 0, size)
+            self._map = mmap.mmap(fd, size)
+        except OSError as exc:
+            LOGGER.warning("History series %s is kept in memory only: %s", path, exc)
+            self._map = mmap.mmap(-1, size)
+        finally:
+            os.close(fd)
+
+        magic, version, stored_capacity, head, count = HEADER.unpack_from(self._map, 0)
+        if (
+            magic != HISTORY_MAGIC
+            or version != HISTORY_VERSION
+            or stored_capacity != capacity
+            or head >= capacity
+            or count > capacity
+        ):
+            self._map[:] = bytes(size)
+            head = count = 0
+            HEADER.pack_into(self._map, 0, HISTORY_MAGIC, HISTORY_VERSION, capacity, head, count)
+        self._head = head
+        self.count = count
+
+    def append(self, timestamp, value):
+        RECORD.pack_into(self._map, HEADER_SIZE + self._head * RECORD.size, timestamp, value)
+        self._head = (self._head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        HEADER.pack_into(self._map, 0, HISTORY_MAGIC, HISTORY_VERSION, self.capacity, self._head, self.count)
+
+    def records(self, since=None):
+        start = (self._head - self.count) % self.capacity
+        for i in range(self.count):
+            timestamp, value = RECORD.unpack_from(self._map, HEADER_SIZE + ((start + i) % self.capacity) * RECORD.size)
+            if since is None or timestamp >= since:
+                yield timestamp, value
+
+    def latest(self):
+        if not self.count:
+            return None
+        return RECORD.unpack_from(self._map, HEADER_SIZE + ((self._head - 1) % self.capacity) * RECORD.size)
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+
+
+class HistoryStore:
+    def __init__(self, state_dir, capacity=4096):
+        self.directory = os.path.join(state_dir, "history")
+        self.capacity = capacity
+        os.makedirs(self.directory, exist_ok=True)
+        self._series = {}
+
+    def series(self, name):
+        series = self._series.get(name)
+        if series is None:
+            path = os.path.join(self.directory, _SAFE_NAME.sub("_", name) + ".ts")
+            series = HistorySeries(path, self.capacity)
+            self._series[name] = series
+        return series
+
+    def append(self, name, timestamp, value):
+        try:
+            self.series(name).append(timestamp, value)
+        except OSError as exc:
+            LOGGER.warning("Appending to history series '%s' failed: %s", name, exc)
+
+    def flush(self):
+        for series in self._series.values():
+            series.flush()
+
+    def close(self):
+        for series in self._series.values():
+            series.close()
+        self._series = {}
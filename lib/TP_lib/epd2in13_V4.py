@@ -30,7 +30,6 @@
 
 import logging
 from . import epdconfig
-import numpy as np
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -313,6 +312,47 @@ class EPD:
         self.send_data2(image)
         self.TurnOnDisplayPart_Wait()
 
+    '''
+    function : Sends only a window of the image buffer to RAM and partial refresh
+    parameter:
+        image : Full-frame image data (as returned by getbuffer)
+        x_start, x_end : Panel columns, x_start multiple of 8
+        y_start, y_end : Panel rows
+    '''
+    def displayPartial_Window(self, image, x_start, y_start, x_end, y_end):
+        if self.width%8 == 0:
+            linewidth = int(self.width/8)
+        else:
+            linewidth = int(self.width/8) + 1
+
+        epdconfig.digital_write(self.reset_pin, 0)
+        epdconfig.delay_ms(1)
+        epdconfig.digital_write(self.reset_pin, 1)
+
+        self.send_command(0x01) #Driver output control
+        self.send_data(0xf9)
+        self.send_data(0x00)
+        self.send_data(0x00)
+
+        self.send_command(0x3C) #BorderWavefrom
+        self.send_data(0x80)
+
+        self.send_command(0x11) #data entry mode
+        self.send_data(0x03)
+
+        self.SetWindow(x_start, y_start, x_end, y_end)
+        self.SetCursor(x_start >> 3, y_start)
+
+        first = x_start >> 3
+        last = (x_end >> 3) + 1
+        window = bytearray()
+        for j in range(y_start, y_end + 1):
+            window += image[j * linewidth + first:j * linewidth + last]
+
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data2(window)
+        self.TurnOnDisplayPart_Wait()
+
     '''
     function : Refresh a base image
     parameter:
@@ -324,17 +364,32 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
+        # One SPI transfer per RAM plane instead of one per byte.
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
-                
+        self.send_data2(image[0:linewidth * self.height])
+
         self.send_command(0x26)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])  
+        self.send_data2(image[0:linewidth * self.height])
         self.TurnOnDisplay()
     
+    '''
+    function : Load a base image into both RAM planes without refreshing,
+               for when the panel already shows this image
+    parameter:
+        image : Image data
+    '''
+    def loadBaseImage(self, image):
+        if self.width%8 == 0:
+            linewidth = int(self.width/8)
+        else:
+            linewidth = int(self.width/8) + 1
+
+        self.send_command(0x24)
+        self.send_data2(image[0:linewidth * self.height])
+
+        self.send_command(0x26)
+        self.send_data2(image[0:linewidth * self.height])
+
     '''
     function : Clear screen
     parameter:
@@ -347,21 +402,19 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(color)
-                
+        self.send_data2([color] * (linewidth * self.height))
+
         self.TurnOnDisplay()
 
     '''
     function : Enter sleep mode
     parameter:
     '''
-    def sleep(self):
+    def sleep(self, settle_ms=2000):
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x01)
         
-        epdconfig.delay_ms(2000)
+        epdconfig.delay_ms(settle_ms)
 
     def Dev_exit(self):
         epdconfig.module_exit()
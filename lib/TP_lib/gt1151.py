@@ -24,6 +24,10 @@ class GT1151:
 
     def digital_read(self, pin):
         return config.digital_read(pin)
+
+    def set_int_callback(self, callback):
+        # INT is pulled low while a touch is reported.
+        config.GPIO_INT.when_deactivated = callback
     
     def GT_Reset(self):
         config.digital_write(self.TRST, 1)
@@ -0,0 +1,174 @@
+import bisect
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    # Plain attribute updates: the loop thread is the only writer and a scrape
+    # reading a value mid-update just sees the previous one.
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class MetricFamily:
+    def __init__(self, name, help_text, kind, factory):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self._factory = factory
+        self.children = {}
+
+    def labels(self, **labels):
+        # Resolve once at setup; hot paths keep the returned child.
+        key = tuple(sorted(labels.items()))
+        child = self.children.get(key)
+        if child is None:
+            child = self._factory()
+            self.children[key] = child
+        return child
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for labels, child in list(self.children.items()):
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{format_labels(labels)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {child.sum}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {child.count}")
+
+
+class CallbackFamily:
+    def __init__(self, name, help_text, kind, callback):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self._callback = callback
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        lines.append(f"{self.name} {self._callback()}")
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+
+    def _register(self, family):
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name, help_text):
+        return self._register(MetricFamily(name, help_text, "counter", Counter))
+
+    def gauge(self, name, help_text):
+        return self._register(MetricFamily(name, help_text, "gauge", Gauge))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(MetricFamily(name, help_text, "histogram", lambda: Histogram(buckets)))
+
+    def callback(self, name, help_text, callback, kind="gauge"):
+        return self._register(CallbackFamily(name, help_text, kind, callback))
+
+    def render(self):
+        lines = []
+        for family in list(self._families.values()):
+            family.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def parse_address(address, default_host="127.0.0.1"):
+    host, _, port = address.rpartition(":")
+    return (host.strip("[]") or default_host), int(port)
+
+
+class MetricsServer:
+    def __init__(self, host, port, registry=REGISTRY):
+        self._host = host
+        self._port = port
+        self._registry = registry
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        # Imported here so units without --metrics-address never load it.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self._registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, _format, *args):
+                return
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+        self._httpd = Server((self._host, self._port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        LOGGER.info("Metrics available at http://%s:%s/metrics", self._host, self._port)
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
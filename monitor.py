@@ -1,19 +1,34 @@
 #!/usr/bin/python3
 # -*- coding:utf-8 -*-
 import argparse
+import collections
 import datetime
 import fcntl
+import fnmatch
 import logging
+import math
 import os
+import signal
 import socket
 import struct
 import subprocess
 import sys
 import time
 
+_IMPORTS_STARTED_AT = time.monotonic()
+
 from PIL import Image, ImageDraw, ImageFont
 
-from simulator_backend import create_simulator_runtime
+import config
+import metrics
+import sd_notify
+import tracing
+from history import HistoryStore, default_state_dir
+from netlink import NL80211Client, ROUTE_ADDRESS_EVENTS, ROUTE_LINK_EVENTS, RouteEventSocket
+from panel_state import discard_panel_state, load_panel_state, panel_state_path, save_panel_state
+from scheduler import EventLoop
+from throughput import SPARKLINE_WIDTH, ThroughputMonitor, format_rate
+from vitals import SystemVitals, format_vitals
 
 fontdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "pic")
 libdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "lib")
@@ -26,105 +41,435 @@ LOGGER = logging.getLogger(__name__)
 UPDATE_INTERVAL_SECONDS = 5
 FULL_REFRESH_EVERY_N_UPDATES = 30
 NETWORK_CACHE_TTL_SECONDS = 60
-ADMIN_PAGE_INDEX = 3
-PAGES = ("IP Addresses", "Wi-Fi", "Clock", "Admin")
+VITALS_CACHE_TTL_SECONDS = 2
+THROUGHPUT_SAMPLE_SECONDS = 5
+HISTORY_CAPACITY = 4096
+IP_PAGE_INDEX = 0
+WIFI_PAGE_INDEX = 1
+VITALS_PAGE_INDEX = 2
+THROUGHPUT_PAGE_INDEX = 3
+CLOCK_PAGE_INDEX = 4
+ADMIN_PAGE_INDEX = 5
+MESSAGES_PAGE_INDEX = 6
+PAGES = ("IP Addresses", "Wi-Fi", "Vitals", "Throughput", "Clock", "Admin", "Messages")
+PAGE_KEYS = ("ip", "wifi", "vitals", "throughput", "clock", "admin", "messages")
+# The messages page is added when the control API is enabled.
+PAGE_ORDER = tuple(range(MESSAGES_PAGE_INDEX))
+LIST_PAGE_INDEXES = (IP_PAGE_INDEX, WIFI_PAGE_INDEX, THROUGHPUT_PAGE_INDEX)
+LIST_ROWS_PER_PAGE = 6
+
+NET_CLASS_DIR = "/sys/class/net"
+INTERFACE_INCLUDE_PATTERNS = ("*",)
+INTERFACE_EXCLUDE_PATTERNS = ("veth*", "br-*", "docker*", "virbr*", "cni*", "flannel*")
 
 DISPLAY_WIDTH = 250
 DISPLAY_HEIGHT = 122
 SIDEBAR_X0 = 220
+SPARKLINE_X0 = 154
 UP_BUTTON = (223, 8, 247, 56)
 DOWN_BUTTON = (223, 66, 247, 114)
 TOUCH_DEBOUNCE_SECONDS = 0.25
 TOUCH_POLL_IDLE_SECONDS = 0.12
 TOUCH_POLL_ACTIVE_SECONDS = 0.03
+FULL_REFRESH_MAX_INTERVAL_SECONDS = 600
+PARTIAL_WINDOW_MAX_FRACTION = 0.5
+# Ghosting builds up per pixel, so partial refreshes are counted per square
+# panel region of this many pixels.
+REFRESH_REGION_PIXELS = 8
+PARTIAL_REFRESH_ESTIMATE_SECONDS = 0.35
+REFRESH_TIME_SMOOTHING = 0.2
+PRERENDER_MAX_PAGES = 2
+PRERENDER_IDLE_DELAY_SECONDS = 0.5
+CLOCK_MODE = "seconds"
+EXIT_MODE_CLEAR = "clear"
+EXIT_MODE_KEEP = "keep"
+KEEP_EXIT_SLEEP_SETTLE_MS = 100
+WATCHDOG_REDRAW_GRACE_SECONDS = 30
+IDLE_SLEEP_SECONDS = 600
+HIBERNATE_SLEEP_SETTLE_MS = 10
+PANEL_TIMING = "v4"
+CLOCK_MODES = {"seconds": (1, "%H:%M:%S"), "minute": (60, "%H:%M")}
 ADMIN_CONFIRM_WINDOW_SECONDS = 5.0
+CONTROL_COALESCE_SECONDS = 0.5
+CONTROL_LATENCY_BUDGET_SECONDS = 2.0
+OVERLAY_BOX = (8, 26, SIDEBAR_X0 - 9, DISPLAY_HEIGHT - 5)
 
 ADMIN_REBOOT_BUTTON = (14, 36, 110, 54)
 ADMIN_SHUTDOWN_BUTTON = (14, 74, 110, 92)
 ADMIN_CONFIRM_BUTTON = (222, 40, 248, 82)
 
-_IP_CACHE = {"updated_at": 0.0, "value": []}
+_IP_CACHE = {"updated_at": 0.0, "value": [], "populated": False}
 _WIFI_CACHE = {"updated_at": 0.0, "value": []}
+_VITALS_CACHE = {"updated_at": 0.0, "value": []}
+_NL80211 = {"client": None, "unavailable": False}
+_ROUTE_EVENTS = {"socket": None}
+_VITALS = {"reader": None, "unavailable": False}
+_THROUGHPUT = {"monitor": None, "next_sample_at": 0.0}
+_HISTORY = {"store": None}
+# Headless replay swaps in a virtual clock and scripted provider values.
+_CLOCKS = {"monotonic": time.monotonic, "wall": time.time}
+_PROVIDERS = {}
+_CONFIG = {"defaults": None}
+_CONTROL = {"board": None, "target": None}
+_ADMIN = {"runner": None}
+
+_FRAMES_RENDERED = metrics.REGISTRY.counter("infoink_frames_rendered_total", "Frames drawn by build_frame.")
+_FRAMES_SENT = metrics.REGISTRY.counter("infoink_frames_sent_total", "Frames sent to the panel, by refresh type.")
+_REFRESH_SECONDS = metrics.REGISTRY.histogram(
+    "infoink_panel_refresh_seconds",
+    "Time spent in panel refresh calls, by refresh type.",
+)
+_PROVIDER_SECONDS = metrics.REGISTRY.histogram("infoink_provider_refresh_seconds", "Provider refresh latency.")
+_PROVIDER_LOOKUPS = metrics.REGISTRY.counter(
+    "infoink_provider_cache_lookups_total",
+    "Cached provider lookups, by provider and hit/miss.",
+)
+_METRICS = {
+    "rendered_redraw": _FRAMES_RENDERED.labels(stage="redraw"),
+    "rendered_prerender": _FRAMES_RENDERED.labels(stage="prerender"),
+    "rendered_start": _FRAMES_RENDERED.labels(stage="start"),
+    "sent_full": _FRAMES_SENT.labels(refresh="full"),
+    "sent_partial": _FRAMES_SENT.labels(refresh="partial"),
+    "sent_window": _FRAMES_SENT.labels(refresh="window"),
+    "refresh_full": _REFRESH_SECONDS.labels(refresh="full"),
+    "refresh_partial": _REFRESH_SECONDS.labels(refresh="partial"),
+    "refresh_window": _REFRESH_SECONDS.labels(refresh="window"),
+    "skipped": metrics.REGISTRY.counter("infoink_frames_skipped_total", "Frames identical to the panel.").labels(),
+    "prerender_hits": metrics.REGISTRY.counter(
+        "infoink_prerender_hits_total",
+        "Redraws served from a prerendered buffer.",
+    ).labels(),
+    "busy_wait": metrics.REGISTRY.histogram(
+        "infoink_panel_busy_wait_seconds",
+        "Time spent waiting for the panel BUSY line.",
+    ).labels(),
+    "touch_scans": metrics.REGISTRY.counter("infoink_touch_scans_total", "GT1151 scans.").labels(),
+    "touch_errors": metrics.REGISTRY.counter("infoink_touch_errors_total", "GT1151 scans that failed.").labels(),
+    "touches": metrics.REGISTRY.counter("infoink_touches_total", "Touch points reported by scans.").labels(),
+}
+for _provider in ("ipv4", "wifi", "vitals", "sample"):
+    _METRICS[f"{_provider}_seconds"] = _PROVIDER_SECONDS.labels(provider=_provider)
+    _METRICS[f"{_provider}_hit"] = _PROVIDER_LOOKUPS.labels(provider=_provider, result="hit")
+    _METRICS[f"{_provider}_miss"] = _PROVIDER_LOOKUPS.labels(provider=_provider, result="miss")
+
+
+def interface_selected(ifname):
+    if ifname == "lo":
+        return False
+    if not any(fnmatch.fnmatchcase(ifname, pattern) for pattern in INTERFACE_INCLUDE_PATTERNS):
+        return False
+    return not any(fnmatch.fnmatchcase(ifname, pattern) for pattern in INTERFACE_EXCLUDE_PATTERNS)
+
+
+def configure_clocks(monotonic=None, wall=None):
+    if monotonic is not None:
+        _CLOCKS["monotonic"] = monotonic
+    if wall is not None:
+        _CLOCKS["wall"] = wall
+
+
+def configure_providers(ipv4=None, wifi=None, vitals=None, net_dir=None):
+    overrides = {"ipv4": ipv4, "wifi": wifi, "vitals": vitals, "net_dir": net_dir}
+    _PROVIDERS.update((name, value) for name, value in overrides.items() if value is not None)
+
+
+def wall_now():
+    return datetime.datetime.fromtimestamp(_CLOCKS["wall"]())
+
+
+def configure_interface_filters(include=None, exclude=None):
+    global INTERFACE_INCLUDE_PATTERNS, INTERFACE_EXCLUDE_PATTERNS
+    if include:
+        INTERFACE_INCLUDE_PATTERNS = tuple(include)
+    if exclude is not None:
+        INTERFACE_EXCLUDE_PATTERNS = tuple(exclude)
 
 
 def get_non_loopback_ipv4():
     addresses = []
-    for _, ifname in socket.if_nameindex():
-        if ifname == "lo":
-            continue
+    ifnames = sorted(ifname for _, ifname in socket.if_nameindex() if interface_selected(ifname))
+    if not ifnames:
+        return addresses
 
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            req = struct.pack("256s", ifname[:15].encode("utf-8"))
-            ip = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), 0x8915, req)[20:24])
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for ifname in ifnames:
+            try:
+                req = struct.pack("256s", ifname[:15].encode("utf-8"))
+                ip = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), 0x8915, req)[20:24])
+            except OSError:
+                continue
             if not ip.startswith("127."):
                 addresses.append((ifname, ip))
-        except OSError:
-            continue
-        finally:
-            sock.close()
+    finally:
+        sock.close()
 
-    addresses.sort(key=lambda item: item[0])
     return addresses
 
 
+def get_nl80211_client():
+    if _NL80211["client"] is None and not _NL80211["unavailable"]:
+        try:
+            _NL80211["client"] = NL80211Client()
+        except OSError as exc:
+            _NL80211["unavailable"] = True
+            LOGGER.info("nl80211 unavailable (%s); using iwgetid/iw for Wi-Fi", exc)
+    return _NL80211["client"]
+
+
+def get_wifi_ssid_subprocess(ifname):
+    ssid = ""
+    try:
+        ssid = subprocess.check_output(
+            ["iwgetid", ifname, "--raw"],
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        ssid = ""
+
+    if not ssid:
+        try:
+            link_out = subprocess.check_output(
+                ["iw", "dev", ifname, "link"],
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+            for line in link_out.splitlines():
+                line = line.strip()
+                if line.startswith("SSID:"):
+                    ssid = line.split(":", 1)[1].strip()
+                    break
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            ssid = ""
+
+    return ssid
+
+
+def get_wifi_ssid(ifname):
+    client = get_nl80211_client()
+    if client is not None:
+        try:
+            return client.get_ssid(socket.if_nametoindex(ifname))
+        except OSError as exc:
+            LOGGER.debug("nl80211 query for %s failed (%s); falling back to iw", ifname, exc)
+    return get_wifi_ssid_subprocess(ifname)
+
+
 def get_connected_wifi_networks():
     wifi_links = []
-    net_dir = "/sys/class/net"
+    net_dir = NET_CLASS_DIR
     try:
         interfaces = sorted(os.listdir(net_dir))
     except OSError:
         return wifi_links
 
     for ifname in interfaces:
+        if not interface_selected(ifname):
+            continue
         if not os.path.isdir(os.path.join(net_dir, ifname, "wireless")):
             continue
 
-        ssid = ""
-        try:
-            ssid = subprocess.check_output(
-                ["iwgetid", ifname, "--raw"],
-                stderr=subprocess.DEVNULL,
-                text=True,
-            ).strip()
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            ssid = ""
-
-        if not ssid:
-            try:
-                link_out = subprocess.check_output(
-                    ["iw", "dev", ifname, "link"],
-                    stderr=subprocess.DEVNULL,
-                    text=True,
-                )
-                for line in link_out.splitlines():
-                    line = line.strip()
-                    if line.startswith("SSID:"):
-                        ssid = line.split(":", 1)[1].strip()
-                        break
-            except (FileNotFoundError, subprocess.CalledProcessError):
-                ssid = ""
-
+        ssid = get_wifi_ssid(ifname)
         if ssid:
             wifi_links.append((ifname, ssid))
 
     return wifi_links
 
 
+def subscribe_wifi_link_events():
+    client = get_nl80211_client()
+    if client is None:
+        return False
+    try:
+        client.subscribe_link_events()
+    except OSError as exc:
+        LOGGER.info("nl80211 link events unavailable (%s); relying on cache TTL", exc)
+        return False
+    return True
+
+
+def event_interface_selected(ifindex, ifname=None):
+    # Events for filtered interfaces (veth, docker bridges, ...) are
+    # dropped; an event that cannot be tied to an interface is kept.
+    if ifname is None:
+        if not ifindex:
+            return True
+        try:
+            ifname = socket.if_indextoname(ifindex)
+        except OSError:
+            return True
+    return interface_selected(ifname)
+
+
+def poll_wifi_link_events():
+    client = _NL80211["client"]
+    if client is None:
+        return False
+    if not any(event_interface_selected(ifindex) for _, ifindex in client.poll_link_events()):
+        return False
+    _WIFI_CACHE["updated_at"] = float("-inf")
+    return True
+
+
+def subscribe_route_events():
+    try:
+        _ROUTE_EVENTS["socket"] = RouteEventSocket()
+    except OSError as exc:
+        LOGGER.info("rtnetlink address events unavailable (%s); relying on cache TTL", exc)
+        return None
+    return _ROUTE_EVENTS["socket"]
+
+
+def poll_route_events():
+    route_events = _ROUTE_EVENTS["socket"]
+    if route_events is None:
+        return ()
+    msg_types = {
+        msg_type for msg_type, ifindex, ifname in route_events.poll() if event_interface_selected(ifindex, ifname)
+    }
+    if None in msg_types:
+        msg_types.update(ROUTE_ADDRESS_EVENTS + ROUTE_LINK_EVENTS)
+    pages = []
+    if msg_types.intersection(ROUTE_ADDRESS_EVENTS + ROUTE_LINK_EVENTS):
+        _IP_CACHE["updated_at"] = float("-inf")
+        pages.append(IP_PAGE_INDEX)
+    if msg_types.intersection(ROUTE_LINK_EVENTS):
+        _WIFI_CACHE["updated_at"] = float("-inf")
+        pages.append(WIFI_PAGE_INDEX)
+    return pages
+
+
+def pushed_page_changed(page, now_mono):
+    # Re-reads the provider behind a page an event invalidated. Only a
+    # change in what the page shows counts as activity: a DHCP renewal or a
+    # carrier flap that ends where it started must not keep the panel awake.
+    if page == IP_PAGE_INDEX:
+        before = _IP_CACHE["value"]
+        return get_non_loopback_ipv4_cached(now_mono) != before
+    before = _WIFI_CACHE["value"]
+    return get_connected_wifi_networks_cached(now_mono) != before
+
+
+def close_route_events():
+    if _ROUTE_EVENTS["socket"] is not None:
+        _ROUTE_EVENTS["socket"].close()
+        _ROUTE_EVENTS["socket"] = None
+
+
+def refresh_cached(name, cache, provider, now_mono, ttl):
+    if (now_mono - cache["updated_at"]) < ttl:
+        _METRICS[f"{name}_hit"].inc()
+        return False
+    started = time.perf_counter()
+    with tracing.span(f"provider.{name}"):
+        cache["value"] = _PROVIDERS.get(name, provider)()
+    cache["updated_at"] = now_mono
+    _METRICS[f"{name}_seconds"].observe(time.perf_counter() - started)
+    _METRICS[f"{name}_miss"].inc()
+    return True
+
+
 def get_non_loopback_ipv4_cached(now_mono):
-    if (now_mono - _IP_CACHE["updated_at"]) >= NETWORK_CACHE_TTL_SECONDS:
-        _IP_CACHE["value"] = get_non_loopback_ipv4()
-        _IP_CACHE["updated_at"] = now_mono
+    if refresh_cached("ipv4", _IP_CACHE, get_non_loopback_ipv4, now_mono, NETWORK_CACHE_TTL_SECONDS):
+        if _IP_CACHE["value"]:
+            _IP_CACHE["populated"] = True
     return _IP_CACHE["value"]
 
 
 def get_connected_wifi_networks_cached(now_mono):
-    if (now_mono - _WIFI_CACHE["updated_at"]) >= NETWORK_CACHE_TTL_SECONDS:
-        _WIFI_CACHE["value"] = get_connected_wifi_networks()
-        _WIFI_CACHE["updated_at"] = now_mono
+    if refresh_cached("wifi", _WIFI_CACHE, get_connected_wifi_networks, now_mono, NETWORK_CACHE_TTL_SECONDS):
+        record_history("wifi.associated", len(_WIFI_CACHE["value"]))
     return _WIFI_CACHE["value"]
 
 
+def get_vitals_reader():
+    if _VITALS["reader"] is None and not _VITALS["unavailable"]:
+        try:
+            _VITALS["reader"] = SystemVitals()
+        except OSError as exc:
+            _VITALS["unavailable"] = True
+            LOGGER.warning("System vitals unavailable: %s", exc)
+    return _VITALS["reader"]
+
+
+def get_system_vitals():
+    reader = get_vitals_reader()
+    if reader is None:
+        return ["System vitals", "unavailable"]
+    try:
+        return format_vitals(reader.sample())
+    except (OSError, ValueError, IndexError) as exc:
+        LOGGER.warning("Reading system vitals failed: %s", exc)
+        return ["System vitals", "unavailable"]
+
+
+def get_system_vitals_cached(now_mono):
+    refresh_cached("vitals", _VITALS_CACHE, get_system_vitals, now_mono, VITALS_CACHE_TTL_SECONDS)
+    return _VITALS_CACHE["value"]
+
+
+def close_system_vitals():
+    if _VITALS["reader"] is not None:
+        _VITALS["reader"].close()
+        _VITALS["reader"] = None
+
+
+def open_history_store(state_dir):
+    try:
+        _HISTORY["store"] = HistoryStore(state_dir or default_state_dir(), HISTORY_CAPACITY)
+    except OSError as exc:
+        LOGGER.warning("Metrics history disabled: %s", exc)
+        _HISTORY["store"] = None
+
+
+def record_history(name, value):
+    if _HISTORY["store"] is not None:
+        _HISTORY["store"].append(name, _CLOCKS["wall"](), value)
+
+
+def close_history_store():
+    if _HISTORY["store"] is not None:
+        _HISTORY["store"].close()
+        _HISTORY["store"] = None
+
+
+def get_throughput_monitor():
+    if _THROUGHPUT["monitor"] is None:
+        _THROUGHPUT["monitor"] = ThroughputMonitor(
+            interface_selected,
+            net_dir=_PROVIDERS.get("net_dir", NET_CLASS_DIR),
+            history=_HISTORY["store"],
+            history_window=SPARKLINE_WIDTH * THROUGHPUT_SAMPLE_SECONDS,
+            wall_clock=_CLOCKS["wall"],
+        )
+    return _THROUGHPUT["monitor"]
+
+
+def sample_providers_if_due(now_mono):
+    if now_mono < _THROUGHPUT["next_sample_at"]:
+        _METRICS["sample_hit"].inc()
+        return False
+    started = time.perf_counter()
+    with tracing.span("provider.sample"):
+        get_throughput_monitor().sample(now_mono)
+        reader = get_vitals_reader() if "vitals" not in _PROVIDERS else None
+        if reader is not None:
+            temperature = reader.temperature_c()
+            if temperature is not None:
+                record_history("temperature", temperature)
+    _METRICS["sample_seconds"].observe(time.perf_counter() - started)
+    _METRICS["sample_miss"].inc()
+    _THROUGHPUT["next_sample_at"] = now_mono + THROUGHPUT_SAMPLE_SECONDS
+    return True
+
+
+def close_throughput_monitor():
+    if _THROUGHPUT["monitor"] is not None:
+        _THROUGHPUT["monitor"].close()
+        _THROUGHPUT["monitor"] = None
+
+
 def load_font(size):
     for name in ("Roboto-Regular.ttf", "Font.ttc"):
         path = os.path.join(fontdir, name)
@@ -151,30 +496,134 @@ def draw_sidebar(draw, font_button, show_confirm=False):
         draw.text((225, 72), "DOWN", font=font_button, fill=0)
 
 
-def build_frame(page, font_title, font_body, font_button, armed_admin_action="", armed_seconds_left=0):
-    image = Image.new("1", (DISPLAY_WIDTH, DISPLAY_HEIGHT), 255)
-    draw = ImageDraw.Draw(image)
+def list_page_items(page, now_mono):
+    if page == IP_PAGE_INDEX:
+        return get_non_loopback_ipv4_cached(now_mono)
+    if page == WIFI_PAGE_INDEX:
+        return get_connected_wifi_networks_cached(now_mono)
+    if page == THROUGHPUT_PAGE_INDEX:
+        return get_throughput_monitor().items()
+    return []
 
-    now = datetime.datetime.now()
-    draw.rectangle((0, 0, SIDEBAR_X0 - 1, DISPLAY_HEIGHT - 1), outline=0, fill=255, width=1)
-    draw.text((4, 4), PAGES[page], font=font_title, fill=0)
-    draw.line((2, 21, SIDEBAR_X0 - 3, 21), fill=0, width=1)
-    draw.line((2, 28, SIDEBAR_X0 - 3, 28), fill=0, width=1)
 
-    now_mono = time.monotonic()
-    if page == 0:
-        rows = [f"{ifname}: {ip}" for ifname, ip in get_non_loopback_ipv4_cached(now_mono)]
-        if not rows:
-            rows = ["No non-loopback", "IPv4 addresses"]
-    elif page == 1:
-        rows = [f"{ifname}: {ssid}" for ifname, ssid in get_connected_wifi_networks_cached(now_mono)]
+def list_page_count(page, now_mono):
+    if page == MESSAGES_PAGE_INDEX:
+        return max(1, len(control_messages()))
+    if page not in LIST_PAGE_INDEXES:
+        return 1
+    return max(1, -(-len(list_page_items(page, now_mono)) // LIST_ROWS_PER_PAGE))
+
+
+def control_messages():
+    board = _CONTROL["board"]
+    return board.messages() if board is not None else []
+
+
+def control_overlay():
+    board = _CONTROL["board"]
+    return board.overlay() if board is not None else None
+
+
+def wrap_text(draw, text, font, width):
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and draw.textlength(candidate, font=font) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def draw_message(draw, image, message, font_title, font_body, box):
+    x0, y0, x1, y1 = box
+    y = y0
+    if message.title:
+        draw.text((x0, y), message.title, font=font_title, fill=0)
+        y += 18
+    if message.image is not None:
+        shown = message.image.crop((0, 0, min(message.image.width, x1 - x0), max(0, min(message.image.height, y1 - y))))
+        image.paste(shown, (x0, y))
+        y += shown.height + 2
+    for line in wrap_text(draw, message.text, font_body, x1 - x0):
+        if y + 12 > y1:
+            break
+        draw.text((x0, y), line, font=font_body, fill=0)
+        y += 13
+
+
+def build_frame(
+    page,
+    font_title,
+    font_body,
+    font_button,
+    armed_admin_action="",
+    armed_seconds_left=0,
+    sub_page=0,
+    now=None,
+    canvas=None,
+):
+    if canvas is None:
+        image = Image.new("1", (DISPLAY_WIDTH, DISPLAY_HEIGHT), 255)
+        draw = ImageDraw.Draw(image)
+    else:
+        image, draw = canvas
+        image.paste(255, (0, 0, DISPLAY_WIDTH, DISPLAY_HEIGHT))
+
+    now = wall_now() if now is None else now
+    now_mono = _CLOCKS["monotonic"]()
+    title = PAGES[page]
+    sparklines = []
+    if page in LIST_PAGE_INDEXES:
+        # Only the rows inside the visible window are formatted and drawn.
+        items = list_page_items(page, now_mono)
+        page_count = max(1, -(-len(items) // LIST_ROWS_PER_PAGE))
+        sub_page %= page_count
+        start = sub_page * LIST_ROWS_PER_PAGE
+        visible = items[start:start + LIST_ROWS_PER_PAGE]
+        if page == THROUGHPUT_PAGE_INDEX:
+            rows = [
+                f"{stats.ifname} R{format_rate(stats.rx_rate.latest())} T{format_rate(stats.tx_rate.latest())}"
+                for stats in visible
+            ]
+            sparklines = [stats.sparkline.image for stats in visible]
+        else:
+            rows = [f"{name}: {value}" for name, value in visible]
+        if page_count > 1:
+            title = f"{title} ({sub_page + 1}/{page_count})"
         if not rows:
-            rows = ["No connected Wi-Fi", "networks detected"]
-    elif page == 2:
-        rows = [now.strftime("%H:%M:%S"), now.strftime("%Y-%m-%d")]
+            if page == IP_PAGE_INDEX and not _IP_CACHE["populated"]:
+                rows = ["Waiting for network..."]
+            elif page == IP_PAGE_INDEX:
+                rows = ["No non-loopback", "IPv4 addresses"]
+            elif page == WIFI_PAGE_INDEX:
+                rows = ["No connected Wi-Fi", "networks detected"]
+            else:
+                rows = ["No interface", "statistics available"]
+    elif page == VITALS_PAGE_INDEX:
+        rows = get_system_vitals_cached(now_mono)
+    elif page == CLOCK_PAGE_INDEX:
+        rows = [now.strftime(CLOCK_MODES[CLOCK_MODE][1]), now.strftime("%Y-%m-%d")]
+    elif page == MESSAGES_PAGE_INDEX:
+        messages = control_messages()
+        if messages:
+            # Messages can expire or be cleared while one is on screen.
+            sub_page %= len(messages)
+        if len(messages) > 1:
+            title = f"{title} ({sub_page + 1}/{len(messages)})"
+        rows = [] if messages else ["No messages"]
     else:
         rows = []
 
+    draw.rectangle((0, 0, SIDEBAR_X0 - 1, DISPLAY_HEIGHT - 1), outline=0, fill=255, width=1)
+    draw.text((4, 4), title, font=font_title, fill=0)
+    draw.line((2, 21, SIDEBAR_X0 - 3, 21), fill=0, width=1)
+    draw.line((2, 28, SIDEBAR_X0 - 3, 28), fill=0, width=1)
+
     if page == ADMIN_PAGE_INDEX:
         draw.rectangle(ADMIN_REBOOT_BUTTON, outline=0, fill=255, width=1)
         draw.text((22, 40), "Reboot", font=font_button, fill=0)
@@ -185,18 +634,246 @@ def build_frame(page, font_title, font_body, font_button, armed_admin_action="",
             confirm_label = "REBOOT" if armed_admin_action == "reboot" else "SHUTDOWN"
             draw.text((8, 102), f"Tap CONFIRM at right ({armed_seconds_left}s)", font=font_button, fill=0)
             draw.text((8, 112), f"Armed: {confirm_label}", font=font_button, fill=0)
+    elif page == MESSAGES_PAGE_INDEX and not rows:
+        draw_message(draw, image, messages[sub_page], font_title, font_body, (4, 32, SIDEBAR_X0 - 4, DISPLAY_HEIGHT - 2))
     else:
         y = 36
-        for row in rows:
-            draw.text((4, y), row, font=font_title if page == 2 else font_body, fill=0)
-            y += 24 if page == 2 else 14
+        for index, row in enumerate(rows):
+            draw.text((4, y), row, font=font_title if page == CLOCK_PAGE_INDEX else font_body, fill=0)
+            if index < len(sparklines):
+                image.paste(sparklines[index], (SPARKLINE_X0, y + 1))
+            y += 24 if page == CLOCK_PAGE_INDEX else 14
             if y > DISPLAY_HEIGHT - 4:
                 break
 
+    overlay = control_overlay()
+    if overlay is not None and not armed_admin_action:
+        draw.rectangle(OVERLAY_BOX, outline=0, fill=255, width=2)
+        x0, y0, x1, y1 = OVERLAY_BOX
+        draw_message(draw, image, overlay, font_title, font_body, (x0 + 4, y0 + 3, x1 - 4, y1 - 3))
+
     draw_sidebar(draw, font_button, show_confirm=(page == ADMIN_PAGE_INDEX and bool(armed_admin_action)))
     return image
 
 
+def page_data_version(page, now_mono):
+    if page == IP_PAGE_INDEX:
+        updated_at = _IP_CACHE["updated_at"]
+        return updated_at, (now_mono - updated_at) >= NETWORK_CACHE_TTL_SECONDS
+    if page == WIFI_PAGE_INDEX:
+        updated_at = _WIFI_CACHE["updated_at"]
+        return updated_at, (now_mono - updated_at) >= NETWORK_CACHE_TTL_SECONDS
+    if page == VITALS_PAGE_INDEX:
+        updated_at = _VITALS_CACHE["updated_at"]
+        return updated_at, (now_mono - updated_at) >= VITALS_CACHE_TTL_SECONDS
+    if page == THROUGHPUT_PAGE_INDEX:
+        return _THROUGHPUT["next_sample_at"], False
+    if page == CLOCK_PAGE_INDEX:
+        return wall_now().strftime(CLOCK_MODES[CLOCK_MODE][1] + " %Y-%m-%d"), False
+    if page == MESSAGES_PAGE_INDEX and _CONTROL["board"] is not None:
+        return _CONTROL["board"].version, False
+    return 0, False
+
+
+def configure_idle_sleep(minutes):
+    global IDLE_SLEEP_SECONDS
+    if minutes is not None:
+        IDLE_SLEEP_SECONDS = max(0.0, minutes * 60.0)
+
+
+def configure_prerender(max_pages):
+    global PRERENDER_MAX_PAGES
+    if max_pages is not None:
+        PRERENDER_MAX_PAGES = max(0, max_pages)
+
+
+def configure_panel_timing(spec):
+    global PANEL_TIMING
+    if spec:
+        PANEL_TIMING = spec
+
+
+def configure_control(coalesce_ms=None, latency_budget_ms=None):
+    global PAGE_ORDER, CONTROL_COALESCE_SECONDS, CONTROL_LATENCY_BUDGET_SECONDS
+    if MESSAGES_PAGE_INDEX not in PAGE_ORDER:
+        PAGE_ORDER = PAGE_ORDER + (MESSAGES_PAGE_INDEX,)
+    if coalesce_ms is not None:
+        CONTROL_COALESCE_SECONDS = max(0.0, coalesce_ms / 1000.0)
+    if latency_budget_ms is not None:
+        CONTROL_LATENCY_BUDGET_SECONDS = max(0.0, latency_budget_ms / 1000.0)
+
+
+def configure_clock_mode(mode):
+    global CLOCK_MODE
+    if mode:
+        CLOCK_MODE = mode
+
+
+def _config_number(minimum, integer=False):
+    def parse(value):
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            raise ValueError(f"expected {'an integer' if integer else 'a number'}, got {value!r}")
+        if value < minimum:
+            raise ValueError(f"must be at least {minimum}")
+        return value
+
+    return parse
+
+
+def _config_patterns(value):
+    if not isinstance(value, list) or not all(isinstance(pattern, str) for pattern in value):
+        raise ValueError("expected a list of glob strings")
+    return tuple(value)
+
+
+def _config_include_patterns(value):
+    return _config_patterns(value) or ("*",)
+
+
+def _config_clock_mode(value):
+    if value not in CLOCK_MODES:
+        raise ValueError(f"expected one of {', '.join(sorted(CLOCK_MODES))}")
+    return value
+
+
+def _config_idle_sleep(value):
+    return _config_number(0)(value) * 60.0
+
+
+def _config_pages(value):
+    if not isinstance(value, list) or not value:
+        raise ValueError("expected a non-empty list of pages")
+    names = {key: index for index, key in enumerate(PAGE_KEYS)}
+    names.update((title.lower(), index) for index, title in enumerate(PAGES))
+    order = []
+    for name in value:
+        index = names.get(str(name).lower())
+        if index is None:
+            raise ValueError(f"unknown page {name!r}; expected one of {', '.join(PAGE_KEYS)}")
+        if index in order:
+            raise ValueError(f"page {name!r} listed twice")
+        order.append(index)
+    return tuple(order)
+
+
+# Config file key -> (module global, parser). Parsers raise ValueError.
+CONFIG_FIELDS = {
+    "update_interval_seconds": ("UPDATE_INTERVAL_SECONDS", _config_number(0.5)),
+    "full_refresh_every_n_updates": ("FULL_REFRESH_EVERY_N_UPDATES", _config_number(1, integer=True)),
+    "full_refresh_max_interval_seconds": ("FULL_REFRESH_MAX_INTERVAL_SECONDS", _config_number(1)),
+    "network_cache_ttl_seconds": ("NETWORK_CACHE_TTL_SECONDS", _config_number(0)),
+    "vitals_cache_ttl_seconds": ("VITALS_CACHE_TTL_SECONDS", _config_number(0)),
+    "touch_debounce_seconds": ("TOUCH_DEBOUNCE_SECONDS", _config_number(0)),
+    "touch_poll_idle_seconds": ("TOUCH_POLL_IDLE_SECONDS", _config_number(0.01)),
+    "touch_poll_active_seconds": ("TOUCH_POLL_ACTIVE_SECONDS", _config_number(0.01)),
+    "prerender_pages": ("PRERENDER_MAX_PAGES", _config_number(0, integer=True)),
+    "idle_sleep_minutes": ("IDLE_SLEEP_SECONDS", _config_idle_sleep),
+    "clock_mode": ("CLOCK_MODE", _config_clock_mode),
+    "pages": ("PAGE_ORDER", _config_pages),
+    "include_interfaces": ("INTERFACE_INCLUDE_PATTERNS", _config_include_patterns),
+    "exclude_interfaces": ("INTERFACE_EXCLUDE_PATTERNS", _config_patterns),
+    "control_coalesce_seconds": ("CONTROL_COALESCE_SECONDS", _config_number(0)),
+    "control_latency_budget_seconds": ("CONTROL_LATENCY_BUDGET_SECONDS", _config_number(0)),
+}
+
+
+def validate_config(settings):
+    unknown = sorted(set(settings) - set(CONFIG_FIELDS))
+    if unknown:
+        raise ValueError(f"unknown setting(s): {', '.join(unknown)}")
+    values = {}
+    for key, value in settings.items():
+        name, parse = CONFIG_FIELDS[key]
+        try:
+            values[name] = parse(value)
+        except ValueError as exc:
+            raise ValueError(f"{key}: {exc}")
+    return values
+
+
+def load_config(path):
+    return validate_config(config.read_config_file(path))
+
+
+def apply_config(values):
+    # Settings missing from the file fall back to their startup values, so
+    # deleting a line undoes it. Returns the names of globals that changed.
+    if _CONFIG["defaults"] is None:
+        _CONFIG["defaults"] = {name: globals()[name] for name, _ in CONFIG_FIELDS.values()}
+    merged = dict(_CONFIG["defaults"], **values)
+    changed = {name for name, value in merged.items() if globals()[name] != value}
+    globals().update(merged)
+    return changed
+
+
+def step_page(page, step, hidden_pages=()):
+    order = tuple(index for index in PAGE_ORDER if index not in hidden_pages) or (IP_PAGE_INDEX,)
+    if page not in order:
+        return order[0]
+    return order[(order.index(page) + step) % len(order)]
+
+
+def next_clock_boundary(now_wall, period, lead):
+    boundary = (math.floor(now_wall / period) + 1) * period
+    while boundary - lead <= now_wall:
+        boundary += period
+    return boundary
+
+
+def panel_dirty_window(previous, current, panel_width, panel_height):
+    linewidth = (panel_width + 7) // 8
+    if previous is None or len(previous) != len(current):
+        return 0, 0, panel_width - 1, panel_height - 1
+
+    before = memoryview(previous)
+    after = memoryview(current)
+    first_row = last_row = -1
+    first_col = linewidth
+    last_col = -1
+    for row in range(panel_height):
+        offset = row * linewidth
+        if before[offset:offset + linewidth] == after[offset:offset + linewidth]:
+            continue
+        if first_row < 0:
+            first_row = row
+        last_row = row
+        for col in range(linewidth):
+            if previous[offset + col] != current[offset + col]:
+                first_col = min(first_col, col)
+                break
+        for col in range(linewidth - 1, -1, -1):
+            if previous[offset + col] != current[offset + col]:
+                last_col = max(last_col, col)
+                break
+
+    if first_row < 0:
+        return None
+    return first_col * 8, first_row, min(last_col * 8 + 7, panel_width - 1), last_row
+
+
+def pack_frame(image, buffer):
+    # Same layout as getbuffer() for a landscape image, written into a
+    # reusable buffer. Pillow cannot rotate or pack into existing memory, so
+    # the rotated image and its bytes are still per-frame temporaries.
+    with tracing.span("pack_frame"):
+        buffer[:] = image.transpose(Image.ROTATE_270).tobytes("raw")
+    return buffer
+
+
+class FramePool:
+    # Two canvases and packed buffers used alternately: the panel's current
+    # frame stays untouched in one while the next is drawn into the other.
+    def __init__(self, display_width, display_height, panel_width, panel_height):
+        self.buffer_length = ((panel_width + 7) // 8) * panel_height
+        self._slots = []
+        for _ in range(2):
+            image = Image.new("1", (display_width, display_height), 255)
+            self._slots.append(((image, ImageDraw.Draw(image)), bytearray(self.buffer_length)))
+
+    def acquire(self, in_use):
+        return self._slots[1] if self._slots[0][1] is in_use else self._slots[0]
+
+
 def is_inside(rect, x, y):
     x0, y0, x1, y1 = rect
     return x0 <= x <= x1 and y0 <= y <= y1
@@ -208,8 +885,21 @@ def raw_touch_to_landscape(raw_x, raw_y):
     return (DISPLAY_WIDTH - 1) - raw_y, (DISPLAY_HEIGHT - 1) - raw_x
 
 
-def create_runtime(simulator, simulator_host, simulator_port):
+def create_runtime(simulator, simulator_host, simulator_port, replay=None, split_panel=False):
+    if replay is not None:
+        return replay.create_runtime(DISPLAY_WIDTH, DISPLAY_HEIGHT, UP_BUTTON, DOWN_BUTTON, PANEL_TIMING)
+
+    if split_panel:
+        # The panel process owns the drivers (or the simulator and its HTTP
+        # server); this process only renders.
+        from panel_link import spawn_panel_process
+
+        return spawn_panel_process(simulator, simulator_host, simulator_port, PANEL_TIMING) + (None,)
+
     if simulator:
+        # Imported lazily so hardware mode never loads http.server.
+        from simulator_backend import create_simulator_runtime
+
         return create_simulator_runtime(
             simulator_host,
             simulator_port,
@@ -217,6 +907,7 @@ def create_runtime(simulator, simulator_host, simulator_port):
             DISPLAY_HEIGHT,
             UP_BUTTON,
             DOWN_BUTTON,
+            PANEL_TIMING,
         )
 
     from TP_lib import epd2in13_V4, gt1151
@@ -228,8 +919,20 @@ def create_runtime(simulator, simulator_host, simulator_port):
     return epd, gt, gt_dev, gt_old, None
 
 
+def configure_admin_actions(runner):
+    # Replay and the simulator swap in a runner that only records the
+    # action, so a scripted tap on CONFIRM never reboots the dev machine.
+    _ADMIN["runner"] = runner
+
+
+def log_admin_action(action):
+    LOGGER.warning("Simulator: %s confirmed (not run)", action)
+
+
 def trigger_admin_action(action):
-    if action == "reboot":
+    if _ADMIN["runner"] is not None:
+        _ADMIN["runner"](action)
+    elif action == "reboot":
         LOGGER.warning("Running: sudo reboot")
         subprocess.Popen(["sudo", "reboot"])
     elif action == "shutdown":
@@ -237,153 +940,980 @@ def trigger_admin_action(action):
         subprocess.Popen(["sudo", "shutdown", "-h", "now"])
 
 
-def run(simulator=False, simulator_host="127.0.0.1", simulator_port=8765):
-    epd, gt, gt_dev, gt_old, sim_server = create_runtime(simulator, simulator_host, simulator_port)
-
-    font_title = load_font(14)
-    font_body = load_font(12)
-    font_button = load_font(10)
+class MonitorApp:
+    def __init__(self, epd, gt, gt_dev, gt_old, loop, fonts, hidden_pages=frozenset()):
+        self.epd = epd
+        self.gt = gt
+        self.gt_dev = gt_dev
+        self.gt_old = gt_old
+        self.loop = loop
+        self.font_title, self.font_body, self.font_button = fonts
+        # Pages this panel never shows, whatever PAGE_ORDER says.
+        self.hidden_pages = hidden_pages
+        self.frames = FramePool(DISPLAY_WIDTH, DISPLAY_HEIGHT, epd.width, epd.height)
+
+        # Partial refreshes per panel region since the last full refresh;
+        # update_count is the highest of them.
+        self.update_count = 0
+        self.region_refreshes = self._refresh_regions(0)
+        self.current_page = 0
+        self.sub_page = 0
+        self.last_page_touch = 0.0
+        self.touch_latched = False
+        self.armed_admin_action = ""
+        self.armed_admin_expires_at = 0.0
+        self.full_refresh_due = False
+        self.last_buffer = None
+        self.partial_refresh_seconds = PARTIAL_REFRESH_ESTIMATE_SECONDS
+        self.clock_target_wall = None
+        # page -> (data version, packed buffer); most recently used last.
+        self.prerendered = collections.OrderedDict()
+
+        self._redraw_timer = None
+        self._prerender_timer = None
+        self._admin_timer = None
+        self._touch_timer = None
+        self._full_refresh_timer = None
+        self._touch_idle_poll = False
+        self._watchdog_interval = 0.0
+        self._provider_timer = None
+        self._idle_timer = None
+        self._control_timer = None
+        self._control_deadline = None
+        self._control_version = None
+        self._expiry_timer = None
+        self._watchdog_timer = None
+
+        self.hibernating = False
+        self.last_activity_at = 0.0
+        self.last_presented_at = None
+        self._wake_started_at = None
+
+    def start(self, startup_timings=None, warm_state=None, system_events=True):
+        now = self.loop.clock()
+        self.current_page = step_page(self.current_page, 0, self.hidden_pages)
+        if warm_state is not None:
+            # The panel still shows the persisted frame: load it into both RAM
+            # planes and move on with partial updates, no flashing.
+            self.last_buffer, self.update_count = warm_state
+            self.region_refreshes = self._refresh_regions(self.update_count)
+            self.epd.loadBaseImage(self.last_buffer)
+            self.epd.init(self.epd.PART_UPDATE)
+            if startup_timings is not None:
+                startup_timings.append(("warm_load", self.loop.clock() - now))
+            self.request_redraw()
+        else:
+            # The first real frame doubles as the base image: one full
+            # waveform, no separate Clear().
+            canvas, buffer = self.frames.acquire(self.last_buffer)
+            build_frame(self.current_page, self.font_title, self.font_body, self.font_button, canvas=canvas)
+            _METRICS["rendered_start"].inc()
+            self.last_buffer = pack_frame(canvas[0], buffer)
+            rendered_at = self.loop.clock()
+            self.epd.displayPartBaseImage(self.last_buffer)
+            self.epd.init(self.epd.PART_UPDATE)
+            if startup_timings is not None:
+                startup_timings.append(("first_render", rendered_at - now))
+                startup_timings.append(("first_transfer", self.loop.clock() - rendered_at))
+            self._schedule_redraw(now + UPDATE_INTERVAL_SECONDS)
+        self._schedule_full_refresh_deadline(now)
+        self._provider_timer = self.loop.call_at(now, self.on_provider_sample)
+        self.note_activity(now)
+        self.last_presented_at = self.loop.clock()
 
-    update_count = 0
-    current_page = 0
-    force_redraw = True
-    next_update_at = 0.0
-    last_page_touch = 0.0
-    touch_latched = False
-    armed_admin_action = ""
-    armed_admin_expires_at = 0.0
+        try:
+            self.gt.set_int_callback(lambda: self.loop.call_soon_threadsafe(self.poll_touch))
+            edge_wakeup = True
+        except (AttributeError, OSError) as exc:
+            LOGGER.warning("Touch INT edge events unavailable (%s); polling touch", exc)
+            edge_wakeup = False
+        self._touch_timer = self.loop.call_at(now, self.poll_touch)
+        self._touch_idle_poll = not edge_wakeup
+        if not system_events:
+            # A render host subscribes once for all of its panels.
+            return
+
+        # Link/address events only invalidate the live providers.
+        if "wifi" not in _PROVIDERS and subscribe_wifi_link_events():
+            self.loop.add_reader(_NL80211["client"].events_fileno(), self.on_wifi_link_event)
+        route_events = subscribe_route_events() if "ipv4" not in _PROVIDERS else None
+        if route_events is not None:
+            self.loop.add_reader(route_events.fileno(), self.on_route_event)
+
+        watchdog_interval = sd_notify.watchdog_interval_seconds()
+        if watchdog_interval:
+            self._watchdog_interval = watchdog_interval / 2
+            self._watchdog_timer = self.loop.call_at(now, self.on_watchdog)
+
+    def stop(self):
+        # Used when a remote panel goes away; the loop keeps running.
+        for timer in (
+            self._redraw_timer,
+            self._prerender_timer,
+            self._admin_timer,
+            self._touch_timer,
+            self._full_refresh_timer,
+            self._provider_timer,
+            self._idle_timer,
+            self._control_timer,
+            self._expiry_timer,
+            self._watchdog_timer,
+        ):
+            if timer is not None:
+                timer.cancel()
+        self.gt.set_int_callback(None)
+
+    def _schedule_redraw(self, when):
+        if self._redraw_timer is not None:
+            if not self._redraw_timer.cancelled and self._redraw_timer.when <= when:
+                return
+            self._redraw_timer.cancel()
+        self._redraw_timer = self.loop.call_at(when, self.redraw)
+
+    def request_redraw(self):
+        if self.hibernating:
+            self.wake()
+        self._schedule_redraw(self.loop.clock())
+
+    def note_activity(self, now):
+        self.last_activity_at = now
+        if IDLE_SLEEP_SECONDS <= 0:
+            return
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = self.loop.call_at(now + IDLE_SLEEP_SECONDS, self.on_idle_timeout)
+
+    def on_idle_timeout(self):
+        self._idle_timer = None
+        if not self.hibernating and self.loop.clock() - self.last_activity_at >= IDLE_SLEEP_SECONDS:
+            self.hibernate()
+
+    def hibernate(self):
+        for timer in (self._redraw_timer, self._prerender_timer, self._provider_timer, self._full_refresh_timer):
+            if timer is not None:
+                timer.cancel()
+        self._redraw_timer = self._prerender_timer = self._provider_timer = self._full_refresh_timer = None
+        self.epd.sleep(settle_ms=HIBERNATE_SLEEP_SETTLE_MS)
+        self.hibernating = True
+        LOGGER.info("No activity for %.0fs; panel in deep sleep until touched", IDLE_SLEEP_SECONDS)
+
+    def wake(self):
+        now = self.loop.clock()
+        self.hibernating = False
+        self._wake_started_at = now
+        # The hardware reset in init() ends deep sleep; reload both RAM planes
+        # so the next partial refresh diffs against what is on the glass.
+        self.epd.init(self.epd.PART_UPDATE)
+        self.epd.loadBaseImage(self.last_buffer)
+        self._schedule_full_refresh_deadline(now)
+        self._provider_timer = self.loop.call_at(now, self.on_provider_sample)
+        self.note_activity(now)
+        # Nothing was due while asleep; staleness counts from the wake.
+        self.last_presented_at = now
+
+    def _schedule_full_refresh_deadline(self, now):
+        if self._full_refresh_timer is not None:
+            self._full_refresh_timer.cancel()
+        self._full_refresh_timer = self.loop.call_at(
+            now + FULL_REFRESH_MAX_INTERVAL_SECONDS,
+            self.on_full_refresh_deadline,
+        )
 
-    try:
-        if simulator:
-            LOGGER.info("Initializing simulator-backed display + touch")
+    def _clock_frame_time(self):
+        target = self.clock_target_wall
+        self.clock_target_wall = None
+        if self.current_page != CLOCK_PAGE_INDEX or target is None:
+            return None
+        # Render the boundary the refresh is expected to land on, not "now".
+        if target - _CLOCKS["wall"]() > self.partial_refresh_seconds + 0.25:
+            return None
+        return datetime.datetime.fromtimestamp(target)
+
+    def _next_redraw_at(self, started):
+        if self.current_page != CLOCK_PAGE_INDEX:
+            return started + UPDATE_INTERVAL_SECONDS
+        period = CLOCK_MODES[CLOCK_MODE][0]
+        lead = self.partial_refresh_seconds
+        now_wall = _CLOCKS["wall"]()
+        self.clock_target_wall = next_clock_boundary(now_wall, period, lead)
+        return self.loop.clock() + (self.clock_target_wall - now_wall) - lead
+
+    def render_page(self, page, now_mono):
+        canvas, _ = self.frames.acquire(self.last_buffer)
+        with tracing.span("build_frame"):
+            build_frame(page, self.font_title, self.font_body, self.font_button, canvas=canvas)
+        _METRICS["rendered_prerender"].inc()
+        # Prerendered buffers are kept, so they get their own storage.
+        buffer = pack_frame(canvas[0], bytearray(self.frames.buffer_length))
+        self._store_prerendered(page, page_data_version(page, now_mono), buffer)
+        return buffer
+
+    def _store_prerendered(self, page, version, buffer):
+        if PRERENDER_MAX_PAGES <= 0:
+            return
+        self.prerendered[page] = (version, buffer)
+        self.prerendered.move_to_end(page)
+        while len(self.prerendered) > PRERENDER_MAX_PAGES:
+            self.prerendered.popitem(last=False)
+
+    def take_prerendered(self, page, now_mono):
+        entry = self.prerendered.get(page)
+        if entry is None or entry[0] != page_data_version(page, now_mono):
+            return None
+        return entry[1]
+
+    def schedule_prerender(self):
+        if PRERENDER_MAX_PAGES <= 0 or self.hibernating:
+            return
+        if self._prerender_timer is not None:
+            self._prerender_timer.cancel()
+        self._prerender_timer = self.loop.call_later(PRERENDER_IDLE_DELAY_SECONDS, self.prerender_adjacent)
+
+    def prerender_adjacent(self):
+        self._prerender_timer = None
+        now = self.loop.clock()
+        neighbours = [step_page(self.current_page, step, self.hidden_pages) for step in (-1, 1)]
+        for page in neighbours[:PRERENDER_MAX_PAGES]:
+            if page == self.current_page or self.take_prerendered(page, now) is not None:
+                continue
+            if page == CLOCK_PAGE_INDEX or page_data_version(page, now)[1]:
+                # The clock follows wall time and would be stale before it
+                # is shown, and a page whose cache has expired would refresh
+                # its provider from idle time. Both are drawn when shown.
+                continue
+            with tracing.span("prerender"):
+                self.render_page(page, now)
+            if self._redraw_timer is not None and self._redraw_timer.when <= self.loop.clock():
+                # Real work is due; finish the rest in the next idle slot.
+                self.schedule_prerender()
+                return
+
+    def _report_wake(self):
+        if self._wake_started_at is not None:
+            elapsed = self.loop.clock() - self._wake_started_at
+            LOGGER.info("Woke from deep sleep: frame visible after %.0f ms", elapsed * 1000)
+            self._wake_started_at = None
+
+    def _refresh_regions(self, count):
+        columns = -(-self.epd.width // REFRESH_REGION_PIXELS)
+        rows = -(-self.epd.height // REFRESH_REGION_PIXELS)
+        return [count] * (columns * rows)
+
+    def _count_refresh(self, window):
+        x_start, y_start, x_end, y_end = window
+        columns = -(-self.epd.width // REFRESH_REGION_PIXELS)
+        counts = self.region_refreshes
+        for row in range(y_start // REFRESH_REGION_PIXELS, y_end // REFRESH_REGION_PIXELS + 1):
+            first = row * columns
+            for index in range(first + x_start // REFRESH_REGION_PIXELS, first + x_end // REFRESH_REGION_PIXELS + 1):
+                counts[index] += 1
+                if counts[index] > self.update_count:
+                    self.update_count = counts[index]
+
+    def present(self, buffer):
+        if self.full_refresh_due or self.update_count + 1 >= FULL_REFRESH_EVERY_N_UPDATES:
+            started = time.perf_counter()
+            self.epd.init(self.epd.FULL_UPDATE)
+            self.epd.displayPartBaseImage(buffer)
+            self.epd.init(self.epd.PART_UPDATE)
+            _METRICS["refresh_full"].observe(time.perf_counter() - started)
+            _METRICS["sent_full"].inc()
+            self.update_count = 0
+            self.region_refreshes = self._refresh_regions(0)
+            self.full_refresh_due = False
+            self.last_buffer = buffer
+            self._schedule_full_refresh_deadline(self.loop.clock())
+            self._report_wake()
+            return
+
+        with tracing.span("dirty_window"):
+            window = panel_dirty_window(self.last_buffer, buffer, self.epd.width, self.epd.height)
+        if window is None:
+            _METRICS["skipped"].inc()
+            self._report_wake()
+            return
+
+        started = self.loop.clock()
+        x_start, y_start, x_end, y_end = window
+        window_area = (x_end - x_start + 1) * (y_end - y_start + 1)
+        if window_area <= PARTIAL_WINDOW_MAX_FRACTION * self.epd.width * self.epd.height:
+            refresh = "window"
+            self.epd.displayPartial_Window(buffer, x_start, y_start, x_end, y_end)
         else:
-            LOGGER.info("Initializing Waveshare 2.13 V4 display + touch")
-
-        epd.init(epd.FULL_UPDATE)
-        gt.GT_Init()
-        epd.Clear(0xFF)
-
-        base_image = build_frame(current_page, font_title, font_body, font_button)
-        epd.displayPartBaseImage(epd.getbuffer(base_image))
-        epd.init(epd.PART_UPDATE)
-        next_update_at = time.monotonic()
-
-        while True:
-            now = time.monotonic()
-
-            if now >= next_update_at or force_redraw:
-                seconds_left = 0
-                if armed_admin_action:
-                    seconds_left = max(0, int(armed_admin_expires_at - now))
-                image = build_frame(
-                    current_page,
-                    font_title,
-                    font_body,
-                    font_button,
-                    armed_admin_action=armed_admin_action if current_page == ADMIN_PAGE_INDEX else "",
+            refresh = "partial"
+            self.epd.displayPartial_Wait(buffer)
+        elapsed = self.loop.clock() - started
+        # With --split-panel the call returns once the frame is queued; use
+        # the refresh time the panel process last reported instead.
+        reported = getattr(self.epd, "last_refresh_seconds", None)
+        if reported is not None:
+            elapsed = reported
+        _METRICS[f"refresh_{refresh}"].observe(elapsed)
+        _METRICS[f"sent_{refresh}"].inc()
+        self.partial_refresh_seconds += REFRESH_TIME_SMOOTHING * (elapsed - self.partial_refresh_seconds)
+        if refresh == "partial":
+            window = (0, 0, self.epd.width - 1, self.epd.height - 1)
+        self._count_refresh(window)
+        self.last_buffer = buffer
+        self._report_wake()
+
+    def redraw(self):
+        with tracing.span("redraw"):
+            self._redraw()
+
+    def _redraw(self):
+        now = self.loop.clock()
+        frame_time = self._clock_frame_time()
+        buffer = None
+        if not self.sub_page and not self.armed_admin_action and frame_time is None:
+            buffer = self.take_prerendered(self.current_page, now)
+            if buffer is not None:
+                _METRICS["prerender_hits"].inc()
+        if buffer is None:
+            seconds_left = 0
+            if self.armed_admin_action:
+                seconds_left = max(0, int(self.armed_admin_expires_at - now))
+            canvas, buffer = self.frames.acquire(self.last_buffer)
+            with tracing.span("build_frame"):
+                build_frame(
+                    self.current_page,
+                    self.font_title,
+                    self.font_body,
+                    self.font_button,
+                    armed_admin_action=self.armed_admin_action if self.current_page == ADMIN_PAGE_INDEX else "",
                     armed_seconds_left=seconds_left,
+                    sub_page=self.sub_page,
+                    now=frame_time,
+                    canvas=canvas,
                 )
-                update_count += 1
-
-                if update_count >= FULL_REFRESH_EVERY_N_UPDATES:
-                    epd.init(epd.FULL_UPDATE)
-                    epd.displayPartBaseImage(epd.getbuffer(image))
-                    epd.init(epd.PART_UPDATE)
-                    update_count = 0
+            _METRICS["rendered_redraw"].inc()
+            pack_frame(canvas[0], buffer)
+        self.present(buffer)
+        self.last_presented_at = self.loop.clock()
+
+        self._redraw_timer = None
+        self._schedule_redraw(self._next_redraw_at(now))
+        self.schedule_prerender()
+
+    def apply_config(self, values):
+        self.on_config_changed(apply_config(values))
+
+    def on_config_changed(self, changed):
+        if not changed:
+            return
+        LOGGER.info("Config reloaded: %s", ", ".join(sorted(changed)))
+        if changed & {"INTERFACE_INCLUDE_PATTERNS", "INTERFACE_EXCLUDE_PATTERNS"}:
+            _IP_CACHE["updated_at"] = float("-inf")
+            _WIFI_CACHE["updated_at"] = float("-inf")
+        page = step_page(self.current_page, 0, self.hidden_pages)
+        if page != self.current_page:
+            self.current_page = page
+            self.sub_page = 0
+            self.disarm_admin_action()
+        # Cached frames may show pages, filters or modes that no longer apply.
+        self.prerendered.clear()
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        if self.hibernating:
+            return
+        now = self.loop.clock()
+        self.note_activity(self.last_activity_at)
+        if "FULL_REFRESH_MAX_INTERVAL_SECONDS" in changed:
+            self._schedule_full_refresh_deadline(now)
+        self.request_redraw()
+
+    def on_control_request(self, request):
+        board = _CONTROL["board"]
+        version = board.version
+        result = board.handle(request, self.loop.clock())
+        if board.version != version:
+            self.on_control_update()
+        return result
+
+    def clear_overlay(self, message_id):
+        _CONTROL["board"].clear(message_id)
+        self.on_control_update(immediate=True)
+
+    def on_control_update(self, immediate=False):
+        # Bursts from a chatty client collapse into one refresh: wait until
+        # the board has been quiet for the coalesce window, but never past
+        # the latency budget measured from the first change.
+        self.prerendered.clear()
+        self._control_version = _CONTROL["board"].version
+        now = self.loop.clock()
+        self.note_activity(now)
+        if self._control_deadline is None:
+            self._control_deadline = now + CONTROL_LATENCY_BUDGET_SECONDS
+        if self._control_timer is not None:
+            self._control_timer.cancel()
+        when = now if immediate else min(now + CONTROL_COALESCE_SECONDS, self._control_deadline)
+        self._control_timer = self.loop.call_at(when, self.on_control_settled)
+
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+            self._expiry_timer = None
+        expires_at = _CONTROL["board"].next_expiry()
+        if expires_at is not None:
+            self._expiry_timer = self.loop.call_at(expires_at, self.on_control_expiry)
+
+    def on_control_settled(self):
+        self._control_timer = None
+        self._control_deadline = None
+        self.request_redraw()
+
+    def on_control_expiry(self):
+        self._expiry_timer = None
+        board = _CONTROL["board"]
+        board.expire(self.loop.clock())
+        # Another panel's timer may have expired the message already.
+        if board.version != self._control_version:
+            self.on_control_update()
+
+    def on_full_refresh_deadline(self):
+        self.full_refresh_due = True
+        self.request_redraw()
+
+    def on_provider_sample(self):
+        now = self.loop.clock()
+        sample_providers_if_due(now)
+        self._provider_timer = self.loop.call_at(_THROUGHPUT["next_sample_at"], self.on_provider_sample)
+
+    def on_pushed_update(self):
+        # Touches, control messages and link/address events that change the
+        # visible page count as activity; frames a page redraws on its own schedule (clock,
+        # vitals, throughput) do not, or those pages would never hibernate.
+        self.note_activity(self.loop.clock())
+        self.request_redraw()
+
+    def on_wifi_link_event(self):
+        if (
+            poll_wifi_link_events()
+            and self.current_page == WIFI_PAGE_INDEX
+            and pushed_page_changed(WIFI_PAGE_INDEX, self.loop.clock())
+        ):
+            self.on_pushed_update()
+
+    def on_route_event(self):
+        if self.current_page in poll_route_events() and pushed_page_changed(self.current_page, self.loop.clock()):
+            self.on_pushed_update()
+
+    def redraw_overdue(self, now):
+        # Measured from the last completed present, not from the pending
+        # timer: a fired timer counts as cancelled, and one that keeps being
+        # pushed back never looks late, while the panel goes stale either way.
+        if self.hibernating or self.last_presented_at is None:
+            return None
+        period = CLOCK_MODES[CLOCK_MODE][0] if self.current_page == CLOCK_PAGE_INDEX else UPDATE_INTERVAL_SECONDS
+        stale = now - self.last_presented_at
+        if stale > period + WATCHDOG_REDRAW_GRACE_SECONDS:
+            return stale
+        return None
+
+    def on_watchdog(self):
+        now = self.loop.clock()
+        overdue = self.redraw_overdue(now)
+        if overdue is not None:
+            LOGGER.warning("No frame presented for %.1fs; withholding watchdog ping", overdue)
+        else:
+            sd_notify.notify("WATCHDOG=1")
+        self._watchdog_timer = self.loop.call_at(now + self._watchdog_interval, self.on_watchdog)
+
+    def on_admin_expired(self):
+        self._admin_timer = None
+        if self.armed_admin_action:
+            self.armed_admin_action = ""
+            self.request_redraw()
+
+    def arm_admin_action(self, action, now):
+        self.armed_admin_action = action
+        self.armed_admin_expires_at = now + ADMIN_CONFIRM_WINDOW_SECONDS
+        if self._admin_timer is not None:
+            self._admin_timer.cancel()
+        # Fire just after the window so "now > expires_at" holds, as before.
+        self._admin_timer = self.loop.call_at(self.armed_admin_expires_at + 0.001, self.on_admin_expired)
+
+    def disarm_admin_action(self):
+        self.armed_admin_action = ""
+        if self._admin_timer is not None:
+            self._admin_timer.cancel()
+            self._admin_timer = None
+
+    def poll_touch(self):
+        with tracing.span("touch.poll"):
+            self._poll_touch()
+
+    def _poll_touch(self):
+        if self._touch_timer is not None:
+            self._touch_timer.cancel()
+            self._touch_timer = None
+
+        now = self.loop.clock()
+        int_is_low = self.gt.digital_read(self.gt.INT) == 0
+        if int_is_low:
+            if self.hibernating:
+                self.request_redraw()
+            self.note_activity(now)
+            self.gt_dev.Touch = 1
+            _METRICS["touch_scans"].inc()
+            try:
+                self.gt.GT_Scan(self.gt_dev, self.gt_old)
+            except OSError as exc:
+                _METRICS["touch_errors"].inc()
+                LOGGER.debug("Touch scan failed: %s", exc)
+        else:
+            self.touch_latched = False
+
+        if self.gt_dev.TouchpointFlag:
+            _METRICS["touches"].inc()
+            self.gt_dev.TouchpointFlag = 0
+            x, y = raw_touch_to_landscape(self.gt_dev.X[0], self.gt_dev.Y[0])
+            self.handle_touch(x, y, now)
+
+        # Keep scanning while a finger is down; otherwise sleep until the next
+        # INT edge (or the idle poll when edges are unavailable).
+        if int_is_low:
+            self._touch_timer = self.loop.call_at(now + TOUCH_POLL_ACTIVE_SECONDS, self.poll_touch)
+        elif self._touch_idle_poll:
+            self._touch_timer = self.loop.call_at(now + TOUCH_POLL_IDLE_SECONDS, self.poll_touch)
+
+    def handle_touch(self, x, y, now):
+        if (
+            self.current_page == ADMIN_PAGE_INDEX
+            and self.armed_admin_action
+            and x >= SIDEBAR_X0
+        ):
+            self.touch_latched = True
+            if is_inside(ADMIN_CONFIRM_BUTTON, x, y) and now <= self.armed_admin_expires_at:
+                trigger_admin_action(self.armed_admin_action)
+            else:
+                LOGGER.warning("Admin action canceled (confirmation zone not tapped).")
+            self.disarm_admin_action()
+            self.request_redraw()
+            return
+
+        overlay = control_overlay()
+        if overlay is not None and not self.touch_latched and not self.armed_admin_action and x < SIDEBAR_X0:
+            # Tapping a priority overlay acknowledges and removes it.
+            self.touch_latched = True
+            # The overlay is on every panel; they all drop it, not just this one.
+            _CONTROL["target"].clear_overlay(overlay.id)
+            return
+
+        if (
+            not self.touch_latched
+            and x >= SIDEBAR_X0
+            and (now - self.last_page_touch) > TOUCH_DEBOUNCE_SECONDS
+        ):
+            step = 0
+            if is_inside(UP_BUTTON, x, y):
+                step = -1
+            elif is_inside(DOWN_BUTTON, x, y):
+                step = 1
+            if step:
+                self.current_page = step_page(self.current_page, step, self.hidden_pages)
+                self.sub_page = 0
+                self.last_page_touch = now
+                self.touch_latched = True
+                self.disarm_admin_action()
+                self.request_redraw()
+
+        if (
+            (self.current_page in LIST_PAGE_INDEXES or self.current_page == MESSAGES_PAGE_INDEX)
+            and not self.touch_latched
+            and x < SIDEBAR_X0
+            and (now - self.last_page_touch) > TOUCH_DEBOUNCE_SECONDS
+        ):
+            self.sub_page = (self.sub_page + 1) % list_page_count(self.current_page, now)
+            self.last_page_touch = now
+            self.touch_latched = True
+            self.request_redraw()
+
+        if self.current_page == ADMIN_PAGE_INDEX and not self.touch_latched and x < SIDEBAR_X0:
+            tapped_action = ""
+            if is_inside(ADMIN_REBOOT_BUTTON, x, y):
+                tapped_action = "reboot"
+            elif is_inside(ADMIN_SHUTDOWN_BUTTON, x, y):
+                tapped_action = "shutdown"
+
+            if tapped_action:
+                self.touch_latched = True
+                if (
+                    self.armed_admin_action == tapped_action
+                    and now <= self.armed_admin_expires_at
+                ):
+                    trigger_admin_action(tapped_action)
+                    self.disarm_admin_action()
                 else:
-                    epd.displayPartial_Wait(epd.getbuffer(image))
+                    self.arm_admin_action(tapped_action, now)
+                    LOGGER.warning(
+                        "Admin action '%s' armed. Tap CONFIRM on the right within %.0fs.",
+                        tapped_action,
+                        ADMIN_CONFIRM_WINDOW_SECONDS,
+                    )
+                self.request_redraw()
+
+
+def trace_runtime(epd, gt):
+    # Driver-level spans, installed only when tracing is on.
+    for name in (
+        "init",
+        "displayPartBaseImage",
+        "loadBaseImage",
+        "displayPartial_Wait",
+        "displayPartial_Window",
+        "Clear",
+        "sleep",
+        "ReadBusy",
+    ):
+        tracing.wrap(epd, name, f"epd.{name}")
+    tracing.wrap(gt, "GT_Scan", "touch.GT_Scan")
+    # send_data2() carries the bulk RAM-plane transfers; single command and
+    # data bytes go through send_command()/send_data() and stay unwrapped.
+    tracing.wrap(epd, "send_data2", "epd.spi")
+
+
+def observe_busy_waits(epd):
+    read_busy = getattr(epd, "ReadBusy", None)
+    if read_busy is None:
+        return
+    histogram = _METRICS["busy_wait"]
+
+    def timed_read_busy():
+        started = time.perf_counter()
+        try:
+            return read_busy()
+        finally:
+            histogram.observe(time.perf_counter() - started)
 
-                next_update_at = now + UPDATE_INTERVAL_SECONDS
-                force_redraw = False
+    epd.ReadBusy = timed_read_busy
 
-            int_is_low = gt.digital_read(gt.INT) == 0
-            if int_is_low:
-                gt_dev.Touch = 1
-                gt.GT_Scan(gt_dev, gt_old)
-            else:
-                touch_latched = False
 
-            if gt_dev.TouchpointFlag:
-                gt_dev.TouchpointFlag = 0
-                raw_x = gt_dev.X[0]
-                raw_y = gt_dev.Y[0]
-                x, y = raw_touch_to_landscape(raw_x, raw_y)
+def start_metrics_server(address, loop):
+    metrics.REGISTRY.callback("infoink_loop_wakeups_total", "Event loop wakeups.", lambda: loop.wakeups, "counter")
+    try:
+        host, port = metrics.parse_address(address)
+        server = metrics.MetricsServer(host, port)
+        server.start()
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Metrics endpoint on %s unavailable: %s", address, exc)
+        return None
+    return server
 
-                if (
-                    current_page == ADMIN_PAGE_INDEX
-                    and armed_admin_action
-                    and x >= SIDEBAR_X0
-                ):
-                    touch_latched = True
-                    if is_inside(ADMIN_CONFIRM_BUTTON, x, y) and now <= armed_admin_expires_at:
-                        trigger_admin_action(armed_admin_action)
-                    else:
-                        LOGGER.warning("Admin action canceled (confirmation zone not tapped).")
-                    armed_admin_action = ""
-                    force_redraw = True
-                    time.sleep(TOUCH_POLL_ACTIVE_SECONDS if int_is_low else TOUCH_POLL_IDLE_SECONDS)
-                    continue
 
-                if (
-                    not touch_latched
-                    and x >= SIDEBAR_X0
-                    and (now - last_page_touch) > TOUCH_DEBOUNCE_SECONDS
-                ):
-                    if is_inside(UP_BUTTON, x, y):
-                        current_page = (current_page - 1) % len(PAGES)
-                        force_redraw = True
-                        last_page_touch = now
-                        touch_latched = True
-                        armed_admin_action = ""
-                    elif is_inside(DOWN_BUTTON, x, y):
-                        current_page = (current_page + 1) % len(PAGES)
-                        force_redraw = True
-                        last_page_touch = now
-                        touch_latched = True
-                        armed_admin_action = ""
-
-                if current_page == ADMIN_PAGE_INDEX and x < SIDEBAR_X0:
-                    tapped_action = ""
-                    if is_inside(ADMIN_REBOOT_BUTTON, x, y):
-                        tapped_action = "reboot"
-                    elif is_inside(ADMIN_SHUTDOWN_BUTTON, x, y):
-                        tapped_action = "shutdown"
-
-                    if tapped_action:
-                        touch_latched = True
-                        if (
-                            armed_admin_action == tapped_action
-                            and now <= armed_admin_expires_at
-                        ):
-                            trigger_admin_action(tapped_action)
-                            armed_admin_action = ""
-                            force_redraw = True
-                        else:
-                            armed_admin_action = tapped_action
-                            armed_admin_expires_at = now + ADMIN_CONFIRM_WINDOW_SECONDS
-                            LOGGER.warning(
-                                "Admin action '%s' armed. Tap CONFIRM on the right within %.0fs.",
-                                tapped_action,
-                                ADMIN_CONFIRM_WINDOW_SECONDS,
-                            )
-                            force_redraw = True
-
-            if armed_admin_action and now > armed_admin_expires_at:
-                armed_admin_action = ""
-                force_redraw = True
-
-            time.sleep(TOUCH_POLL_ACTIVE_SECONDS if int_is_low else TOUCH_POLL_IDLE_SECONDS)
+def start_config_watcher(path, loop, app):
+    def apply(values):
+        loop.call_soon_threadsafe(lambda: app.apply_config(values))
+
+    try:
+        watcher = config.ConfigWatcher(path, load_config, apply)
+        watcher.start()
+    except OSError as exc:
+        LOGGER.warning("Config reload unavailable (%s); restart to apply changes to %s", exc, path)
+        return None
+    return watcher
+
+
+def start_control_server(app, loop, unix_path, tcp_address):
+    # Imported lazily so units without the control API never load it.
+    from control import ControlServer, MessageBoard
+
+    _CONTROL["board"] = MessageBoard()
+    _CONTROL["target"] = app
+    try:
+        address = metrics.parse_address(tcp_address) if tcp_address else None
+        return ControlServer(loop, app.on_control_request, unix_path, address)
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Control API unavailable: %s", exc)
+        return None
+
+
+class RemotePanels:
+    # Stands in for the single MonitorApp when the config watcher or the
+    # control API serve every panel of a render host.
+    def __init__(self, loop):
+        self.loop = loop
+        self.host = None
+        self._watchdog_interval = None
+
+    def apps(self):
+        return self.host.apps() if self.host is not None else []
+
+    def start(self):
+        if "wifi" not in _PROVIDERS and subscribe_wifi_link_events():
+            self.loop.add_reader(_NL80211["client"].events_fileno(), self.on_wifi_link_event)
+        route_events = subscribe_route_events() if "ipv4" not in _PROVIDERS else None
+        if route_events is not None:
+            self.loop.add_reader(route_events.fileno(), self.on_route_event)
+        watchdog_interval = sd_notify.watchdog_interval_seconds()
+        if watchdog_interval:
+            self._watchdog_interval = watchdog_interval / 2
+            self.loop.call_at(self.loop.clock(), self.on_watchdog)
+
+    def on_wifi_link_event(self):
+        if poll_wifi_link_events():
+            self._push_pages([WIFI_PAGE_INDEX])
+
+    def on_route_event(self):
+        self._push_pages(poll_route_events())
+
+    def _push_pages(self, pages):
+        # Each provider is re-read once, and only if some panel shows it.
+        apps = self.apps()
+        now = self.loop.clock()
+        changed = [
+            page for page in pages if any(app.current_page == page for app in apps) and pushed_page_changed(page, now)
+        ]
+        for app in apps:
+            if app.current_page in changed:
+                app.on_pushed_update()
+
+    def on_watchdog(self):
+        # One stuck panel withholds the ping; no panels at all is fine.
+        now = self.loop.clock()
+        overdue = max((app.redraw_overdue(now) or 0.0 for app in self.apps()), default=0.0)
+        if overdue:
+            LOGGER.warning("No frame presented for %.1fs; withholding watchdog ping", overdue)
+        else:
+            sd_notify.notify("WATCHDOG=1")
+        self.loop.call_at(now + self._watchdog_interval, self.on_watchdog)
+
+    def apply_config(self, values):
+        changed = apply_config(values)
+        for app in self.apps():
+            app.on_config_changed(changed)
+
+    def on_control_request(self, request):
+        board = _CONTROL["board"]
+        version = board.version
+        result = board.handle(request, self.loop.clock())
+        if board.version != version:
+            for app in self.apps():
+                app.on_control_update()
+        return result
+
+    def clear_overlay(self, message_id):
+        _CONTROL["board"].clear(message_id)
+        for app in self.apps():
+            app.on_control_update(immediate=True)
+
+
+def start_remote_panel(name, link, loop, fonts):
+    from panel_link import RemoteEPD, RemoteTouch, TouchPoints
+
+    epd = RemoteEPD(link, *link.panel_size)
+    gt = RemoteTouch(link)
+    epd.init(epd.FULL_UPDATE)
+    # Admin actions would reboot or power off the render host, not the
+    # panel's own machine.
+    app = MonitorApp(epd, gt, TouchPoints(), TouchPoints(), loop, fonts, hidden_pages=frozenset({ADMIN_PAGE_INDEX}))
+    app.start(system_events=False)
+    sd_notify.notify(f"STATUS=Rendering for {name}")
+    return app
+
+
+def exit_remote_panel(app, exit_mode):
+    if exit_mode == EXIT_MODE_KEEP:
+        app.epd.sleep(settle_ms=KEEP_EXIT_SLEEP_SETTLE_MS)
+    else:
+        app.epd.init(app.epd.FULL_UPDATE)
+        app.epd.Clear(0xFF)
+        app.epd.sleep()
+
+
+def run_render_host(
+    address,
+    panel_names=None,
+    state_dir=None,
+    exit_mode=EXIT_MODE_CLEAR,
+    trace_path=None,
+    metrics_address=None,
+    config_path=None,
+    control_socket=None,
+    control_address=None,
+):
+    # Imported lazily: only render hosts listen for panels.
+    from render_host import RenderHost
+
+    open_history_store(state_dir or default_state_dir())
+    fonts = (load_font(14), load_font(12), load_font(10))
+    loop = EventLoop()
+    try:
+        signal.signal(signal.SIGTERM, lambda *_: loop.call_soon_threadsafe(loop.stop))
+        if trace_path:
+            signal.signal(signal.SIGUSR1, lambda *_: loop.call_soon_threadsafe(lambda: tracing.dump(trace_path)))
+    except ValueError:
+        pass
+    panels = RemotePanels(loop)
+    host = config_watcher = control_server = None
+    metrics_server = start_metrics_server(metrics_address, loop) if metrics_address else None
+
+    try:
+        try:
+            bind_host, port = metrics.parse_address(address)
+            panels.host = host = RenderHost(
+                loop,
+                bind_host,
+                port,
+                lambda name, link: start_remote_panel(name, link, loop, fonts),
+                (DISPLAY_HEIGHT, DISPLAY_WIDTH),
+                panel_names,
+            )
+        except (OSError, ValueError) as exc:
+            raise SystemExit(f"Render host on {address} unavailable: {exc}")
+        panels.start()
+        if config_path:
+            config_watcher = start_config_watcher(config_path, loop, panels)
+        if control_socket or control_address:
+            control_server = start_control_server(panels, loop, control_socket, control_address)
+        sd_notify.notify("READY=1", "STATUS=Waiting for panels")
+        loop.run_forever()
+        LOGGER.info("Exiting...")
     except KeyboardInterrupt:
         LOGGER.info("Exiting...")
     finally:
+        sd_notify.notify("STOPPING=1")
+        if host is not None:
+            host.close(lambda app: exit_remote_panel(app, exit_mode))
+        if config_watcher is not None:
+            config_watcher.stop()
+        if control_server is not None:
+            control_server.close()
+        loop.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if _NL80211["client"] is not None:
+            _NL80211["client"].close()
+            _NL80211["client"] = None
+        close_route_events()
+        close_system_vitals()
+        close_throughput_monitor()
+        close_history_store()
+        if trace_path:
+            tracing.dump(trace_path)
+
+
+def log_startup_timings(startup_timings):
+    total = sum(seconds for _, seconds in startup_timings)
+    LOGGER.info(
+        "Startup: first frame after %.0f ms (%s)",
+        total * 1000,
+        ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in startup_timings),
+    )
+
+
+def run(
+    simulator=False,
+    simulator_host="127.0.0.1",
+    simulator_port=8765,
+    state_dir=None,
+    exit_mode=EXIT_MODE_CLEAR,
+    replay=None,
+    trace_path=None,
+    metrics_address=None,
+    config_path=None,
+    control_socket=None,
+    control_address=None,
+    split_panel=False,
+):
+    startup_timings = [("imports", time.monotonic() - _IMPORTS_STARTED_AT)]
+    stage_started_at = time.monotonic()
+
+    def mark(stage):
+        nonlocal stage_started_at
+        now = time.monotonic()
+        startup_timings.append((stage, now - stage_started_at))
+        stage_started_at = now
+
+    epd, gt, gt_dev, gt_old, sim_server = create_runtime(simulator, simulator_host, simulator_port, replay, split_panel)
+    mark("runtime")
+    if simulator:
+        # Anyone who can reach the simulator's /touch endpoint can tap
+        # Reboot and CONFIRM; that must not reboot the dev machine.
+        configure_admin_actions(log_admin_action)
+    if metrics_address:
+        observe_busy_waits(epd)
+    if tracing.enabled():
+        trace_runtime(epd, gt)
+    state_dir = state_dir or default_state_dir()
+    open_history_store(state_dir)
+    panel_state_file = panel_state_path(state_dir)
+    warm_state = load_panel_state(panel_state_file, epd.width, epd.height)
+    if warm_state is not None:
+        # Consume it: after a crash the panel may show a newer frame.
+        discard_panel_state(panel_state_file)
+        LOGGER.info("Warm start: reusing the frame left on the panel")
+    fonts = (load_font(14), load_font(12), load_font(10))
+    loop = EventLoop() if replay is None else replay.loop
+    try:
+        signal.signal(signal.SIGTERM, lambda *_: loop.call_soon_threadsafe(loop.stop))
+        if trace_path:
+            signal.signal(signal.SIGUSR1, lambda *_: loop.call_soon_threadsafe(lambda: tracing.dump(trace_path)))
+    except ValueError:
+        pass
+    mark("state_and_fonts")
+    app = None
+    config_watcher = None
+    control_server = None
+    metrics_server = start_metrics_server(metrics_address, loop) if metrics_address else None
+
+    try:
+        if replay is not None:
+            LOGGER.info("Replaying %s headless against a virtual clock", replay.script_path)
+        elif split_panel:
+            LOGGER.info("Rendering for a separate panel process (%s)", "simulator" if simulator else "hardware")
+        elif simulator:
+            LOGGER.info("Initializing simulator-backed display + touch")
+        else:
+            LOGGER.info("Initializing Waveshare 2.13 V4 display + touch")
+
+        epd.init(epd.FULL_UPDATE)
+        mark("display_init")
+        gt.GT_Init()
+        mark("touch_init")
+
+        app = MonitorApp(epd, gt, gt_dev, gt_old, loop, fonts)
+        app.start(startup_timings, warm_state)
+        log_startup_timings(startup_timings)
+        if control_socket or control_address:
+            control_server = start_control_server(app, loop, control_socket, control_address)
+        if config_path:
+            config_watcher = start_config_watcher(config_path, loop, app)
+        sd_notify.notify("READY=1", f"STATUS=Showing {PAGES[app.current_page]}")
+        loop.run_forever()
+        LOGGER.info("Exiting...")
+    except KeyboardInterrupt:
+        LOGGER.info("Exiting...")
+    finally:
+        sd_notify.notify("STOPPING=1")
         try:
-            epd.init(epd.FULL_UPDATE)
-            epd.Clear(0xFF)
-            epd.sleep()
+            if exit_mode == EXIT_MODE_KEEP and app is not None and app.last_buffer is not None:
+                save_panel_state(panel_state_file, app.last_buffer, app.update_count, epd.width, epd.height)
+                epd.sleep(settle_ms=KEEP_EXIT_SLEEP_SETTLE_MS)
+            else:
+                epd.init(epd.FULL_UPDATE)
+                epd.Clear(0xFF)
+                epd.sleep()
         finally:
+            if config_watcher is not None:
+                config_watcher.stop()
+            if control_server is not None:
+                control_server.close()
             epd.Dev_exit()
+            loop.close()
             if sim_server is not None:
                 sim_server.stop()
+            if metrics_server is not None:
+                metrics_server.stop()
+            if _NL80211["client"] is not None:
+                _NL80211["client"].close()
+                _NL80211["client"] = None
+            close_route_events()
+            close_system_vitals()
+            close_throughput_monitor()
+            close_history_store()
+            if trace_path:
+                tracing.dump(trace_path)
 
 
 def parse_args(argv):
@@ -391,16 +1921,185 @@ def parse_args(argv):
     parser.add_argument("--simulator", action="store_true", help="run without GPIO and serve localhost simulator")
     parser.add_argument("--simulator-port", type=int, default=8765, help="simulator HTTP port (default: 8765)")
     parser.add_argument("--simulator-host", default="127.0.0.1", help="simulator bind host (default: 127.0.0.1)")
+    parser.add_argument(
+        "--clock-mode",
+        choices=sorted(CLOCK_MODES),
+        help="clock page resolution; updates land on wall-clock boundaries (default: seconds)",
+    )
+    parser.add_argument(
+        "--prerender-pages",
+        type=int,
+        help=f"number of adjacent pages kept prerendered for instant navigation (default: {PRERENDER_MAX_PAGES}, 0 disables)",
+    )
+    parser.add_argument(
+        "--idle-sleep-minutes",
+        type=float,
+        help=f"put the panel into deep sleep after this long without touches or content changes "
+        f"(default: {IDLE_SLEEP_SECONDS / 60:.0f}, 0 disables)",
+    )
+    parser.add_argument(
+        "--exit-mode",
+        choices=(EXIT_MODE_CLEAR, EXIT_MODE_KEEP),
+        default=EXIT_MODE_CLEAR,
+        help="on exit, clear the panel or keep the last frame on screen and reuse it on the next start (default: clear)",
+    )
+    parser.add_argument(
+        "--state-dir",
+        help="directory for persistent state such as metrics history (default: $STATE_DIRECTORY or ~/.local/state/infoink)",
+    )
+    parser.add_argument(
+        "--include-interface",
+        action="append",
+        metavar="GLOB",
+        help="only show interfaces matching GLOB (repeatable, default: all)",
+    )
+    parser.add_argument(
+        "--exclude-interface",
+        action="append",
+        metavar="GLOB",
+        help="hide interfaces matching GLOB (repeatable, replaces the default container/bridge excludes)",
+    )
+    parser.add_argument(
+        "--config",
+        metavar="PATH",
+        help="TOML or JSON settings file, reapplied without a restart whenever it changes (overrides the flags above)",
+    )
+    parser.add_argument(
+        "--control-socket",
+        metavar="PATH",
+        help="accept messages and alerts from local services on this Unix socket (adds a Messages page)",
+    )
+    parser.add_argument(
+        "--control-address",
+        metavar="[HOST:]PORT",
+        help="also accept control requests over TCP (host defaults to 127.0.0.1; off by default)",
+    )
+    parser.add_argument(
+        "--control-coalesce-ms",
+        type=float,
+        help=f"redraw once control updates have been quiet this long (default: {CONTROL_COALESCE_SECONDS * 1000:.0f})",
+    )
+    parser.add_argument(
+        "--control-latency-ms",
+        type=float,
+        help=f"but never later than this after the first update of a burst (default: {CONTROL_LATENCY_BUDGET_SECONDS * 1000:.0f})",
+    )
+    parser.add_argument(
+        "--split-panel",
+        action="store_true",
+        help="drive the display and touch from a separate panel process fed through shared memory",
+    )
+    parser.add_argument(
+        "--render-host",
+        metavar="[HOST:]PORT",
+        help="render for remote panels (panel_daemon.py --connect) instead of a local one; host defaults to 127.0.0.1",
+    )
+    parser.add_argument(
+        "--panel-name",
+        action="append",
+        metavar="NAME",
+        help="with --render-host, only accept panels with this name (repeatable, default: any)",
+    )
+    parser.add_argument(
+        "--panel-timing",
+        metavar="MODEL",
+        help="simulated panel timing: v4 (datasheet model with ghosting, the default), instant, "
+        "or a JSON file of measured values",
+    )
+    parser.add_argument(
+        "--metrics-address",
+        metavar="[HOST:]PORT",
+        help="serve Prometheus metrics at http://HOST:PORT/metrics (host defaults to 127.0.0.1; off by default)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="record per-stage spans and write them as Chrome/Perfetto trace JSON on SIGUSR1 and at exit",
+    )
+    parser.add_argument(
+        "--trace-spans",
+        type=int,
+        default=tracing.DEFAULT_CAPACITY,
+        help=f"number of most recent spans kept for --trace (default: {tracing.DEFAULT_CAPACITY})",
+    )
+    parser.add_argument(
+        "--headless-replay",
+        metavar="SCRIPT",
+        help="replay a JSON script of touches and provider values against a virtual clock, without HTTP or hardware",
+    )
+    parser.add_argument(
+        "--replay-log",
+        default="replay.frames",
+        help="frame log written by --headless-replay (default: replay.frames)",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv=None):
     args = parse_args(sys.argv[1:] if argv is None else argv)
-    run(
-        simulator=args.simulator,
-        simulator_host=args.simulator_host,
-        simulator_port=args.simulator_port,
-    )
+    configure_interface_filters(args.include_interface, args.exclude_interface)
+    configure_clock_mode(args.clock_mode)
+    configure_prerender(args.prerender_pages)
+    configure_idle_sleep(args.idle_sleep_minutes)
+    configure_panel_timing(args.panel_timing)
+    if args.control_socket or args.control_address:
+        configure_control(args.control_coalesce_ms, args.control_latency_ms)
+    if args.config:
+        try:
+            apply_config(load_config(args.config))
+        except (OSError, ValueError) as exc:
+            raise SystemExit(f"Cannot load config {args.config}: {exc}")
+    if args.trace:
+        tracing.enable(max(1, args.trace_spans))
+
+    replay = None
+    if args.headless_replay and args.split_panel:
+        raise SystemExit("--split-panel cannot be combined with --headless-replay")
+    if args.render_host:
+        if args.headless_replay or args.split_panel or args.simulator:
+            raise SystemExit("--render-host drives remote panels; run the simulator on the panel side instead")
+        run_render_host(
+            args.render_host,
+            panel_names=args.panel_name,
+            state_dir=args.state_dir,
+            exit_mode=args.exit_mode,
+            trace_path=args.trace,
+            metrics_address=args.metrics_address,
+            config_path=args.config,
+            control_socket=args.control_socket,
+            control_address=args.control_address,
+        )
+        return
+    if args.headless_replay:
+        from replay import ReplaySession, load_replay_script
+
+        try:
+            script = load_replay_script(args.headless_replay)
+        except (OSError, ValueError) as exc:
+            raise SystemExit(f"Cannot load replay script {args.headless_replay}: {exc}")
+        replay = ReplaySession(script, args.headless_replay, args.replay_log)
+        configure_clocks(replay.clock.monotonic, replay.clock.wall)
+        configure_providers(**replay.providers())
+        configure_admin_actions(replay.record_admin_action)
+
+    try:
+        run(
+            simulator=args.simulator,
+            simulator_host=args.simulator_host,
+            simulator_port=args.simulator_port,
+            state_dir=replay.state_dir if replay is not None else args.state_dir,
+            exit_mode=args.exit_mode,
+            replay=replay,
+            trace_path=args.trace,
+            metrics_address=args.metrics_address,
+            config_path=args.config,
+            control_socket=args.control_socket,
+            control_address=args.control_address,
+            split_panel=args.split_panel,
+        )
+    finally:
+        if replay is not None:
+            replay.finish()
 
 
 if __name__ == "__main__":
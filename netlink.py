@@ -0,0 +1,365 @@
+import errno
+import os
+import socket
+import struct
+import time
+
+NETLINK_GENERIC = 16
+# Requests run on the render loop; a kernel that never answers must not
+# hang it.
+NETLINK_REQUEST_TIMEOUT_SECONDS = 1.0
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+NLMSG_HDR = struct.Struct("=IHHII")
+GENLMSG_HDR = struct.Struct("=BBH")
+NLA_HDR = struct.Struct("=HH")
+
+NLM_F_REQUEST = 0x01
+NLM_F_MULTI = 0x02
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+
+NLMSG_NOOP = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLA_TYPE_MASK = 0x3FFF
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_CONNECT = 46
+NL80211_CMD_ROAM = 47
+NL80211_CMD_DISCONNECT = 48
+
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_BSS = 47
+NL80211_ATTR_SSID = 52
+
+NL80211_BSS_BSSID = 1
+NL80211_BSS_INFORMATION_ELEMENTS = 6
+NL80211_BSS_STATUS = 9
+NL80211_BSS_STATUS_ASSOCIATED = 1
+
+WLAN_EID_SSID = 0
+
+NL80211_LINK_EVENTS = (NL80211_CMD_CONNECT, NL80211_CMD_ROAM, NL80211_CMD_DISCONNECT)
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def pack_attr(attr_type, payload):
+    header = NLA_HDR.pack(NLA_HDR.size + len(payload), attr_type)
+    padding = b"\0" * (_align(len(payload)) - len(payload))
+    return header + payload + padding
+
+
+def parse_attrs(data, offset=0, end=None):
+    attrs = {}
+    end = len(data) if end is None else end
+    while offset + NLA_HDR.size <= end:
+        length, attr_type = NLA_HDR.unpack_from(data, offset)
+        if length < NLA_HDR.size or offset + length > end:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = bytes(data[offset + NLA_HDR.size:offset + length])
+        offset += _align(length)
+    return attrs
+
+
+def parse_messages(data):
+    messages = []
+    offset = 0
+    while offset + NLMSG_HDR.size <= len(data):
+        length, msg_type, flags, seq, _ = NLMSG_HDR.unpack_from(data, offset)
+        if length < NLMSG_HDR.size or offset + length > len(data):
+            break
+        messages.append((msg_type, flags, seq, bytes(data[offset + NLMSG_HDR.size:offset + length])))
+        offset += _align(length)
+    return messages
+
+
+def parse_genl(payload):
+    cmd, _, _ = GENLMSG_HDR.unpack_from(payload, 0)
+    return cmd, parse_attrs(payload, GENLMSG_HDR.size)
+
+
+def ssid_from_ies(ies):
+    offset = 0
+    while offset + 2 <= len(ies):
+        eid = ies[offset]
+        length = ies[offset + 1]
+        if eid == WLAN_EID_SSID:
+            return ies[offset + 2:offset + 2 + length]
+        offset += 2 + length
+    return b""
+
+
+def decode_ssid(raw):
+    return raw.rstrip(b"\0").decode("utf-8", errors="replace")
+
+
+def parse_family(payload):
+    # CTRL_CMD_GETFAMILY reply -> (family id, {multicast group name: id}).
+    _, family = parse_genl(payload)
+    family_id = struct.unpack("=H", family[CTRL_ATTR_FAMILY_ID][:2])[0]
+
+    groups = {}
+    groups_raw = family.get(CTRL_ATTR_MCAST_GROUPS, b"")
+    for group_raw in parse_attrs(groups_raw).values():
+        group = parse_attrs(group_raw)
+        if CTRL_ATTR_MCAST_GRP_NAME in group and CTRL_ATTR_MCAST_GRP_ID in group:
+            group_name = group[CTRL_ATTR_MCAST_GRP_NAME].rstrip(b"\0").decode("ascii")
+            groups[group_name] = struct.unpack("=I", group[CTRL_ATTR_MCAST_GRP_ID][:4])[0]
+    return family_id, groups
+
+
+def link_events(payloads):
+    changes = []
+    for payload in payloads:
+        cmd, attrs = parse_genl(payload)
+        if cmd not in NL80211_LINK_EVENTS:
+            continue
+        ifindex = struct.unpack("=I", attrs[NL80211_ATTR_IFINDEX][:4])[0] if NL80211_ATTR_IFINDEX in attrs else 0
+        changes.append((cmd, ifindex))
+    return changes
+
+
+def associated_bss_from_scan(payloads):
+    for payload in payloads:
+        _, attrs = parse_genl(payload)
+        bss_raw = attrs.get(NL80211_ATTR_BSS)
+        if bss_raw is None:
+            continue
+        bss = parse_attrs(bss_raw)
+        status = bss.get(NL80211_BSS_STATUS)
+        if status is None or struct.unpack("=I", status[:4])[0] != NL80211_BSS_STATUS_ASSOCIATED:
+            continue
+        bssid = ":".join(f"{b:02x}" for b in bss.get(NL80211_BSS_BSSID, b""))
+        ssid = decode_ssid(ssid_from_ies(bss.get(NL80211_BSS_INFORMATION_ELEMENTS, b"")))
+        return bssid, ssid
+    return None
+
+
+class GenericNetlinkSocket:
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._sock.bind((0, 0))
+        self._sock.settimeout(NETLINK_REQUEST_TIMEOUT_SECONDS)
+        self._seq = 0
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+    def setblocking(self, flag):
+        self._sock.setblocking(flag)
+
+    def add_membership(self, group_id):
+        self._sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group_id)
+
+    def request(self, family_id, cmd, attrs=b"", dump=False):
+        self._seq += 1
+        flags = NLM_F_REQUEST | NLM_F_ACK | (NLM_F_DUMP if dump else 0)
+        payload = GENLMSG_HDR.pack(cmd, 1, 0) + attrs
+        header = NLMSG_HDR.pack(NLMSG_HDR.size + len(payload), family_id, flags, self._seq, 0)
+        self._sock.send(header + payload)
+
+        # Replies to an earlier, timed-out request are skipped by seq; the
+        # deadline covers the whole exchange, not each datagram.
+        deadline = time.monotonic() + NETLINK_REQUEST_TIMEOUT_SECONDS
+        replies = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"no netlink reply within {NETLINK_REQUEST_TIMEOUT_SECONDS:.0f}s")
+            self._sock.settimeout(remaining)
+            data = self._sock.recv(65536)
+            for msg_type, _, seq, body in parse_messages(data):
+                if seq != self._seq:
+                    continue
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from("=i", body, 0)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return replies
+                if msg_type == NLMSG_DONE:
+                    return replies
+                if msg_type == NLMSG_NOOP:
+                    continue
+                replies.append(body)
+
+    def recv_events(self):
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return []
+        return [body for _, _, _, body in parse_messages(data)]
+
+
+class NL80211Client:
+    def __init__(self):
+        self._sock = GenericNetlinkSocket()
+        self._events = None
+        try:
+            self.family_id, self.mcast_groups = self._resolve_family("nl80211")
+        except OSError:
+            self._sock.close()
+            raise
+
+    def _resolve_family(self, name):
+        attrs = pack_attr(CTRL_ATTR_FAMILY_NAME, name.encode("ascii") + b"\0")
+        replies = self._sock.request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, attrs)
+        if not replies:
+            raise OSError(f"generic netlink family '{name}' not found")
+        return parse_family(replies[0])
+
+    def get_interface_ssid(self, ifindex):
+        attrs = pack_attr(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex))
+        replies = self._sock.request(self.family_id, NL80211_CMD_GET_INTERFACE, attrs)
+        for payload in replies:
+            _, reply = parse_genl(payload)
+            if NL80211_ATTR_SSID in reply:
+                return decode_ssid(reply[NL80211_ATTR_SSID])
+        return ""
+
+    def get_associated_bss(self, ifindex):
+        attrs = pack_attr(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex))
+        replies = self._sock.request(self.family_id, NL80211_CMD_GET_SCAN, attrs, dump=True)
+        return associated_bss_from_scan(replies)
+
+    def get_ssid(self, ifindex):
+        try:
+            ssid = self.get_interface_ssid(ifindex)
+        except TimeoutError:
+            # Treated as no SSID: the scan lookup below still gets its turn.
+            ssid = ""
+        if ssid:
+            return ssid
+        bss = self.get_associated_bss(ifindex)
+        return bss[1] if bss is not None else ""
+
+    def subscribe_link_events(self):
+        if self._events is not None:
+            return self._events
+        group_id = self.mcast_groups.get("mlme")
+        if group_id is None:
+            raise OSError("nl80211 'mlme' multicast group not available")
+        events = GenericNetlinkSocket()
+        try:
+            events.add_membership(group_id)
+            events.setblocking(False)
+        except OSError:
+            events.close()
+            raise
+        self._events = events
+        return events
+
+    def events_fileno(self):
+        return self._events.fileno() if self._events is not None else None
+
+    def poll_link_events(self):
+        if self._events is None:
+            return []
+        changes = []
+        while True:
+            try:
+                payloads = self._events.recv_events()
+            except OSError as exc:
+                # ENOBUFS: events were dropped, report an unknown link change.
+                if exc.errno == errno.ENOBUFS:
+                    changes.append((None, 0))
+                    continue
+                raise
+            if not payloads:
+                return changes
+            changes.extend(link_events(payloads))
+
+    def close(self):
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+        self._sock.close()
+
+
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+IFLA_IFNAME = 3
+IFLA_WIRELESS = 11
+IFA_LABEL = 3
+
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+
+ROUTE_ADDRESS_EVENTS = (RTM_NEWADDR, RTM_DELADDR)
+ROUTE_LINK_EVENTS = (RTM_NEWLINK, RTM_DELLINK)
+
+
+def route_events(data):
+    # rtnetlink datagram -> [(msg_type, ifindex, ifname or None)]. Wireless
+    # extension events arrive as RTM_NEWLINK carrying IFLA_WIRELESS; they
+    # report scans and the like, not a link change, and are dropped.
+    events = []
+    for msg_type, _, _, payload in parse_messages(data):
+        if msg_type in ROUTE_LINK_EVENTS and len(payload) >= IFINFOMSG.size:
+            ifindex = IFINFOMSG.unpack_from(payload, 0)[2]
+            attrs = parse_attrs(payload, IFINFOMSG.size)
+            if msg_type == RTM_NEWLINK and IFLA_WIRELESS in attrs:
+                continue
+            name = attrs.get(IFLA_IFNAME)
+        elif msg_type in ROUTE_ADDRESS_EVENTS and len(payload) >= IFADDRMSG.size:
+            ifindex = IFADDRMSG.unpack_from(payload, 0)[4]
+            name = parse_attrs(payload, IFADDRMSG.size).get(IFA_LABEL)
+        else:
+            continue
+        events.append((msg_type, ifindex, name.rstrip(b"\0").decode("utf-8", "replace") if name else None))
+    return events
+
+
+class RouteEventSocket:
+    def __init__(self, groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            self._sock.bind((0, groups))
+            self._sock.setblocking(False)
+        except OSError:
+            self._sock.close()
+            raise
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def poll(self):
+        events = []
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except BlockingIOError:
+                return events
+            except OSError as exc:
+                # ENOBUFS: events were dropped, report an unknown change.
+                if exc.errno == errno.ENOBUFS:
+                    events.append((None, 0, None))
+                    continue
+                raise
+            events.extend(route_events(data))
+
+    def close(self):
+        self._sock.close()
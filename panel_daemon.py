@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# Panel process for --split-panel, or a thin client of a remote render host
+# (--connect): owns the EPD and GT1151 and nothing else.
+# Keep imports minimal; PIL and the providers live in the renderer.
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import zlib
+
+from metrics import parse_address
+from panel_link import (
+    COMMAND,
+    EVENT,
+    EVENT_DONE,
+    EVENT_HELLO,
+    EVENT_RELEASE,
+    EVENT_TOUCH,
+    NO_SLOT,
+    OP_BASE,
+    OP_CLEAR,
+    OP_EXIT,
+    OP_INIT_FULL,
+    OP_INIT_PART,
+    OP_LOAD_BASE,
+    OP_PARTIAL,
+    OP_PARTIAL_WAIT,
+    OP_SLEEP,
+    OP_WINDOW,
+    FRAME_OPS,
+    REFRESH_OPS,
+    REMOTE_COMMAND,
+    REMOTE_HELLO,
+    REMOTE_MAGIC,
+    REMOTE_VERSION,
+    SharedFrameBuffer,
+    frame_length,
+    recv_exact,
+    xor_frames,
+)
+
+libdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "lib")
+if os.path.exists(libdir):
+    sys.path.append(libdir)
+
+logging.basicConfig(level=logging.INFO)
+LOGGER = logging.getLogger("panel_daemon")
+
+TOUCH_POLL_IDLE_SECONDS = 0.12
+TOUCH_POLL_ACTIVE_SECONDS = 0.03
+CRASH_SLEEP_SETTLE_MS = 100
+CONNECT_TIMEOUT_SECONDS = 5.0
+RECONNECT_MIN_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 30.0
+
+
+class PanelExecutor:
+    # Runs driver calls for a command stream and turns GT1151 scans into
+    # touch events. Transport-agnostic: frames arrive as buffers.
+    def __init__(self, epd, gt, gt_dev, gt_old, send_event):
+        self.epd = epd
+        self.gt = gt
+        self.gt_dev = gt_dev
+        self.gt_old = gt_old
+        self.send_event = send_event
+        self.touching = False
+        self.commands = 0
+
+    def run(self, op, arg, frame, window):
+        epd = self.epd
+        started = time.monotonic()
+        if op == OP_INIT_FULL:
+            epd.init(epd.FULL_UPDATE)
+        elif op == OP_INIT_PART:
+            epd.init(epd.PART_UPDATE)
+        elif op == OP_BASE:
+            epd.displayPartBaseImage(frame)
+        elif op == OP_LOAD_BASE:
+            epd.loadBaseImage(frame)
+        elif op == OP_PARTIAL:
+            epd.displayPartial(frame)
+        elif op == OP_PARTIAL_WAIT:
+            epd.displayPartial_Wait(frame)
+        elif op == OP_WINDOW:
+            epd.displayPartial_Window(frame, *window)
+        elif op == OP_CLEAR:
+            epd.Clear(arg)
+        elif op == OP_SLEEP:
+            epd.sleep(settle_ms=arg)
+        elif op != OP_EXIT:
+            LOGGER.warning("Ignoring unknown panel op %d", op)
+        return time.monotonic() - started
+
+    def done(self, seq, op, seconds):
+        self.commands += 1
+        micros = min(int(seconds * 1_000_000), 0xFFFFFFFF) if op in REFRESH_OPS else 0
+        self.send_event(EVENT_DONE, seq, 0, 0, micros)
+
+    def poll_touch(self):
+        if self.gt.digital_read(self.gt.INT) != 0:
+            if self.touching:
+                self.touching = False
+                self.send_event(EVENT_RELEASE, 0, 0, 0, 0)
+            return
+        self.gt_dev.Touch = 1
+        try:
+            self.gt.GT_Scan(self.gt_dev, self.gt_old)
+        except OSError as exc:
+            LOGGER.debug("Touch scan failed: %s", exc)
+            return
+        self.touching = True
+        if self.gt_dev.TouchpointFlag:
+            self.gt_dev.TouchpointFlag = 0
+            self.send_event(EVENT_TOUCH, 0, self.gt_dev.X[0], self.gt_dev.Y[0], 0)
+
+    def park(self):
+        # Keep the last frame on the glass and put the controller to sleep.
+        self.epd.sleep(settle_ms=CRASH_SLEEP_SETTLE_MS)
+        self.touching = False
+
+    def shutdown(self, crashed):
+        if crashed:
+            # The renderer is gone mid-session.
+            LOGGER.warning("Renderer disconnected; leaving the last frame on the panel")
+            self.park()
+        self.epd.Dev_exit()
+
+    def wait_timeout(self, edge_wakeup):
+        if self.touching:
+            return TOUCH_POLL_ACTIVE_SECONDS
+        return None if edge_wakeup else TOUCH_POLL_IDLE_SECONDS
+
+
+def create_panel(args):
+    if args.simulator:
+        # The simulator needs the renderer's layout; it loads PIL anyway.
+        from monitor import DISPLAY_HEIGHT, DISPLAY_WIDTH, DOWN_BUTTON, UP_BUTTON
+        from simulator_backend import create_simulator_runtime
+
+        return create_simulator_runtime(
+            args.simulator_host,
+            args.simulator_port,
+            DISPLAY_WIDTH,
+            DISPLAY_HEIGHT,
+            UP_BUTTON,
+            DOWN_BUTTON,
+            args.panel_timing,
+        )
+
+    from TP_lib import epd2in13_V4, gt1151
+
+    return epd2in13_V4.EPD(), gt1151.GT1151(), gt1151.GT_Development(), gt1151.GT_Development(), None
+
+
+def watch_touch_edges(gt):
+    wake_read, wake_write = os.pipe()
+    os.set_blocking(wake_read, False)
+    os.set_blocking(wake_write, False)
+
+    def wake():
+        try:
+            os.write(wake_write, b"\0")
+        except BlockingIOError:
+            pass
+
+    try:
+        gt.set_int_callback(wake)
+    except (AttributeError, OSError) as exc:
+        LOGGER.warning("Touch INT edge events unavailable (%s); polling touch", exc)
+        return wake_read, wake, False
+    return wake_read, wake, True
+
+
+def drain_wakeups(wake_read):
+    try:
+        while os.read(wake_read, 512):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def serve(sock, framebuffer, executor, edge_wakeup, wake_read):
+    # Returns True after an orderly exit, False when the renderer vanished.
+    while True:
+        ready, _, _ = select.select([sock, wake_read], [], [], executor.wait_timeout(edge_wakeup))
+        if wake_read in ready:
+            drain_wakeups(wake_read)
+        if sock in ready:
+            data = sock.recv(COMMAND.size)
+            if len(data) < COMMAND.size:
+                return False
+            seq, op, slot, arg = COMMAND.unpack(data)
+            frame = window = None
+            if slot != NO_SLOT:
+                try:
+                    frame, window = framebuffer.read(slot, seq)
+                except ValueError as exc:
+                    # A renderer bug must not take the panel down with it:
+                    # skip the frame but ack, so the renderer never stalls.
+                    LOGGER.error("Skipping panel op %d: %s", op, exc)
+                    executor.done(seq, op, 0.0)
+                    continue
+            try:
+                seconds = executor.run(op, arg, frame, window)
+            finally:
+                if frame is not None:
+                    frame.release()
+            executor.done(seq, op, seconds)
+            if op == OP_EXIT:
+                return True
+        executor.poll_touch()
+
+
+def serve_stream(sock, executor, edge_wakeup, wake_read, stopping):
+    # Remote variant of serve(): each frame arrives inline as a compressed
+    # XOR against the previous one. Returns True after an orderly exit or a
+    # local stop request, False when the render host vanished.
+    frame = b"\xff" * frame_length(executor.epd.width, executor.epd.height)
+    while not stopping:
+        ready, _, _ = select.select([sock, wake_read], [], [], executor.wait_timeout(edge_wakeup))
+        if wake_read in ready:
+            drain_wakeups(wake_read)
+        if sock in ready:
+            try:
+                seq, op, arg, x0, y0, x1, y1, length = REMOTE_COMMAND.unpack(recv_exact(sock, REMOTE_COMMAND.size))
+                if length:
+                    delta = zlib.decompress(recv_exact(sock, length))
+                    if len(delta) != len(frame):
+                        raise ValueError(f"frame delta of {len(delta)} bytes, expected {len(frame)}")
+                    frame = xor_frames(frame, delta)
+            except (OSError, EOFError):
+                return False
+            except (zlib.error, ValueError) as exc:
+                LOGGER.warning("Corrupt frame from the render host (%s); reconnecting", exc)
+                return False
+            seconds = executor.run(op, arg, frame if op in FRAME_OPS else None, (x0, y0, x1, y1))
+            executor.done(seq, op, seconds)
+            if op == OP_EXIT:
+                return True
+        executor.poll_touch()
+    return True
+
+
+def connect(address, name, panel_width, panel_height):
+    host, port = parse_address(address)
+    sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT_SECONDS)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        encoded = name.encode("utf-8")
+        sock.sendall(REMOTE_HELLO.pack(REMOTE_MAGIC, REMOTE_VERSION, panel_width, panel_height, len(encoded)) + encoded)
+        sock.settimeout(None)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def run_remote(args, epd, gt, gt_dev, gt_old):
+    # Thin client: keeps reconnecting to the render host until SIGTERM, so a
+    # host restart or a network blip only pauses the panel.
+    stopping = []
+    wake_read, wake, edge_wakeup = watch_touch_edges(gt)
+
+    def stop(*_):
+        stopping.append(True)
+        wake()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    sock = None
+
+    def send_event(kind, seq, x, y, micros):
+        try:
+            sock.sendall(EVENT.pack(kind, seq, x, y, micros))
+        except OSError:
+            pass
+
+    executor = PanelExecutor(epd, gt, gt_dev, gt_old, send_event)
+    delay = RECONNECT_MIN_SECONDS
+    while not stopping:
+        try:
+            sock = connect(args.connect, args.name, epd.width, epd.height)
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Render host %s unavailable (%s); retrying in %.0fs", args.connect, exc, delay)
+        else:
+            LOGGER.info("Connected to render host %s as %s", args.connect, args.name)
+            commands = executor.commands
+            try:
+                finished = serve_stream(sock, executor, edge_wakeup, wake_read, stopping)
+            finally:
+                sock.close()
+            if executor.commands == commands:
+                LOGGER.warning("Render host closed the connection; is %r an accepted panel name?", args.name)
+            else:
+                if not finished:
+                    LOGGER.warning("Render host disconnected; leaving the last frame on the panel")
+                if stopping or not finished:
+                    executor.park()
+                delay = RECONNECT_MIN_SECONDS
+        if stopping:
+            break
+        select.select([wake_read], [], [], delay)
+        drain_wakeups(wake_read)
+        delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+    executor.shutdown(crashed=False)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="infoink panel process (started by monitor.py --split-panel, or a thin client with --connect)"
+    )
+    parser.add_argument("--link-fd", type=int, help="command/event socket inherited from the renderer")
+    parser.add_argument("--fb-fd", type=int, help="shared frame buffer inherited from the renderer")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="drive this panel from a remote render host (monitor.py --render-host)")
+    parser.add_argument("--name", default=socket.gethostname(), help="panel name sent to the render host (default: hostname)")
+    parser.add_argument("--simulator", action="store_true", help="drive the simulator mocks instead of hardware")
+    parser.add_argument("--simulator-host", default="127.0.0.1")
+    parser.add_argument("--simulator-port", type=int, default=8765)
+    parser.add_argument("--panel-timing", default="v4")
+    args = parser.parse_args(argv)
+    if args.connect is None and (args.link_fd is None or args.fb_fd is None):
+        parser.error("either --connect or both --link-fd and --fb-fd are required")
+    if len(args.name.encode("utf-8")) > 255:
+        parser.error("--name is limited to 255 bytes")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.connect:
+        epd, gt, gt_dev, gt_old, sim_server = create_panel(args)
+        try:
+            gt.GT_Init()
+            run_remote(args, epd, gt, gt_dev, gt_old)
+        finally:
+            if sim_server is not None:
+                sim_server.stop()
+        return
+
+    # Shutdown is driven by the renderer (or its disappearance), so a refresh
+    # in progress always runs to completion.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    sock = socket.socket(fileno=args.link_fd)
+    epd, gt, gt_dev, gt_old, sim_server = create_panel(args)
+    framebuffer = SharedFrameBuffer(args.fb_fd, epd.width, epd.height)
+    os.close(args.fb_fd)
+
+    def send_event(kind, seq, x, y, micros):
+        try:
+            sock.send(EVENT.pack(kind, seq, x, y, micros))
+        except OSError:
+            pass
+
+    executor = PanelExecutor(epd, gt, gt_dev, gt_old, send_event)
+    gt.GT_Init()
+    wake_read, _, edge_wakeup = watch_touch_edges(gt)
+    send_event(EVENT_HELLO, 0, epd.width, epd.height, 0)
+    crashed = True
+    try:
+        crashed = not serve(sock, framebuffer, executor, edge_wakeup, wake_read)
+    finally:
+        executor.shutdown(crashed)
+        framebuffer.close()
+        sock.close()
+        if sim_server is not None:
+            sim_server.stop()
+
+
+if __name__ == "__main__":
+    main()
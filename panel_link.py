@@ -0,0 +1,507 @@
+import logging
+import mmap
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+LOGGER = logging.getLogger(__name__)
+
+FB_MAGIC = b"IIFB"
+FB_VERSION = 1
+# magic, version, panel width, panel height, frame length
+FB_HEADER = struct.Struct("<4sHHHI")
+# sequence number, dirty rectangle x0, y0, x1, y1
+SLOT_HEADER = struct.Struct("<IHHHH")
+# sequence number, op, slot, argument
+COMMAND = struct.Struct("<IBBH")
+# kind, sequence number, x, y, microseconds
+EVENT = struct.Struct("<BIHHI")
+# Remote panels (TCP): magic, version, panel width, panel height, name length
+REMOTE_MAGIC = b"IIRP"
+REMOTE_VERSION = 1
+REMOTE_HELLO = struct.Struct("<4sBHHB")
+# sequence number, op, argument, dirty rectangle x0, y0, x1, y1, payload length
+REMOTE_COMMAND = struct.Struct("<IBHHHHHI")
+REMOTE_SEND_TIMEOUT_SECONDS = 10.0
+REMOTE_POLL_SECONDS = 1.0
+REMOTE_OUTBOX_LIMIT = 1 << 20
+
+OP_INIT_FULL = 1
+OP_INIT_PART = 2
+OP_BASE = 3
+OP_LOAD_BASE = 4
+OP_PARTIAL = 5
+OP_PARTIAL_WAIT = 6
+OP_WINDOW = 7
+OP_CLEAR = 8
+OP_SLEEP = 9
+OP_EXIT = 10
+FRAME_OPS = (OP_BASE, OP_LOAD_BASE, OP_PARTIAL, OP_PARTIAL_WAIT, OP_WINDOW)
+REFRESH_OPS = (OP_PARTIAL, OP_PARTIAL_WAIT, OP_WINDOW)
+
+EVENT_HELLO = 1
+EVENT_DONE = 2
+EVENT_TOUCH = 3
+EVENT_RELEASE = 4
+
+NO_SLOT = 0xFF
+
+
+def frame_length(panel_width, panel_height):
+    return ((panel_width + 7) // 8) * panel_height
+
+
+def xor_frames(a, b):
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+def recv_exact(sock, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return bytes(data)
+
+
+class SharedFrameBuffer:
+    # Two frame slots behind a small header in one shared mapping. Each slot
+    # carries the sequence number of the command that filled it, so the
+    # panel side can tell a stale or half-written slot from the frame it was
+    # told to show.
+    def __init__(self, fd, panel_width=None, panel_height=None):
+        if panel_width is not None:
+            length = frame_length(panel_width, panel_height)
+            os.ftruncate(fd, FB_HEADER.size + 2 * (SLOT_HEADER.size + length))
+            self._map = mmap.mmap(fd, 0)
+            FB_HEADER.pack_into(self._map, 0, FB_MAGIC, FB_VERSION, panel_width, panel_height, length)
+        else:
+            self._map = mmap.mmap(fd, 0)
+        magic, version, self.width, self.height, self.frame_length = FB_HEADER.unpack_from(self._map, 0)
+        if magic != FB_MAGIC or version != FB_VERSION:
+            raise ValueError("not an infoink frame buffer")
+        self._view = memoryview(self._map)
+
+    def _offset(self, slot):
+        return FB_HEADER.size + slot * (SLOT_HEADER.size + self.frame_length)
+
+    def write(self, slot, seq, frame, window=(0, 0, 0, 0)):
+        offset = self._offset(slot)
+        # Invalidate first: a reader never pairs a new sequence number with
+        # an old frame.
+        SLOT_HEADER.pack_into(self._map, offset, 0, 0, 0, 0, 0)
+        start = offset + SLOT_HEADER.size
+        self._view[start:start + self.frame_length] = frame
+        SLOT_HEADER.pack_into(self._map, offset, seq, *window)
+
+    def read(self, slot, seq):
+        if slot not in (0, 1):
+            raise ValueError(f"no frame slot {slot}")
+        offset = self._offset(slot)
+        slot_seq, *window = SLOT_HEADER.unpack_from(self._map, offset)
+        if slot_seq != seq:
+            raise ValueError(f"slot {slot} holds frame {slot_seq}, expected {seq}")
+        start = offset + SLOT_HEADER.size
+        return self._view[start:start + self.frame_length], tuple(window)
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+
+
+class PanelLink:
+    # Renderer side of the link. Commands keep their order on the socket;
+    # at most one frame is queued behind the one being refreshed, so a slot
+    # is never rewritten while the panel process may still read it.
+    def __init__(self, sock, process=None):
+        self._sock = sock
+        self._process = process
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._acked = 0
+        self._closed = False
+        self.framebuffer = None
+        self.panel_size = None
+        self.last_refresh_seconds = None
+        self.touch = None
+        self.on_closed = None
+        self._hello = threading.Event()
+        self._reader = threading.Thread(target=self._read_events, name="panel-link", daemon=True)
+        self._reader.start()
+
+    def wait_ready(self, fb_fd, timeout=30.0):
+        if not self._hello.wait(timeout) or self.panel_size is None:
+            raise OSError("panel process did not start")
+        self.framebuffer = SharedFrameBuffer(fb_fd)
+
+    def _recv_event(self):
+        return self._sock.recv(EVENT.size)
+
+    def _read_events(self):
+        while True:
+            try:
+                data = self._recv_event()
+            except (OSError, EOFError):
+                data = b""
+            if len(data) < EVENT.size:
+                break
+            kind, seq, x, y, micros = EVENT.unpack(data)
+            if kind == EVENT_HELLO:
+                self.panel_size = (x, y)
+                self._hello.set()
+            elif kind == EVENT_DONE:
+                with self._cond:
+                    self._acked = seq
+                    if micros:
+                        self.last_refresh_seconds = micros / 1_000_000
+                    self._cond.notify_all()
+                    self._on_acked()
+            elif self.touch is not None:
+                self.touch.on_event(kind, x, y)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._hello.set()
+        if self.on_closed is not None:
+            self.on_closed()
+
+    def _on_acked(self):
+        return
+
+    def _wait_acked(self, seq, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._acked >= seq or self._closed, timeout)
+            if self._acked < seq:
+                raise OSError("panel process exited")
+
+    def _write_command(self, op, frame, window, arg):
+        slot = NO_SLOT
+        if frame is not None:
+            slot = self._seq % 2
+            self._wait_acked(self._seq - 2)
+            self.framebuffer.write(slot, self._seq, frame, window)
+        self._sock.send(COMMAND.pack(self._seq, op, slot, arg))
+
+    def send(self, op, frame=None, window=(0, 0, 0, 0), arg=0):
+        if self._closed:
+            raise OSError("panel process exited")
+        self._seq += 1
+        self._write_command(op, frame, window, arg)
+        return self._seq
+
+    def drain(self):
+        self._wait_acked(self._seq)
+
+    def close(self, timeout=10.0):
+        if not self._closed:
+            try:
+                self.send(OP_EXIT)
+                self.drain()
+            except OSError:
+                pass
+        self._sock.close()
+        if self._process is not None:
+            import subprocess
+
+            try:
+                self._process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self.framebuffer is not None:
+            self.framebuffer.close()
+            self.framebuffer = None
+
+
+class StreamPanelLink(PanelLink):
+    # Link to a thin client over TCP. Frames travel as a zlib-compressed XOR
+    # against the previous frame, so an unchanged region costs almost
+    # nothing. Served from a render host's loop, so nothing here blocks: a
+    # refresh sent while the previous one is unacknowledged is held, and a
+    # newer one replaces it, so a slow panel skips frames instead of queueing
+    # them. Bytes the socket will not take yet wait in an outbox that the
+    # reader thread flushes. A dead or stalled client is dropped instead of
+    # raising into the app.
+    def __init__(self, sock, name, panel_width, panel_height):
+        sock.setblocking(False)
+        self.name = name
+        self._outbox = bytearray()
+        self._inbox = bytearray()
+        self._stalled_since = None
+        # (seq, op, frame, window) of the refresh waiting for an ack
+        self._held = None
+        self._refresh_seq = 0
+        super().__init__(sock)
+        self.panel_size = (panel_width, panel_height)
+        self._previous = b"\xff" * frame_length(panel_width, panel_height)
+
+    def _recv_event(self):
+        while len(self._inbox) < EVENT.size:
+            with self._cond:
+                writing = [self._sock] if self._outbox else []
+            try:
+                readable, writable, _ = select.select([self._sock], writing, [], REMOTE_POLL_SECONDS)
+                if writable:
+                    with self._cond:
+                        self._flush()
+                if readable:
+                    chunk = self._sock.recv(4096)
+                    if not chunk:
+                        return b""
+                    self._inbox += chunk
+            except (BlockingIOError, InterruptedError):
+                continue
+            except ValueError:
+                # Closed under us by disconnect().
+                return b""
+            with self._cond:
+                stalled = self._stalled_since is not None and time.monotonic() - self._stalled_since > REMOTE_SEND_TIMEOUT_SECONDS
+            if stalled:
+                LOGGER.warning("Dropping panel %s: not reading for %.0fs", self.name, REMOTE_SEND_TIMEOUT_SECONDS)
+                return b""
+        event = bytes(self._inbox[:EVENT.size])
+        del self._inbox[:EVENT.size]
+        return event
+
+    def _write_command(self, op, frame, window, arg, seq=None):
+        seq = self._seq if seq is None else seq
+        payload = b""
+        if frame is not None:
+            frame = bytes(frame)
+            payload = zlib.compress(xor_frames(frame, self._previous))
+            self._previous = frame
+        if op in REFRESH_OPS:
+            self._refresh_seq = seq
+        self._outbox += REMOTE_COMMAND.pack(seq, op, arg, *window, len(payload)) + payload
+        if len(self._outbox) > REMOTE_OUTBOX_LIMIT:
+            raise OSError(f"{len(self._outbox)} bytes waiting to be sent")
+
+    def _flush(self):
+        while self._outbox:
+            try:
+                sent = self._sock.send(self._outbox)
+            except (BlockingIOError, InterruptedError):
+                break
+            del self._outbox[:sent]
+            self._stalled_since = None
+        if self._outbox and self._stalled_since is None:
+            self._stalled_since = time.monotonic()
+
+    def _hold(self, op, frame, window):
+        if self._held is not None:
+            _, held_op, _, held_window = self._held
+            # The held frame never reached the panel, so its changes must
+            # go out with this one.
+            if op == OP_WINDOW and held_op == OP_WINDOW:
+                window = (
+                    min(window[0], held_window[0]),
+                    min(window[1], held_window[1]),
+                    max(window[2], held_window[2]),
+                    max(window[3], held_window[3]),
+                )
+            elif op == OP_WINDOW:
+                op = held_op
+        self._held = (self._seq, op, bytes(frame), window)
+
+    def _release_held(self):
+        if self._held is not None:
+            seq, op, frame, window = self._held
+            self._held = None
+            self._write_command(op, frame, window, 0, seq)
+
+    def _on_acked(self):
+        if self._held is None or self._acked < self._refresh_seq:
+            return
+        try:
+            self._release_held()
+            self._flush()
+        except OSError as exc:
+            LOGGER.warning("Dropping panel %s: %s", self.name, exc)
+            self.disconnect()
+
+    def send(self, op, frame=None, window=(0, 0, 0, 0), arg=0):
+        if self._closed:
+            return self._seq
+        try:
+            with self._cond:
+                self._seq += 1
+                if op in REFRESH_OPS and self._acked < self._refresh_seq:
+                    self._hold(op, frame, window)
+                else:
+                    # Anything else keeps its place behind a held refresh.
+                    self._release_held()
+                    self._write_command(op, frame, window, arg)
+                self._flush()
+        except Exception as exc:
+            # Whatever went wrong, it must not reach the loop shared with
+            # the other panels.
+            LOGGER.warning("Dropping panel %s: %s", self.name, exc)
+            self.disconnect()
+        return self._seq
+
+    def drain(self):
+        try:
+            self._wait_acked(self._seq, REMOTE_SEND_TIMEOUT_SECONDS)
+        except OSError:
+            pass
+
+    def disconnect(self):
+        # The reader thread sees EOF and reports the panel closed.
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class RemoteEPD:
+    FULL_UPDATE = 0
+    PART_UPDATE = 1
+
+    def __init__(self, link, panel_width, panel_height):
+        self._link = link
+        self.width = panel_width
+        self.height = panel_height
+
+    @property
+    def last_refresh_seconds(self):
+        return self._link.last_refresh_seconds
+
+    def init(self, update):
+        self._link.send(OP_INIT_FULL if update == self.FULL_UPDATE else OP_INIT_PART)
+
+    def displayPartBaseImage(self, image):
+        self._link.send(OP_BASE, image)
+
+    def loadBaseImage(self, image):
+        self._link.send(OP_LOAD_BASE, image)
+
+    def displayPartial(self, image):
+        self._link.send(OP_PARTIAL, image)
+
+    def displayPartial_Wait(self, image):
+        self._link.send(OP_PARTIAL_WAIT, image)
+
+    def displayPartial_Window(self, image, x_start, y_start, x_end, y_end):
+        self._link.send(OP_WINDOW, image, (x_start, y_start, x_end, y_end))
+
+    def Clear(self, color):
+        self._link.send(OP_CLEAR, arg=color)
+
+    def ReadBusy(self):
+        self._link.drain()
+
+    def sleep(self, settle_ms=2000):
+        self._link.send(OP_SLEEP, arg=settle_ms)
+
+    def Dev_exit(self):
+        self._link.close()
+
+
+class RemoteTouch:
+    INT = 27
+
+    def __init__(self, link):
+        self._lock = threading.Lock()
+        self._points = []
+        self._pressed = False
+        self._callback = None
+        link.touch = self
+
+    def GT_Init(self):
+        return
+
+    def set_int_callback(self, callback):
+        self._callback = callback
+
+    def on_event(self, kind, x, y):
+        # Called on the link's reader thread, like a GPIO edge callback.
+        with self._lock:
+            if kind == EVENT_TOUCH:
+                self._pressed = True
+                self._points.append((x, y))
+            else:
+                self._pressed = False
+        callback = self._callback
+        if callback is not None:
+            callback()
+
+    def digital_read(self, pin):
+        if pin != self.INT:
+            return 1
+        with self._lock:
+            return 0 if self._pressed or self._points else 1
+
+    def GT_Scan(self, gt_dev, gt_old):
+        if gt_dev.Touch != 1:
+            return
+        gt_dev.Touch = 0
+        with self._lock:
+            point = self._points.pop(0) if self._points else None
+        if point is None:
+            gt_dev.TouchpointFlag = 0
+            return
+        gt_old.X[0] = gt_dev.X[0]
+        gt_old.Y[0] = gt_dev.Y[0]
+        gt_old.S[0] = gt_dev.S[0]
+        gt_dev.TouchpointFlag = 0x80
+        gt_dev.TouchCount = 1
+        gt_dev.X[0], gt_dev.Y[0] = point
+
+
+class TouchPoints:
+    def __init__(self):
+        self.Touch = 0
+        self.TouchpointFlag = 0
+        self.TouchCount = 0
+        self.Touchkeytrackid = [0, 1, 2, 3, 4]
+        self.X = [0, 1, 2, 3, 4]
+        self.Y = [0, 1, 2, 3, 4]
+        self.S = [0, 1, 2, 3, 4]
+
+
+def spawn_panel_process(simulator=False, simulator_host="127.0.0.1", simulator_port=8765, panel_timing="v4"):
+    # Imported here: the panel process itself never needs subprocess.
+    import subprocess
+
+    parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    fb_fd = os.memfd_create("infoink-frames", os.MFD_CLOEXEC)
+    args = [
+        sys.executable,
+        os.path.join(os.path.dirname(os.path.realpath(__file__)), "panel_daemon.py"),
+        "--link-fd",
+        str(child.fileno()),
+        "--fb-fd",
+        str(fb_fd),
+    ]
+    if simulator:
+        args += [
+            "--simulator",
+            "--simulator-host",
+            simulator_host,
+            "--simulator-port",
+            str(simulator_port),
+            "--panel-timing",
+            panel_timing,
+        ]
+    try:
+        # Own session: Ctrl-C reaches only the renderer, which then sends the
+        # exit sequence itself.
+        process = subprocess.Popen(args, pass_fds=(child.fileno(), fb_fd), start_new_session=True)
+    finally:
+        child.close()
+    link = PanelLink(parent, process)
+    try:
+        link.wait_ready(fb_fd)
+    except OSError:
+        link.close()
+        raise
+    finally:
+        os.close(fb_fd)
+    width, height = link.panel_size
+    return RemoteEPD(link, width, height), RemoteTouch(link), TouchPoints(), TouchPoints()
@@ -0,0 +1,74 @@
+import logging
+import os
+import struct
+import zlib
+
+LOGGER = logging.getLogger(__name__)
+
+PANEL_STATE_MAGIC = b"IIPF"
+PANEL_STATE_VERSION = 1
+PANEL_STATE_HEADER = struct.Struct("<4sHHIII")
+PANEL_STATE_FILE = "panel.frame"
+
+
+def panel_state_path(state_dir):
+    return os.path.join(state_dir, PANEL_STATE_FILE)
+
+
+def save_panel_state(path, frame, update_count, panel_width, panel_height):
+    frame = bytes(frame)
+    header = PANEL_STATE_HEADER.pack(
+        PANEL_STATE_MAGIC,
+        PANEL_STATE_VERSION,
+        0,
+        (panel_width << 16) | panel_height,
+        update_count,
+        zlib.crc32(frame),
+    )
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as handle:
+            handle.write(header)
+            handle.write(frame)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        LOGGER.warning("Saving panel state to %s failed: %s", path, exc)
+        return False
+    return True
+
+
+def load_panel_state(path, panel_width, panel_height):
+    try:
+        with open(path, "rb") as handle:
+            data = handle.read()
+    except FileNotFoundError:
+        return None
+    except OSError as exc:
+        LOGGER.warning("Reading panel state from %s failed: %s", path, exc)
+        return None
+
+    expected_length = ((panel_width + 7) // 8) * panel_height
+    if len(data) != PANEL_STATE_HEADER.size + expected_length:
+        return None
+    magic, version, _, geometry, update_count, checksum = PANEL_STATE_HEADER.unpack_from(data, 0)
+    frame = bytearray(data[PANEL_STATE_HEADER.size:])
+    if (
+        magic != PANEL_STATE_MAGIC
+        or version != PANEL_STATE_VERSION
+        or geometry != ((panel_width << 16) | panel_height)
+        or zlib.crc32(frame) != checksum
+    ):
+        return None
+    return frame, update_count
+
+
+def discard_panel_state(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        LOGGER.warning("Removing panel state %s failed: %s", path, exc)
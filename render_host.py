@@ -0,0 +1,130 @@
+import logging
+import socket
+
+from panel_link import REMOTE_HELLO, REMOTE_MAGIC, REMOTE_VERSION, StreamPanelLink
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_PANELS = 16
+MAX_PENDING = 8
+
+
+class RenderHost:
+    # Accepts thin panel clients and hands each named panel to start_panel,
+    # which returns an object with stop(). Handshakes are read through the
+    # event loop so a slow client never holds up rendering. Only panels of
+    # panel_size (width, height) are accepted: frames are drawn for it.
+    def __init__(self, loop, host, port, start_panel, panel_size, names=None):
+        self._loop = loop
+        self._start_panel = start_panel
+        self._panel_size = panel_size
+        self._names = set(names) if names else None
+        self._pending = {}
+        # name -> (link, app)
+        self.panels = {}
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self._listener = socket.socket(family, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self._listener.bind((host, port))
+            self._listener.listen(MAX_PANELS)
+        except OSError:
+            self._listener.close()
+            raise
+        self._listener.setblocking(False)
+        loop.add_reader(self._listener, self._accept)
+        LOGGER.info("Render host waiting for panels on %s:%s", host, port)
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        if len(self._pending) >= MAX_PENDING:
+            sock.close()
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._pending[sock] = (address, bytearray())
+        self._loop.add_reader(sock, lambda: self._read_hello(sock))
+
+    def _read_hello(self, sock):
+        address, data = self._pending[sock]
+        try:
+            chunk = sock.recv(REMOTE_HELLO.size + 255 - len(data))
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._reject(sock, None)
+            return
+        data += chunk
+        if len(data) < REMOTE_HELLO.size:
+            return
+        magic, version, width, height, name_length = REMOTE_HELLO.unpack_from(data, 0)
+        if magic != REMOTE_MAGIC or version != REMOTE_VERSION:
+            self._reject(sock, f"{address[0]} is not an infoink panel (protocol {version})")
+            return
+        if (width, height) != self._panel_size:
+            self._reject(sock, f"{address[0]} has a {width}x{height} panel; expected {self._panel_size[0]}x{self._panel_size[1]}")
+            return
+        if len(data) < REMOTE_HELLO.size + name_length:
+            return
+        name = data[REMOTE_HELLO.size:REMOTE_HELLO.size + name_length].decode("utf-8", "replace")
+        if self._names is not None and name not in self._names:
+            self._reject(sock, f"unknown panel {name!r} from {address[0]}")
+            return
+        if name not in self.panels and len(self.panels) >= MAX_PANELS:
+            self._reject(sock, f"too many panels; refusing {name!r}")
+            return
+
+        self._loop.remove_reader(sock)
+        del self._pending[sock]
+        if name in self.panels:
+            # A panel that reconnects (reboot, network blip) replaces its
+            # stale session.
+            self._drop(name)
+        link = StreamPanelLink(sock, name, width, height)
+        link.on_closed = lambda: self._loop.call_soon_threadsafe(lambda: self._on_closed(name, link))
+        LOGGER.info("Panel %s connected from %s (%dx%d)", name, address[0], width, height)
+        self.panels[name] = (link, self._start_panel(name, link))
+
+    def _reject(self, sock, reason):
+        if reason:
+            LOGGER.warning("Rejecting panel connection: %s", reason)
+        self._loop.remove_reader(sock)
+        self._pending.pop(sock, None)
+        sock.close()
+
+    def _on_closed(self, name, link):
+        entry = self.panels.get(name)
+        if entry is None or entry[0] is not link:
+            return
+        LOGGER.info("Panel %s disconnected", name)
+        self._drop(name)
+
+    def _drop(self, name):
+        link, app = self.panels.pop(name)
+        app.stop()
+        link.disconnect()
+
+    def apps(self):
+        return [app for _, app in self.panels.values()]
+
+    def close(self, exit_panel=None):
+        self._loop.remove_reader(self._listener)
+        self._listener.close()
+        for sock in list(self._pending):
+            self._reject(sock, None)
+        panels = list(self.panels.values())
+        self.panels.clear()
+        # Queue every exit sequence before waiting on any, so the panels
+        # clear in parallel rather than one after another.
+        for _, app in panels:
+            app.stop()
+            if exit_panel is not None:
+                exit_panel(app)
+        for link, _ in panels:
+            link.on_closed = None
+            link.close()
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+from scheduler import EventLoop
+
+LOGGER = logging.getLogger(__name__)
+
+FRAME_LOG_MAGIC = b"IIFL"
+FRAME_LOG_VERSION = 1
+FRAME_LOG_HEADER = struct.Struct("<4sHHHI")
+FRAME_RECORD = struct.Struct("<dIBI")
+FRAME_KINDS = ("full", "base", "partial", "window", "clear", "admin")
+
+REPLAY_MONOTONIC_START = 100000.0
+REPLAY_WALL_START = 1700000000.0
+VITALS_DEFAULTS = {
+    "cpu_percent": None,
+    "load": (0.0, 0.0, 0.0),
+    "mem_total_kib": 0,
+    "mem_available_kib": None,
+    "temperature_c": None,
+    "uptime_seconds": 0,
+}
+
+
+class VirtualClock:
+    def __init__(self, monotonic_start, wall_start):
+        self.now = monotonic_start
+        self._wall_offset = wall_start - monotonic_start
+
+    def monotonic(self):
+        return self.now
+
+    def wall(self):
+        return self.now + self._wall_offset
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class VirtualEventLoop(EventLoop):
+    def __init__(self, virtual_clock):
+        super().__init__(clock=virtual_clock.monotonic)
+        self.virtual_clock = virtual_clock
+
+    def _wait(self, timeout):
+        # Never block: when nothing is ready, jump straight to the next timer.
+        events = self._selector.select(0)
+        if timeout is None:
+            self.stop()
+        elif timeout > 0 and not events:
+            self.virtual_clock.advance(timeout)
+        return events
+
+
+def xor_frames(a, b):
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+class FrameLogWriter:
+    def __init__(self, path, panel_width, panel_height):
+        self.frame_length = ((panel_width + 7) // 8) * panel_height
+        self.frames = 0
+        self._previous = b"\xff" * self.frame_length
+        self._handle = open(path, "wb")
+        self._handle.write(
+            FRAME_LOG_HEADER.pack(FRAME_LOG_MAGIC, FRAME_LOG_VERSION, panel_width, panel_height, self.frame_length)
+        )
+
+    def write(self, timestamp, cpu_seconds, kind, frame):
+        frame = bytes(frame)
+        payload = zlib.compress(xor_frames(frame, self._previous))
+        cpu_us = min(int(cpu_seconds * 1_000_000), 0xFFFFFFFF)
+        self._handle.write(FRAME_RECORD.pack(timestamp, cpu_us, FRAME_KINDS.index(kind), len(payload)))
+        self._handle.write(payload)
+        self._previous = frame
+        self.frames += 1
+
+    def write_admin_action(self, timestamp, action):
+        # Not a frame: the payload is the action name and the XOR chain
+        # carries on from the previous frame.
+        payload = action.encode("ascii")
+        self._handle.write(FRAME_RECORD.pack(timestamp, 0, FRAME_KINDS.index("admin"), len(payload)))
+        self._handle.write(payload)
+
+    def close(self):
+        self._handle.close()
+
+
+def read_frame_log(path):
+    # Yields (seconds since start, cpu seconds, kind, full panel frame), or
+    # (seconds since start, 0.0, "admin", action name) for an admin action.
+    with open(path, "rb") as handle:
+        header = handle.read(FRAME_LOG_HEADER.size)
+        magic, version, _, _, frame_length = FRAME_LOG_HEADER.unpack(header)
+        if magic != FRAME_LOG_MAGIC or version != FRAME_LOG_VERSION:
+            raise ValueError(f"{path} is not a frame log")
+        previous = b"\xff" * frame_length
+        while True:
+            record = handle.read(FRAME_RECORD.size)
+            if len(record) < FRAME_RECORD.size:
+                return
+            timestamp, cpu_us, kind, length = FRAME_RECORD.unpack(record)
+            if FRAME_KINDS[kind] == "admin":
+                yield timestamp, 0.0, "admin", handle.read(length).decode("ascii")
+                continue
+            previous = xor_frames(zlib.decompress(handle.read(length)), previous)
+            yield timestamp, cpu_us / 1_000_000, FRAME_KINDS[kind], previous
+
+
+def load_replay_script(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        script = json.load(handle)
+    if not isinstance(script, dict) or not isinstance(script.get("events", []), list):
+        raise ValueError("expected an object with an 'events' list")
+    for event in script.get("events", []):
+        if not isinstance(event, dict) or not isinstance(event.get("t"), (int, float)):
+            raise ValueError(f"event without a numeric 't': {event!r}")
+    return script
+
+
+class ReplaySession:
+    def __init__(self, script, script_path, log_path):
+        if script.get("tz"):
+            os.environ["TZ"] = script["tz"]
+            time.tzset()
+        self.script = script
+        self.script_path = script_path
+        self.log_path = log_path
+        self.clock = VirtualClock(
+            float(script.get("monotonic_start", REPLAY_MONOTONIC_START)),
+            float(script.get("start", REPLAY_WALL_START)),
+        )
+        self.loop = VirtualEventLoop(self.clock)
+        self.started_at = self.clock.monotonic()
+        self.state_dir = tempfile.mkdtemp(prefix="infoink-replay-")
+        self.net_dir = os.path.join(self.state_dir, "net")
+        os.makedirs(self.net_dir)
+
+        self._ipv4 = []
+        self._wifi = []
+        self._vitals = dict(VITALS_DEFAULTS)
+        self._vitals_at = self.started_at
+        self._state = None
+        self._log = None
+        self._cpu_mark = time.process_time()
+        self._cpu_per_frame = []
+        self._wall_started_at = time.monotonic()
+
+    def providers(self):
+        return {
+            "ipv4": lambda: list(self._ipv4),
+            "wifi": lambda: list(self._wifi),
+            "vitals": self._vitals_rows,
+            "net_dir": self.net_dir,
+        }
+
+    def _vitals_rows(self):
+        from vitals import format_vitals
+
+        sample = dict(self._vitals)
+        sample["uptime_seconds"] += self.clock.monotonic() - self._vitals_at
+        return format_vitals(sample)
+
+    def create_runtime(self, display_width, display_height, up_button, down_button, panel_timing="v4"):
+        # Same mocks as --simulator, minus the HTTP server. Modelled panel
+        # delays advance the virtual clock instead of sleeping.
+        from simulator_backend import MockEPD, MockGT1151, MockGTDevelopment, SimulatorState, load_panel_timing
+
+        self._state = SimulatorState(display_width, display_height, up_button, down_button, clock=self.clock.monotonic)
+        epd = MockEPD(
+            self._state,
+            display_width,
+            display_height,
+            timing=load_panel_timing(panel_timing),
+            clock=self.clock.monotonic,
+            sleep=self.clock.advance,
+        )
+        epd.frame_sink = self._on_frame
+        self._log = FrameLogWriter(self.log_path, epd.width, epd.height)
+
+        for event in sorted(self.script.get("events", []), key=lambda event: event["t"]):
+            if event["t"] <= 0:
+                self._apply(event)
+            else:
+                self.loop.call_at(self.started_at + event["t"], lambda event=event: self._apply(event))
+        if self.script.get("duration") is not None:
+            self.loop.call_at(self.started_at + float(self.script["duration"]), self.loop.stop)
+        return epd, MockGT1151(self._state), MockGTDevelopment(), MockGTDevelopment(), None
+
+    def _apply(self, event):
+        if "ipv4" in event:
+            self._ipv4 = [tuple(entry) for entry in event["ipv4"]]
+        if "wifi" in event:
+            self._wifi = [tuple(entry) for entry in event["wifi"]]
+        if "vitals" in event:
+            self._vitals = dict(VITALS_DEFAULTS, **event["vitals"])
+            self._vitals_at = self.clock.monotonic()
+        for ifname, counters in event.get("net", {}).items():
+            self._write_counters(ifname, counters)
+        if "tap" in event:
+            self._state.enqueue_touch_for_button(event["tap"])
+        if "stroke" in event:
+            self._state.enqueue_stroke([(t_ms / 1000.0, x, y) for t_ms, x, y in event["stroke"]])
+
+    def _write_counters(self, ifname, counters):
+        statistics = os.path.join(self.net_dir, ifname, "statistics")
+        if counters is None:
+            shutil.rmtree(os.path.join(self.net_dir, ifname), ignore_errors=True)
+            return
+        os.makedirs(statistics, exist_ok=True)
+        for name, value in zip(("rx_bytes", "tx_bytes"), counters):
+            # Rewrite in place: the throughput readers keep these files open.
+            with open(os.path.join(statistics, name), "a+b") as handle:
+                handle.seek(0)
+                handle.truncate()
+                handle.write(f"{int(value)}\n".encode("ascii"))
+
+    def _on_frame(self, kind, frame):
+        cpu_now = time.process_time()
+        cpu_seconds = cpu_now - self._cpu_mark
+        self._cpu_mark = cpu_now
+        self._cpu_per_frame.append(cpu_seconds)
+        self._log.write(self.clock.monotonic() - self.started_at, cpu_seconds, kind, frame)
+
+    def record_admin_action(self, action):
+        # Admin actions are logged instead of run: a replay must never
+        # reboot or shut down the machine it runs on.
+        LOGGER.warning("Replay: %s confirmed (not run)", action)
+        self._log.write_admin_action(self.clock.monotonic() - self.started_at, action)
+
+    def finish(self):
+        if self._log is not None:
+            self._log.close()
+            cpu = sorted(self._cpu_per_frame)
+            wall = time.monotonic() - self._wall_started_at
+            virtual = self.clock.monotonic() - self.started_at
+            if cpu:
+                LOGGER.info(
+                    "Replay: %d frames over %.0fs virtual in %.2fs wall (%.0fx); CPU per frame mean %.1f ms, "
+                    "p95 %.1f ms, max %.1f ms; log %s",
+                    len(cpu),
+                    virtual,
+                    wall,
+                    virtual / wall if wall > 0 else 0.0,
+                    sum(cpu) / len(cpu) * 1000,
+                    cpu[min(len(cpu) - 1, int(len(cpu) * 0.95))] * 1000,
+                    cpu[-1] * 1000,
+                    self.log_path,
+                )
+        shutil.rmtree(self.state_dir, ignore_errors=True)
@@ -8,4 +8,4 @@ if [ ! -d ./.venv ]; then
     ./setup.sh
 fi
 source .venv/bin/activate
-python3 monitor.py "$@"
+exec python3 monitor.py "$@"
@@ -0,0 +1,110 @@
+import collections
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("when", "callback", "cancelled")
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.wakeups = 0
+        self._timers = []
+        self._sequence = itertools.count()
+        self._pending = collections.deque()
+        self._selector = selectors.DefaultSelector()
+        self._stopping = False
+
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._selector.register(self._wake_read, selectors.EVENT_READ, self._drain_wakeups)
+
+    def call_at(self, when, callback):
+        timer = Timer(when, callback)
+        heapq.heappush(self._timers, (when, next(self._sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback):
+        return self.call_at(self.clock() + delay, callback)
+
+    def call_soon_threadsafe(self, callback):
+        self._pending.append(callback)
+        try:
+            os.write(self._wake_write, b"\0")
+        except BlockingIOError:
+            pass
+
+    def add_reader(self, fileobj, callback):
+        self._selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj):
+        try:
+            self._selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wake_read, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _next_timeout(self):
+        if self._pending:
+            return 0.0
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - self.clock())
+
+    def _wait(self, timeout):
+        return self._selector.select(timeout)
+
+    def run_once(self):
+        events = self._wait(self._next_timeout())
+        self.wakeups += 1
+
+        for key, _ in events:
+            key.data()
+
+        while self._pending:
+            self._pending.popleft()()
+
+        now = self.clock()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                timer.cancelled = True
+                timer.callback()
+
+    def run_forever(self):
+        self._stopping = False
+        while not self._stopping:
+            self.run_once()
+
+    def stop(self):
+        self._stopping = True
+
+    def close(self):
+        self._selector.close()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
@@ -0,0 +1,33 @@
+import logging
+import os
+import socket
+
+LOGGER = logging.getLogger(__name__)
+
+
+def notify(*states):
+    address = os.environ.get("NOTIFY_SOCKET", "")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+
+    message = "\n".join(states).encode("utf-8")
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto(message, address)
+    except OSError as exc:
+        LOGGER.debug("sd_notify(%s) failed: %s", states, exc)
+        return False
+    return True
+
+
+def watchdog_interval_seconds():
+    try:
+        usec = int(os.environ.get("WATCHDOG_USEC", "0"))
+    except ValueError:
+        return None
+    pid = os.environ.get("WATCHDOG_PID")
+    if usec <= 0 or (pid and pid != str(os.getpid())):
+        return None
+    return usec / 1_000_000
@@ -1,23 +1,45 @@
+import collections
 import io
+import json
 import logging
 import threading
+import time
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import parse_qs, urlparse
 
-from PIL import Image, ImageDraw
+from PIL import Image, ImageChops, ImageDraw
 
 LOGGER = logging.getLogger(__name__)
 
+TOUCH_QUEUE_LIMIT = 32
+TOUCH_STROKE_MAX_POINTS = 256
+TOUCH_MIN_CONTACT_SECONDS = 0.06
+
+# Single-byte send_command/send_data calls the V4 driver makes per operation.
+FULL_INIT_CALLS = 27
+PARTIAL_SETUP_CALLS = 22
+REFRESH_TRIGGER_CALLS = 3
+
 
 def landscape_to_raw_touch(x, y, display_width, display_height):
     return (display_height - 1) - y, (display_width - 1) - x
 
 
 class SimulatorState:
-    def __init__(self, display_width, display_height, up_button, down_button):
+    def __init__(self, display_width, display_height, up_button, down_button, clock=time.monotonic):
         self.lock = threading.Lock()
-        self.pending_touches = []
-        self.frame_png = b""
+        self.touch_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self.clock = clock
+        # Each entry is one stroke: ((offset_seconds, raw_x, raw_y), ...).
+        self.pending_touches = collections.deque(maxlen=TOUCH_QUEUE_LIMIT)
+        self._active_stroke = None
+        self._active_since = 0.0
+        self.touch_callback = None
+        self.frame_image = None
+        self.frame_version = 0
+        self.frame_listener = None
+        self._frame_png = (0, b"")
         self.display_width = display_width
         self.display_height = display_height
         self.up_button = up_button
@@ -25,17 +47,42 @@ class SimulatorState:
         self.set_landscape_image(Image.new("1", (display_width, display_height), 255))
 
     def set_landscape_image(self, image):
+        # Only swap references here; PNG encoding happens on first request.
+        # Callers hand over ownership of the image.
         with self.lock:
-            out = image.convert("L").resize((self.display_width * 2, self.display_height * 2), Image.NEAREST)
-            draw = ImageDraw.Draw(out)
-            draw.rectangle((0, 0, out.width - 1, out.height - 1), outline=0, width=1)
-            buffer = io.BytesIO()
-            out.save(buffer, format="PNG")
-            self.frame_png = buffer.getvalue()
+            self.frame_image = image
+            self.frame_version += 1
+            version = self.frame_version
+        if self.frame_listener is not None:
+            self.frame_listener(version)
+
+    def _encode_png(self, image):
+        out = image.convert("L").resize((self.display_width * 2, self.display_height * 2), Image.NEAREST)
+        draw = ImageDraw.Draw(out)
+        draw.rectangle((0, 0, out.width - 1, out.height - 1), outline=0, width=1)
+        buffer = io.BytesIO()
+        out.save(buffer, format="PNG")
+        return buffer.getvalue()
 
     def get_frame_png(self):
         with self.lock:
-            return self.frame_png
+            version = self.frame_version
+            image = self.frame_image
+            cached = self._frame_png
+        if cached[0] == version:
+            return cached
+
+        with self._encode_lock:
+            # Concurrent viewers of the same version share one encode.
+            with self.lock:
+                cached = self._frame_png
+            if cached[0] >= version:
+                return cached
+            encoded = (version, self._encode_png(image))
+            with self.lock:
+                if self._frame_png[0] < version:
+                    self._frame_png = encoded
+            return encoded
 
     def enqueue_touch_for_button(self, button_name):
         if button_name == "up":
@@ -46,20 +93,150 @@ class SimulatorState:
             y = (self.down_button[1] + self.down_button[3]) // 2
         else:
             return
+        self.enqueue_stroke([(0.0, x, y)])
+
+    def enqueue_stroke(self, points):
+        # points: [(offset_seconds, x, y), ...] in landscape display pixels.
+        stroke = []
+        for offset, x, y in sorted(points, key=lambda point: point[0])[:TOUCH_STROKE_MAX_POINTS]:
+            x = min(max(int(x), 0), self.display_width - 1)
+            y = min(max(int(y), 0), self.display_height - 1)
+            raw_x, raw_y = landscape_to_raw_touch(x, y, self.display_width, self.display_height)
+            stroke.append((max(0.0, float(offset)), raw_x, raw_y))
+        if not stroke:
+            return
 
-        raw_x, raw_y = landscape_to_raw_touch(x, y, self.display_width, self.display_height)
-        with self.lock:
-            self.pending_touches.append((raw_x, raw_y))
-
-    def pop_touch(self):
-        with self.lock:
-            if self.pending_touches:
-                return self.pending_touches.pop(0)
-            return None
+        start = stroke[0][0]
+        stroke = tuple((offset - start, raw_x, raw_y) for offset, raw_x, raw_y in stroke)
+        with self.touch_lock:
+            if len(self.pending_touches) == self.pending_touches.maxlen:
+                LOGGER.warning("Simulator touch queue full; dropping the oldest stroke.")
+            self.pending_touches.append(stroke)
+        if self.touch_callback is not None:
+            self.touch_callback()
+
+    def is_touching(self):
+        # INT level: low from the first point of a stroke until its last point
+        # (or a minimum contact time) has elapsed, then one release before the
+        # next queued stroke starts.
+        now = self.clock()
+        released_with_more = False
+        with self.touch_lock:
+            stroke = self._active_stroke
+            if stroke is not None:
+                if now - self._active_since <= max(stroke[-1][0], TOUCH_MIN_CONTACT_SECONDS):
+                    return True
+                self._active_stroke = None
+                released_with_more = bool(self.pending_touches)
+            elif self.pending_touches:
+                self._active_stroke = self.pending_touches.popleft()
+                self._active_since = now
+                return True
+        if released_with_more and self.touch_callback is not None:
+            self.touch_callback()
+        return False
+
+    def current_touch_point(self):
+        now = self.clock()
+        with self.touch_lock:
+            stroke = self._active_stroke
+            if stroke is None:
+                return None
+            elapsed = now - self._active_since
+            point = stroke[0]
+            for candidate in stroke:
+                if candidate[0] > elapsed:
+                    break
+                point = candidate
+            return point[1], point[2]
 
     def has_pending_touch(self):
-        with self.lock:
-            return bool(self.pending_touches)
+        with self.touch_lock:
+            return self._active_stroke is not None or bool(self.pending_touches)
+
+
+class FrameEventBroadcaster:
+    KEEPALIVE_SECONDS = 15.0
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._clients = []
+        self._version = 0
+        self._sent_version = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        for client in self._clients:
+            client.close()
+        self._clients = []
+
+    def publish(self, version):
+        with self._condition:
+            self._version = version
+            self._condition.notify()
+
+    def add_client(self, client):
+        client.setblocking(False)
+        with self._condition:
+            if self._send(client, f"data: {self._version}\n\n".encode("ascii")):
+                self._clients.append(client)
+
+    def _send(self, client, payload):
+        try:
+            client.sendall(payload)
+            return True
+        except OSError:
+            # Gone, or too far behind to matter: the next version supersedes
+            # anything it missed, so just drop it.
+            client.close()
+            return False
+
+    def _run(self):
+        # One thread serves every viewer; it only wakes for new frames and
+        # keepalives.
+        with self._condition:
+            while self._running:
+                if self._version == self._sent_version:
+                    self._condition.wait(self.KEEPALIVE_SECONDS)
+                if not self._running:
+                    break
+                if self._version != self._sent_version:
+                    payload = f"data: {self._version}\n\n".encode("ascii")
+                    self._sent_version = self._version
+                else:
+                    payload = b": keepalive\n\n"
+                self._clients = [client for client in self._clients if self._send(client, payload)]
+
+
+class SimulatorHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class):
+        super().__init__(server_address, handler_class)
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+
+    def detach_request(self, request):
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
 
 
 class SimulatorServer:
@@ -69,9 +246,11 @@ class SimulatorServer:
         self._port = port
         self._httpd = None
         self._thread = None
+        self._broadcaster = FrameEventBroadcaster()
 
     def start(self):
         state = self._state
+        broadcaster = self._broadcaster
 
         class Handler(BaseHTTPRequestHandler):
             def do_GET(self):
@@ -93,7 +272,7 @@ class SimulatorServer:
   <h3>Waveshare 2.13 V4 Simulator</h3>
   <div class=\"wrap\">
     <div class=\"panel\">
-      <img id=\"frame\" src=\"/frame.png\" alt=\"display\"> 
+      <img id=\"frame\" src=\"/frame.png\" alt=\"display\" draggable=\"false\" style=\"touch-action: none; cursor: crosshair;\">
     </div>
     <div class=\"panel\">
       <button onclick=\"touch('up')\">UP</button><br>
@@ -101,14 +280,38 @@ class SimulatorServer:
     </div>
   </div>
   <script>
-    function refreshFrame() {
-      document.getElementById('frame').src = '/frame.png?t=' + Date.now();
-    }
     async function touch(button) {
       await fetch('/touch?button=' + button, { method: 'POST' });
-      setTimeout(refreshFrame, 80);
     }
-    setInterval(refreshFrame, 400);
+    const frame = document.getElementById('frame');
+    let stroke = null;
+    function point(event) {
+      const rect = frame.getBoundingClientRect();
+      return [
+        Math.round(event.timeStamp - stroke.t0),
+        Math.floor((event.clientX - rect.left) * frame.naturalWidth / rect.width / 2),
+        Math.floor((event.clientY - rect.top) * frame.naturalHeight / rect.height / 2),
+      ];
+    }
+    frame.addEventListener('pointerdown', (event) => {
+      frame.setPointerCapture(event.pointerId);
+      stroke = { t0: event.timeStamp, points: [] };
+      stroke.points.push(point(event));
+    });
+    frame.addEventListener('pointermove', (event) => {
+      if (stroke) stroke.points.push(point(event));
+    });
+    frame.addEventListener('pointerup', (event) => {
+      if (!stroke) return;
+      stroke.points.push(point(event));
+      const body = JSON.stringify({ points: stroke.points });
+      stroke = null;
+      fetch('/touch', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body });
+    });
+    const events = new EventSource('/events');
+    events.onmessage = (event) => {
+      document.getElementById('frame').src = '/frame.png?v=' + event.data;
+    };
   </script>
 </body>
 </html>
@@ -121,11 +324,32 @@ class SimulatorServer:
                     self.wfile.write(body)
                     return
 
+                if parsed.path == "/events":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-store")
+                    self.end_headers()
+                    self.wfile.flush()
+                    # Hand the socket to the broadcaster thread so this
+                    # handler thread can exit.
+                    self.close_connection = True
+                    self.server.detach_request(self.request)
+                    broadcaster.add_client(self.request)
+                    return
+
                 if parsed.path == "/frame.png":
-                    body = state.get_frame_png()
+                    version, body = state.get_frame_png()
+                    etag = f'"{version}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Cache-Control", "no-cache")
+                        self.end_headers()
+                        return
                     self.send_response(200)
                     self.send_header("Content-Type", "image/png")
-                    self.send_header("Cache-Control", "no-store")
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", "no-cache")
                     self.send_header("Content-Length", str(len(body)))
                     self.end_headers()
                     self.wfile.write(body)
@@ -142,8 +366,23 @@ class SimulatorServer:
                     return
 
                 params = parse_qs(parsed.query)
-                button = params.get("button", [""])[0]
-                state.enqueue_touch_for_button(button)
+                if "button" in params:
+                    state.enqueue_touch_for_button(params["button"][0])
+                else:
+                    # Free-form strokes: {"points": [[t_ms, x, y], ...]} in
+                    # landscape display pixels, or ?x=&y= for a single tap.
+                    try:
+                        if "x" in params and "y" in params:
+                            points = [(0.0, float(params["x"][0]), float(params["y"][0]))]
+                        else:
+                            length = int(self.headers.get("Content-Length", "0"))
+                            payload = json.loads(self.rfile.read(length) or b"{}")
+                            points = [(float(t) / 1000.0, float(x), float(y)) for t, x, y in payload["points"]]
+                    except (KeyError, TypeError, ValueError):
+                        self.send_response(400)
+                        self.end_headers()
+                        return
+                    state.enqueue_stroke(points)
 
                 body = b"ok"
                 self.send_response(200)
@@ -155,12 +394,17 @@ class SimulatorServer:
             def log_message(self, _format, *args):
                 return
 
-        self._httpd = ThreadingHTTPServer((self._host, self._port), Handler)
+        self._broadcaster.start()
+        state.frame_listener = self._broadcaster.publish
+        self._broadcaster.publish(state.frame_version)
+        self._httpd = SimulatorHTTPServer((self._host, self._port), Handler)
         self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
         self._thread.start()
         LOGGER.info("Simulator available at http://%s:%s", self._host, self._port)
 
     def stop(self):
+        self._state.frame_listener = None
+        self._broadcaster.stop()
         if self._httpd is not None:
             self._httpd.shutdown()
             self._httpd.server_close()
@@ -168,6 +412,55 @@ class SimulatorServer:
             self._thread.join(timeout=1.0)
 
 
+class PanelTiming:
+    # Defaults follow the 2.13" V4 datasheet and epdconfig's SPI clock; any
+    # field can be overridden from a JSON file of measured values.
+    def __init__(
+        self,
+        spi_hz=10_000_000,
+        call_us=80.0,
+        transfer_overhead_us=150.0,
+        hard_reset_ms=42.0,
+        soft_reset_ms=10.0,
+        partial_reset_ms=1.0,
+        full_refresh_ms=2000.0,
+        partial_refresh_ms=300.0,
+        ghosting=True,
+        ghost_step=12,
+        ghost_max=72,
+    ):
+        self.spi_hz = spi_hz
+        self.call_us = call_us
+        self.transfer_overhead_us = transfer_overhead_us
+        self.hard_reset_ms = hard_reset_ms
+        self.soft_reset_ms = soft_reset_ms
+        self.partial_reset_ms = partial_reset_ms
+        self.full_refresh_ms = full_refresh_ms
+        self.partial_refresh_ms = partial_refresh_ms
+        self.ghosting = ghosting
+        self.ghost_step = ghost_step
+        self.ghost_max = ghost_max
+
+    def calls_seconds(self, calls):
+        return calls * self.call_us / 1_000_000
+
+    def transfer_seconds(self, nbytes):
+        return nbytes * 8 / self.spi_hz + self.transfer_overhead_us / 1_000_000
+
+
+def load_panel_timing(spec):
+    # "v4" (default model), "instant" (no delays) or a JSON file of overrides.
+    if not spec or spec == "v4":
+        return PanelTiming()
+    if spec == "instant":
+        return None
+    try:
+        with open(spec, "r", encoding="utf-8") as handle:
+            return PanelTiming(**json.load(handle))
+    except (OSError, TypeError, ValueError) as exc:
+        raise ValueError(f"invalid panel timing {spec}: {exc}") from exc
+
+
 class MockGTDevelopment:
     def __init__(self):
         self.Touch = 0
@@ -188,17 +481,20 @@ class MockGT1151:
     def GT_Init(self):
         return
 
+    def set_int_callback(self, callback):
+        self._state.touch_callback = callback
+
     def digital_read(self, pin):
         if pin != self.INT:
             return 1
-        return 0 if self._state.has_pending_touch() else 1
+        return 0 if self._state.is_touching() else 1
 
     def GT_Scan(self, gt_dev, gt_old):
         if gt_dev.Touch != 1:
             return
 
         gt_dev.Touch = 0
-        touch = self._state.pop_touch()
+        touch = self._state.current_touch_point()
         if touch is None:
             gt_dev.TouchpointFlag = 0
             return
@@ -219,19 +515,63 @@ class MockEPD:
     FULL_UPDATE = 0
     PART_UPDATE = 1
 
-    def __init__(self, state, display_width, display_height):
+    def __init__(self, state, display_width, display_height, timing=None, clock=time.monotonic, sleep=time.sleep):
         self.width = 122
         self.height = 250
         self._state = state
         self._display_width = display_width
         self._display_height = display_height
+        self._panel = bytearray(b"\xff" * (((self.width + 7) // 8) * self.height))
+        # Headless replay takes raw panel frames here instead of PNGs.
+        self.frame_sink = None
+
+        self.timing = timing
+        self._clock = clock
+        self._sleep = sleep
+        self._busy_until = 0.0
+        self._shown = None
+        self._ghost = None
+
+    def _spend(self, seconds):
+        if seconds > 0:
+            self._sleep(seconds)
+
+    def ReadBusy(self):
+        self._spend(self._busy_until - self._clock())
+
+    def _model(self, reset_seconds=0.0, calls=0, transfer_bytes=(), refresh_seconds=0.0, wait=True):
+        # Blocks the caller as long as the real driver would.
+        timing = self.timing
+        if timing is None:
+            return
+        self.ReadBusy()
+        seconds = reset_seconds + timing.calls_seconds(calls)
+        seconds += sum(timing.transfer_seconds(nbytes) for nbytes in transfer_bytes)
+        self._spend(seconds)
+        self._busy_until = self._clock() + refresh_seconds
+        if wait:
+            self.ReadBusy()
 
     def init(self, update):
+        timing = self.timing
+        if timing is not None:
+            if update == self.FULL_UPDATE:
+                self._model(
+                    reset_seconds=(timing.hard_reset_ms + timing.soft_reset_ms) / 1000,
+                    calls=FULL_INIT_CALLS,
+                )
+            else:
+                self._model(reset_seconds=timing.partial_reset_ms / 1000, calls=PARTIAL_SETUP_CALLS - 1)
         return 0
 
     def Clear(self, color):
-        fill = 255 if color else 0
-        self._state.set_landscape_image(Image.new("1", (self._display_width, self._display_height), fill))
+        if self.timing is not None:
+            self._model(
+                calls=1 + REFRESH_TRIGGER_CALLS,
+                transfer_bytes=(len(self._panel),),
+                refresh_seconds=self.timing.full_refresh_ms / 1000,
+            )
+        self._show_buffer(bytes([color & 0xFF]) * len(self._panel), "clear")
 
     def getbuffer(self, image):
         img = image
@@ -245,36 +585,101 @@ class MockEPD:
 
         return bytearray(img.tobytes("raw"))
 
-    def _show_buffer(self, image_buffer):
-        panel = Image.frombytes("1", (self.width, self.height), bytes(image_buffer))
-        landscape = panel.rotate(90, expand=True)
+    def _show_buffer(self, image_buffer, kind):
+        if image_buffer is not self._panel:
+            self._panel[:] = image_buffer
+        if self.frame_sink is not None:
+            self.frame_sink(kind, self._panel)
+            return
+        panel = Image.frombytes("1", (self.width, self.height), self._panel)
+        if self.timing is not None and self.timing.ghosting and kind != "base":
+            panel = self._apply_ghosting(panel, kind)
+        landscape = panel.transpose(Image.ROTATE_90)
         self._state.set_landscape_image(landscape)
 
+    def _apply_ghosting(self, panel, kind):
+        # Pixels flipped by partial waveforms keep a grey residue that builds
+        # up until the next full refresh clears it.
+        previous = self._shown
+        self._shown = panel
+        if kind in ("full", "clear") or previous is None:
+            self._ghost = None
+            return panel
+        timing = self.timing
+        changed = ImageChops.logical_xor(previous, panel).convert("L")
+        step = changed.point(lambda value: timing.ghost_step if value else 0)
+        ghost = step if self._ghost is None else ImageChops.add(self._ghost, step)
+        self._ghost = ghost.point(lambda value: min(value, timing.ghost_max))
+        return ImageChops.subtract(panel.convert("L"), self._ghost)
+
+    def _partial_timing(self, window_bytes, wait=True):
+        if self.timing is not None:
+            self._model(
+                reset_seconds=self.timing.partial_reset_ms / 1000,
+                calls=PARTIAL_SETUP_CALLS + REFRESH_TRIGGER_CALLS,
+                transfer_bytes=(window_bytes,),
+                refresh_seconds=self.timing.partial_refresh_ms / 1000,
+                wait=wait,
+            )
+
+    def _full_timing(self, planes):
+        if self.timing is not None:
+            self._model(
+                calls=planes + REFRESH_TRIGGER_CALLS,
+                transfer_bytes=(len(self._panel),) * planes,
+                refresh_seconds=self.timing.full_refresh_ms / 1000,
+            )
+
     def displayPartBaseImage(self, image):
-        self._show_buffer(image)
+        self._full_timing(planes=2)
+        self._show_buffer(image, "full")
+
+    def loadBaseImage(self, image):
+        if self.timing is not None:
+            self._model(calls=2, transfer_bytes=(len(self._panel), len(self._panel)))
+        self._show_buffer(image, "base")
+        # The glass already shows this frame (warm start); the next partial
+        # ghosts against it rather than starting from a clean panel.
+        self._shown = Image.frombytes("1", (self.width, self.height), self._panel)
 
     def displayPartial(self, image):
-        self._show_buffer(image)
+        self._partial_timing(len(self._panel), wait=False)
+        self._show_buffer(image, "partial")
 
     def displayPartial_Wait(self, image):
-        self._show_buffer(image)
+        self._partial_timing(len(self._panel))
+        self._show_buffer(image, "partial")
+
+    def displayPartial_Window(self, image, x_start, y_start, x_end, y_end):
+        linewidth = (self.width + 7) // 8
+        first = x_start >> 3
+        last = (x_end >> 3) + 1
+        self._partial_timing((last - first) * (y_end - y_start + 1))
+        panel = self._panel
+        for j in range(y_start, y_end + 1):
+            panel[j * linewidth + first:j * linewidth + last] = image[j * linewidth + first:j * linewidth + last]
+        self._show_buffer(panel, "window")
 
     def display(self, image):
-        self._show_buffer(image)
+        self._full_timing(planes=1)
+        self._show_buffer(image, "full")
 
-    def sleep(self):
-        return
+    def sleep(self, settle_ms=2000):
+        if self.timing is not None:
+            self._model(calls=2)
+            self._spend(settle_ms / 1000)
 
     def Dev_exit(self):
         return
 
 
-def create_simulator_runtime(host, port, display_width, display_height, up_button, down_button):
+def create_simulator_runtime(host, port, display_width, display_height, up_button, down_button, panel_timing="v4"):
+    timing = load_panel_timing(panel_timing)
     state = SimulatorState(display_width, display_height, up_button, down_button)
     server = SimulatorServer(host, port, state)
     server.start()
 
-    epd = MockEPD(state, display_width, display_height)
+    epd = MockEPD(state, display_width, display_height, timing=timing)
     gt = MockGT1151(state)
     gt_dev = MockGTDevelopment()
     gt_old = MockGTDevelopment()
@@ -0,0 +1,25 @@
+import errno
+import os
+
+import history
+
+
+def test_series_file_is_allocated_not_sparse(tmp_path):
+    path = str(tmp_path / "rate.ts")
+    series = history.HistorySeries(path, 256)
+    series.close()
+    size = history.HEADER_SIZE + 256 * history.RECORD.size
+    assert os.stat(path).st_size == size
+    assert os.stat(path).st_blocks * 512 >= size
+
+
+def test_series_falls_back_to_memory_when_the_disk_is_full(tmp_path, monkeypatch):
+    def no_space(fd, offset, length):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+    monkeypatch.setattr(history.os, "posix_fallocate", no_space)
+    series = history.HistorySeries(str(tmp_path / "rate.ts"), 4)
+    for i in range(6):
+        series.append(float(i), float(i * 10))
+    assert list(series.records()) == [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0), (5.0, 50.0)]
+    series.close()
@@ -0,0 +1,117 @@
+import errno
+import os
+import socket
+
+import pytest
+
+import netlink
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    # Hex dumps, one datagram per file; "#" lines describe the messages.
+    with open(os.path.join(FIXTURES, name)) as handle:
+        lines = [line for line in handle if not line.startswith("#")]
+    return bytes.fromhex("".join(lines))
+
+
+def test_parse_messages_splits_a_dump_datagram():
+    messages = netlink.parse_messages(load_fixture("nl80211_scan_dump.hex"))
+    assert [msg_type for msg_type, _, _, _ in messages] == [0x1C, 0x1C, netlink.NLMSG_DONE]
+    assert all(flags & netlink.NLM_F_MULTI for _, flags, _, _ in messages)
+    assert {seq for _, _, seq, _ in messages} == {7}
+
+
+def test_parse_messages_stops_at_a_truncated_message():
+    data = load_fixture("nl80211_scan_dump.hex")
+    messages = netlink.parse_messages(data[:-4])
+    assert [msg_type for msg_type, _, _, _ in messages] == [0x1C, 0x1C]
+
+
+def test_parse_genl_reads_command_and_attributes():
+    _, _, _, payload = netlink.parse_messages(load_fixture("nl80211_mlme_events.hex"))[1]
+    cmd, attrs = netlink.parse_genl(payload)
+    assert cmd == netlink.NL80211_CMD_CONNECT
+    assert attrs[netlink.NL80211_ATTR_IFINDEX] == b"\x03\x00\x00\x00"
+
+
+def test_parse_family_from_recorded_reply():
+    messages = netlink.parse_messages(load_fixture("genl_getfamily_thermal.hex"))
+    assert len(messages) == 1
+    msg_type, _, _, payload = messages[0]
+    assert msg_type == netlink.GENL_ID_CTRL
+    assert netlink.parse_family(payload) == (19, {"sampling": 2, "event": 3})
+
+
+def test_associated_bss_skips_unassociated_entries():
+    payloads = [
+        payload
+        for msg_type, _, _, payload in netlink.parse_messages(load_fixture("nl80211_scan_dump.hex"))
+        if msg_type != netlink.NLMSG_DONE
+    ]
+    assert netlink.associated_bss_from_scan(payloads) == ("a0:b1:c2:d3:e4:f5", "infoink-lab")
+    assert netlink.associated_bss_from_scan(payloads[:1]) is None
+
+
+def test_link_events_keep_only_connect_roam_disconnect():
+    payloads = [payload for _, _, _, payload in netlink.parse_messages(load_fixture("nl80211_mlme_events.hex"))]
+    assert netlink.link_events(payloads) == [
+        (netlink.NL80211_CMD_CONNECT, 3),
+        (netlink.NL80211_CMD_DISCONNECT, 3),
+    ]
+
+
+def test_route_events_name_the_interface_and_skip_wireless_extensions():
+    assert netlink.route_events(load_fixture("rtnl_link_events.hex")) == [
+        (netlink.RTM_NEWLINK, 7, "veth1a2b"),
+        (netlink.RTM_NEWADDR, 2, "eth0"),
+        (netlink.RTM_DELLINK, 9, None),
+    ]
+
+
+class _OverrunEvents:
+    def __init__(self, batches):
+        self._batches = list(batches)
+
+    def recv_events(self):
+        batch = self._batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+
+def test_poll_link_events_reports_an_overrun_as_a_change():
+    client = netlink.NL80211Client.__new__(netlink.NL80211Client)
+    client._events = _OverrunEvents([OSError(errno.ENOBUFS, os.strerror(errno.ENOBUFS)), []])
+    assert client.poll_link_events() == [(None, 0)]
+
+
+def test_request_gives_up_when_the_kernel_does_not_answer(monkeypatch):
+    monkeypatch.setattr(netlink, "NETLINK_REQUEST_TIMEOUT_SECONDS", 0.05)
+    ours, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock = netlink.GenericNetlinkSocket.__new__(netlink.GenericNetlinkSocket)
+    sock._sock, sock._seq = ours, 0
+    try:
+        with pytest.raises(TimeoutError):
+            sock.request(netlink.GENL_ID_CTRL, netlink.CTRL_CMD_GETFAMILY)
+    finally:
+        ours.close()
+        kernel.close()
+
+
+class _SlowInterfaceQuery:
+    def request(self, family_id, cmd, attrs=b"", dump=False):
+        if cmd == netlink.NL80211_CMD_GET_INTERFACE:
+            raise TimeoutError("no netlink reply")
+        return [
+            payload
+            for msg_type, _, _, payload in netlink.parse_messages(load_fixture("nl80211_scan_dump.hex"))
+            if msg_type != netlink.NLMSG_DONE
+        ]
+
+
+def test_get_ssid_falls_back_to_the_scan_after_a_timeout():
+    client = netlink.NL80211Client.__new__(netlink.NL80211Client)
+    client._sock, client.family_id = _SlowInterfaceQuery(), 28
+    assert client.get_ssid(3) == "infoink-lab"
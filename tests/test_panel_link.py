@@ -0,0 +1,42 @@
+import select
+import socket
+import zlib
+
+import panel_link
+from panel_link import EVENT, EVENT_DONE, OP_CLEAR, OP_WINDOW, REMOTE_COMMAND, StreamPanelLink, xor_frames
+
+
+def read_command(sock, previous):
+    seq, op, arg, x0, y0, x1, y1, length = REMOTE_COMMAND.unpack(panel_link.recv_exact(sock, REMOTE_COMMAND.size))
+    frame = previous
+    if length:
+        frame = xor_frames(previous, zlib.decompress(panel_link.recv_exact(sock, length)))
+    return seq, op, (x0, y0, x1, y1), frame
+
+
+def test_refreshes_wait_for_the_ack_and_coalesce():
+    host_side, panel_side = socket.socketpair()
+    link = StreamPanelLink(host_side, "test", 8, 4)
+    try:
+        panel_side.settimeout(2.0)
+        blank = b"\xff" * 4
+        link.send(OP_WINDOW, b"\x00\xff\xff\xff", (0, 0, 7, 0))
+        link.send(OP_WINDOW, b"\x00\x00\xff\xff", (0, 1, 7, 1))
+        link.send(OP_WINDOW, b"\x00\x00\x00\xff", (0, 2, 7, 2))
+
+        seq, op, window, frame = read_command(panel_side, blank)
+        assert (seq, op, window, frame) == (1, OP_WINDOW, (0, 0, 7, 0), b"\x00\xff\xff\xff")
+        assert select.select([panel_side], [], [], 0.2)[0] == []
+
+        # One refresh for both held frames, covering both windows.
+        panel_side.sendall(EVENT.pack(EVENT_DONE, 1, 0, 0, 0))
+        seq, op, window, frame = read_command(panel_side, frame)
+        assert (seq, op, window, frame) == (3, OP_WINDOW, (0, 1, 7, 2), b"\x00\x00\x00\xff")
+
+        # Other commands never wait for a refresh.
+        link.send(OP_CLEAR, arg=0xFF)
+        assert read_command(panel_side, frame)[:2] == (4, OP_CLEAR)
+    finally:
+        link.on_closed = None
+        link.disconnect()
+        panel_side.close()
@@ -0,0 +1,61 @@
+import collections
+import tracemalloc
+
+import monitor
+from replay import VirtualClock, VirtualEventLoop
+from simulator_backend import MockEPD, MockGT1151, MockGTDevelopment, SimulatorState
+
+SOAK_FRAMES = 2000
+# Long enough for CPython's free lists and Pillow's glyph caches to fill.
+SOAK_WARMUP_FRAMES = 1000
+SOAK_GROWTH_LIMIT_BYTES = 16 * 1024
+
+
+def test_redraw_path_does_not_grow_memory(monkeypatch):
+    # The clock page in seconds mode sends a window refresh every virtual
+    # second, through the same redraw -> present() path as the device.
+    clock = VirtualClock(100000.0, 1700000000.0)
+    loop = VirtualEventLoop(clock)
+    monkeypatch.setitem(monitor._CLOCKS, "monotonic", clock.monotonic)
+    monkeypatch.setitem(monitor._CLOCKS, "wall", clock.wall)
+    monkeypatch.setattr(monitor, "_PROVIDERS", {"ipv4": list, "wifi": list, "vitals": list})
+    monkeypatch.setattr(monitor, "IDLE_SLEEP_SECONDS", 0.0)
+
+    state = SimulatorState(
+        monitor.DISPLAY_WIDTH,
+        monitor.DISPLAY_HEIGHT,
+        monitor.UP_BUTTON,
+        monitor.DOWN_BUTTON,
+        clock=clock.monotonic,
+    )
+    epd = MockEPD(state, monitor.DISPLAY_WIDTH, monitor.DISPLAY_HEIGHT, clock=clock.monotonic, sleep=clock.advance)
+    sent = collections.Counter()
+    epd.frame_sink = lambda kind, frame: sent.update((kind,))
+    fonts = (monitor.load_font(14), monitor.load_font(12), monitor.load_font(10))
+    app = monitor.MonitorApp(epd, MockGT1151(state), MockGTDevelopment(), MockGTDevelopment(), loop, fonts)
+    app.current_page = monitor.CLOCK_PAGE_INDEX
+
+    traced = {}
+
+    def measure():
+        frames = sum(sent.values())
+        if frames >= SOAK_WARMUP_FRAMES and "warm" not in traced:
+            traced["warm"] = tracemalloc.get_traced_memory()[0]
+        elif frames >= SOAK_FRAMES:
+            traced["end"] = tracemalloc.get_traced_memory()[0]
+            loop.stop()
+            return
+        loop.call_later(0.5, measure)
+
+    tracemalloc.start()
+    try:
+        app.start(system_events=False)
+        loop.call_later(0.5, measure)
+        loop.run_forever()
+    finally:
+        tracemalloc.stop()
+        app.stop()
+        loop.close()
+
+    assert sent["window"] and sent["full"]
+    assert traced["end"] - traced["warm"] < SOAK_GROWTH_LIMIT_BYTES
@@ -0,0 +1,34 @@
+import os
+
+from history import HistoryStore
+from throughput import InterfaceThroughput
+
+
+def make_interface(net_dir, ifname):
+    statistics = os.path.join(net_dir, ifname, "statistics")
+    os.makedirs(statistics)
+    for name in ("rx_bytes", "tx_bytes"):
+        with open(os.path.join(statistics, name), "w") as handle:
+            handle.write("0\n")
+
+
+def test_restore_keeps_rx_and_tx_aligned_by_timestamp(tmp_path):
+    net_dir = str(tmp_path / "net")
+    make_interface(net_dir, "eth0")
+    store = HistoryStore(str(tmp_path / "state"), capacity=16)
+    # The tx append for t=100 was lost; every later sample has both.
+    store.append("net.eth0.rx", 100.0, 1000.0)
+    for timestamp, rx, tx in ((101.0, 2000.0, 20.0), (102.0, 3000.0, 30.0)):
+        store.append("net.eth0.rx", timestamp, rx)
+        store.append("net.eth0.tx", timestamp, tx)
+
+    stats = InterfaceThroughput(
+        "eth0", 8, net_dir=net_dir, history=store, history_window=60.0, wall_clock=lambda: 110.0
+    )
+    try:
+        assert list(stats.rx_rate.values()) == [1000.0, 2000.0, 3000.0]
+        assert list(stats.tx_rate.values()) == [20.0, 30.0]
+        assert list(stats.total_rate.values()) == [1000.0, 2020.0, 3030.0]
+    finally:
+        stats.close()
+        store.close()
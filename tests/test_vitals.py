@@ -0,0 +1,26 @@
+import pytest
+
+import vitals
+
+
+class _Reading:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return bytearray(self._data), len(self._data)
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b"47250\n", 47.25),
+        (b"", None),
+        (b"\n", None),
+        (b"N/A\n", None),
+    ],
+)
+def test_temperature_survives_empty_and_garbage_reads(data, expected):
+    reader = vitals.SystemVitals.__new__(vitals.SystemVitals)
+    reader._thermal = _Reading(data)
+    assert reader.temperature_c() == expected
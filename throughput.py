@@ -0,0 +1,231 @@
+import array
+import os
+import time
+
+from PIL import Image, ImageDraw
+
+from vitals import open_optional
+
+SPARKLINE_WIDTH = 60
+SPARKLINE_HEIGHT = 11
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = array.array("d", bytes(8 * capacity))
+        self._head = 0
+        self.count = 0
+
+    def append(self, value):
+        self._data[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self):
+        if not self.count:
+            return 0.0
+        return self._data[(self._head - 1) % self.capacity]
+
+    def values(self):
+        start = (self._head - self.count) % self.capacity
+        for i in range(self.count):
+            yield self._data[(start + i) % self.capacity]
+
+    def max(self):
+        return max(self.values(), default=0.0)
+
+
+def sparkline_scale(peak):
+    # Power-of-two buckets so the plot only needs a full redraw when the peak
+    # crosses a bucket, not whenever the maximum moves.
+    scale = 1024.0
+    while scale < peak:
+        scale *= 2.0
+    return scale
+
+
+class Sparkline:
+    def __init__(self, width=SPARKLINE_WIDTH, height=SPARKLINE_HEIGHT):
+        self.width = width
+        self.height = height
+        self.image = Image.new("1", (width, height), 255)
+        self._draw = ImageDraw.Draw(self.image)
+        self._scale = 0.0
+
+    def _column_height(self, value):
+        return min(self.height, int(round(value * self.height / self._scale)))
+
+    def _draw_column(self, x, value):
+        bar = self._column_height(value)
+        if bar > 0:
+            self._draw.line((x, self.height - bar, x, self.height - 1), fill=0)
+
+    def redraw(self, ring):
+        self._scale = sparkline_scale(ring.max())
+        self._draw.rectangle((0, 0, self.width - 1, self.height - 1), fill=255)
+        values = list(ring.values())[-self.width:]
+        x0 = self.width - len(values)
+        for i, value in enumerate(values):
+            self._draw_column(x0 + i, value)
+
+    def push(self, ring):
+        scale = sparkline_scale(ring.max())
+        if scale != self._scale:
+            self.redraw(ring)
+            return
+        self.image.paste(self.image.crop((1, 0, self.width, self.height)), (0, 0))
+        self._draw.line((self.width - 1, 0, self.width - 1, self.height - 1), fill=255)
+        self._draw_column(self.width - 1, ring.latest())
+
+
+class InterfaceThroughput:
+    def __init__(
+        self,
+        ifname,
+        capacity,
+        net_dir="/sys/class/net",
+        history=None,
+        history_window=0.0,
+        wall_clock=time.time,
+    ):
+        self.ifname = ifname
+        self._wall_clock = wall_clock
+        stats = os.path.join(net_dir, ifname, "statistics")
+        self._rx = open_optional(os.path.join(stats, "rx_bytes"), 32)
+        self._tx = open_optional(os.path.join(stats, "tx_bytes"), 32)
+        if self._rx is None or self._tx is None:
+            self.close()
+            raise OSError(f"no statistics for {ifname}")
+        self.rx_rate = RingBuffer(capacity)
+        self.tx_rate = RingBuffer(capacity)
+        self.total_rate = RingBuffer(capacity)
+        self.sparkline = Sparkline()
+        self._last = None
+
+        self._rx_history = None
+        self._tx_history = None
+        if history is not None:
+            self._rx_history = history.series(f"net.{ifname}.rx")
+            self._tx_history = history.series(f"net.{ifname}.tx")
+            self._restore(wall_clock() - history_window)
+
+    def _restore(self, since):
+        # The two series are stored separately and need not hold the same
+        # samples (a failed append, a file kept in memory only), so each is
+        # restored on its own and the total is matched up by timestamp.
+        rx_records = list(self._rx_history.records(since))
+        tx_records = list(self._tx_history.records(since))
+        for _, rx_rate in rx_records:
+            self.rx_rate.append(rx_rate)
+        for _, tx_rate in tx_records:
+            self.tx_rate.append(tx_rate)
+        rx_by_time = dict(rx_records)
+        tx_by_time = dict(tx_records)
+        for timestamp in sorted(rx_by_time.keys() | tx_by_time.keys()):
+            self.total_rate.append(rx_by_time.get(timestamp, 0.0) + tx_by_time.get(timestamp, 0.0))
+        if self.total_rate.count:
+            self.sparkline.redraw(self.total_rate)
+
+    def _read_counter(self, reader):
+        buf, length = reader.read()
+        return int(buf[:length])
+
+    def sample(self, now_mono):
+        rx = self._read_counter(self._rx)
+        tx = self._read_counter(self._tx)
+        last = self._last
+        self._last = (now_mono, rx, tx)
+        if last is None or now_mono <= last[0]:
+            return False
+
+        elapsed = now_mono - last[0]
+        rx_rate = max(0, rx - last[1]) / elapsed
+        tx_rate = max(0, tx - last[2]) / elapsed
+        self.rx_rate.append(rx_rate)
+        self.tx_rate.append(tx_rate)
+        self.total_rate.append(rx_rate + tx_rate)
+        self.sparkline.push(self.total_rate)
+        if self._rx_history is not None:
+            now_wall = self._wall_clock()
+            self._rx_history.append(now_wall, rx_rate)
+            self._tx_history.append(now_wall, tx_rate)
+        return True
+
+    def close(self):
+        for reader in (self._rx, self._tx):
+            if reader is not None:
+                reader.close()
+
+
+class ThroughputMonitor:
+    def __init__(
+        self,
+        select,
+        capacity=SPARKLINE_WIDTH,
+        rescan_seconds=60.0,
+        net_dir="/sys/class/net",
+        history=None,
+        history_window=0.0,
+        wall_clock=time.time,
+    ):
+        self._select = select
+        self._wall_clock = wall_clock
+        self._history = history
+        self._history_window = history_window
+        self._capacity = capacity
+        self._rescan_seconds = rescan_seconds
+        self._net_dir = net_dir
+        self._next_rescan_at = 0.0
+        self.interfaces = {}
+
+    def _rescan(self):
+        try:
+            names = sorted(name for name in os.listdir(self._net_dir) if self._select(name))
+        except OSError:
+            names = []
+
+        for ifname in list(self.interfaces):
+            if ifname not in names:
+                self.interfaces.pop(ifname).close()
+        for ifname in names:
+            if ifname not in self.interfaces:
+                try:
+                    self.interfaces[ifname] = InterfaceThroughput(
+                        ifname,
+                        self._capacity,
+                        self._net_dir,
+                        history=self._history,
+                        history_window=self._history_window,
+                        wall_clock=self._wall_clock,
+                    )
+                except OSError:
+                    continue
+        self.interfaces = dict(sorted(self.interfaces.items()))
+
+    def sample(self, now_mono):
+        if now_mono >= self._next_rescan_at:
+            self._rescan()
+            self._next_rescan_at = now_mono + self._rescan_seconds
+        for ifname, stats in list(self.interfaces.items()):
+            try:
+                stats.sample(now_mono)
+            except (OSError, ValueError):
+                self.interfaces.pop(ifname).close()
+
+    def items(self):
+        return list(self.interfaces.values())
+
+    def close(self):
+        for stats in self.interfaces.values():
+            stats.close()
+        self.interfaces = {}
+
+
+def format_rate(rate):
+    for unit in ("B", "k", "M"):
+        if rate < 1000.0:
+            return f"{rate:.0f}{unit}" if unit == "B" or rate >= 100.0 else f"{rate:.1f}{unit}"
+        rate /= 1000.0
+    return f"{rate:.1f}G"
@@ -0,0 +1,128 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 16384
+
+_RING = None
+
+
+class TraceRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._events = [None] * capacity
+        self._head = 0
+        self.count = 0
+
+    def record(self, name, start_ns, end_ns):
+        self._events[self._head] = (name, start_ns, end_ns, threading.get_native_id())
+        self._head = (self._head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def events(self):
+        start = (self._head - self.count) % self.capacity
+        return [self._events[(start + i) % self.capacity] for i in range(self.count)]
+
+
+class _Span:
+    __slots__ = ("name", "start_ns")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_):
+        ring = _RING
+        if ring is not None:
+            ring.record(self.name, self.start_ns, time.perf_counter_ns())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(capacity=DEFAULT_CAPACITY):
+    global _RING
+    _RING = TraceRing(capacity)
+
+
+def enabled():
+    return _RING is not None
+
+
+def span(name):
+    # Disabled tracing costs one global lookup and a shared no-op object.
+    if _RING is None:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def wrap(obj, attribute, name):
+    # Only used once tracing is on, so untraced runs keep the plain callables.
+    function = getattr(obj, attribute, None)
+    if function is None:
+        return
+
+    @functools.wraps(function)
+    def traced(*args, **kwargs):
+        start_ns = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            ring = _RING
+            if ring is not None:
+                ring.record(name, start_ns, time.perf_counter_ns())
+
+    setattr(obj, attribute, traced)
+
+
+def chrome_trace(events):
+    pid = os.getpid()
+    trace_events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "infoink"}}]
+    for name, start_ns, end_ns, tid in events:
+        trace_events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "pid": pid,
+                "tid": tid,
+                "ts": start_ns / 1000,
+                "dur": (end_ns - start_ns) / 1000,
+            }
+        )
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def dump(path):
+    if _RING is None:
+        return False
+    events = _RING.events()
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(chrome_trace(events), handle, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        LOGGER.warning("Writing trace to %s failed: %s", path, exc)
+        return False
+    LOGGER.info("Wrote %d trace spans to %s", len(events), path)
+    return True
@@ -0,0 +1,163 @@
+import array
+import glob
+import os
+
+CPU_FIELDS = 8
+IDLE_FIELDS = (3, 4)
+
+
+class ProcFile:
+    def __init__(self, path, size=4096):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        self._buf = bytearray(size)
+
+    def read(self):
+        # pread at offset 0 regenerates /proc and /sys contents without reopening.
+        length = os.preadv(self._fd, [self._buf], 0)
+        return self._buf, length
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_optional(path, size=4096):
+    try:
+        return ProcFile(path, size)
+    except OSError:
+        return None
+
+
+def find_thermal_zone(base="/sys/class/thermal"):
+    zones = sorted(glob.glob(os.path.join(base, "thermal_zone*")))
+    for zone in zones:
+        try:
+            with open(os.path.join(zone, "type"), encoding="ascii") as handle:
+                zone_type = handle.read().strip().lower()
+        except OSError:
+            continue
+        if "cpu" in zone_type or "soc" in zone_type:
+            return os.path.join(zone, "temp")
+    return os.path.join(zones[0], "temp") if zones else ""
+
+
+class SystemVitals:
+    def __init__(self, proc="/proc", thermal_path=None):
+        self._stat = ProcFile(os.path.join(proc, "stat"), 1024)
+        self._loadavg = ProcFile(os.path.join(proc, "loadavg"), 128)
+        self._meminfo = ProcFile(os.path.join(proc, "meminfo"), 512)
+        self._uptime = ProcFile(os.path.join(proc, "uptime"), 64)
+        thermal_path = find_thermal_zone() if thermal_path is None else thermal_path
+        self._thermal = open_optional(thermal_path, 32) if thermal_path else None
+
+        self._cpu_prev = array.array("Q", bytes(8 * CPU_FIELDS))
+        self._cpu_cur = array.array("Q", bytes(8 * CPU_FIELDS))
+        self._cpu_valid = False
+        self._read_cpu(self._cpu_prev)
+
+    def _read_cpu(self, out):
+        buf, length = self._stat.read()
+        end = buf.find(b"\n", 0, length)
+        fields = buf[:end if end >= 0 else length].split()
+        for i in range(CPU_FIELDS):
+            out[i] = int(fields[i + 1]) if i + 1 < len(fields) else 0
+
+    def cpu_percent(self):
+        cur = self._cpu_cur
+        prev = self._cpu_prev
+        self._read_cpu(cur)
+        total = 0
+        idle = 0
+        for i in range(CPU_FIELDS):
+            delta = cur[i] - prev[i]
+            total += delta
+            if i in IDLE_FIELDS:
+                idle += delta
+        self._cpu_prev, self._cpu_cur = cur, prev
+        if total <= 0:
+            return None
+        return 100.0 * (total - idle) / total
+
+    def load_average(self):
+        buf, length = self._loadavg.read()
+        fields = buf[:length].split(None, 3)
+        return float(fields[0]), float(fields[1]), float(fields[2])
+
+    def memory_kib(self):
+        buf, length = self._meminfo.read()
+        total = available = None
+        start = 0
+        while start < length and (total is None or available is None):
+            end = buf.find(b"\n", start, length)
+            if end < 0:
+                end = length
+            if buf.startswith(b"MemTotal:", start):
+                total = int(buf[start + 9:end].split()[0])
+            elif buf.startswith(b"MemAvailable:", start):
+                available = int(buf[start + 13:end].split()[0])
+            start = end + 1
+        return total, available
+
+    def temperature_c(self):
+        if self._thermal is None:
+            return None
+        try:
+            buf, length = self._thermal.read()
+            # Some drivers return an empty read or an error string while the
+            # sensor is unavailable.
+            return int(buf[:length]) / 1000.0
+        except (OSError, ValueError):
+            return None
+
+    def uptime_seconds(self):
+        buf, length = self._uptime.read()
+        return float(buf[:length].split(None, 1)[0])
+
+    def sample(self):
+        total, available = self.memory_kib()
+        return {
+            "cpu_percent": self.cpu_percent(),
+            "load": self.load_average(),
+            "mem_total_kib": total,
+            "mem_available_kib": available,
+            "temperature_c": self.temperature_c(),
+            "uptime_seconds": self.uptime_seconds(),
+        }
+
+    def close(self):
+        for reader in (self._stat, self._loadavg, self._meminfo, self._uptime, self._thermal):
+            if reader is not None:
+                reader.close()
+
+
+def format_uptime(seconds):
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours:02d}:{minutes:02d}"
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def format_vitals(sample):
+    cpu = sample["cpu_percent"]
+    load1, load5, load15 = sample["load"]
+    rows = [
+        f"CPU: {cpu:.0f}%" if cpu is not None else "CPU: --",
+        f"Load: {load1:.2f} {load5:.2f} {load15:.2f}",
+    ]
+
+    total = sample["mem_total_kib"]
+    available = sample["mem_available_kib"]
+    if total and available is not None:
+        used = total - available
+        rows.append(f"Mem: {used // 1024}/{total // 1024} MB ({100 * used // total}%)")
+    else:
+        rows.append("Mem: n/a")
+
+    temp = sample["temperature_c"]
+    rows.append(f"Temp: {temp:.1f} C" if temp is not None else "Temp: n/a")
+    rows.append(f"Up: {format_uptime(sample['uptime_seconds'])}")
+    return rows